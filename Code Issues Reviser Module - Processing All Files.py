@@ -1,177 +1,195 @@
-import openai
-import tkinter as tk
-from tkinter import filedialog
+import argparse
 import csv
+import json
 import os
+import sys
+import openai
+from llm_cache import ResponseCache
+from llm_backends import BACKENDS, DEFAULT_TIMEOUT, create_backend
+from project_reviser import revise_project, plan_project_jobs
+from run_manifest import RunManifest, MANIFEST_FILE_NAME
+from rate_limiter import RetryPolicy, DeadLetterList, DEAD_LETTER_FILE_NAME
+from batch_submission import create_batch_client, DEFAULT_POLL_INTERVAL
+
+# Command-line entry point for revising every file listed in a SonarQube issues CSV.
+# Nothing runs on import; see `python "Code Issues Reviser Module - Processing All Files.py" --help` for the options.
+# The settings below are the defaults of the command-line options.
+
+# OpenAI API key used when the OPENAI_API_KEY environment variable is not set
+OPENAI_API_KEY = 'your-openai-api-key'  # Insert your OpenAI API key here
+
+# Example for changing the model to GPT-4o
+MODEL = "gpt-3.5-turbo"  # Change this to gpt-4o for more advanced capabilities
+# Alternatively, you could use other models as well:
+# MODEL = "gpt-3.5-turbo-1106" for a different variant of GPT-3.5, if needed.
+
+# Models tried after MODEL when a file does not fit its context window; files that fit none are split into chunks
+FALLBACK_MODELS = ["gpt-4o-mini"]
+
+# Revision engine settings (match these to the rate limits of your OpenAI account)
+MAX_IN_FLIGHT = 8             # Maximum number of files revised at the same time
+REQUESTS_PER_MINUTE = 500     # Requests-per-minute budget
+TOKENS_PER_MINUTE = 200000    # Tokens-per-minute budget (both budgets also follow the rate-limit headers of the API)
+MAX_ATTEMPTS = 5              # Attempts per request before a rate-limited, timed-out or failed call is given up
+
+# Define the source directory to remove from the file path (e.g., the location of your original project)
+# Example: to_remove = r"C:\Users\100909323\Desktop\open-instruct-main"
+to_remove = r"Please enter your project location here"  # Replace with the path where your original project files are located
+
+# Define the destination directory where the revised files will be saved
+# Example: to_add = r"C:\Users\100909323\Desktop\open-instruct-main.Revised"
+to_add = r"Please specify the destination for the revised files here. ( Make sure .Revised is added to the address of the to_remove above) "  # Replace with the path where you want the revised files to be saved
+
+# Batch mode: submit every prompt through the Batch API at a lower price and poll for the results (for overnight runs)
+BATCH = False
+POLL_INTERVAL = DEFAULT_POLL_INTERVAL  # Seconds between two checks of the submitted batches
+
+# Write the revised files, ask the model only for a diff of its changes and apply it, or only show what would be sent
+OUTPUT_MODES = ['files', 'patch', 'dry-run']
+
+# Function to report each revised file as soon as it is saved
+def on_file_saved(file_location, output_file_path, error):
+    if error is not None:
+        print(f"Failed to revise {file_location}: {error}")
+    else:
+        print(f"Response saved to {output_file_path}")
 
-# Set up the OpenAI API key
-openai.api_key = 'your-openai-api-key'  # Insert your OpenAI API key here
-
-# Global variables to store code and bug details
-original_code = ""
-prompt = ""
-file_location = ""
-file_name = ""
-
-# Function to read the contents of a file
-def read_file_contents(file_path):
-    # Reads the contents of the provided file path and stores it in the global variable `original_code`.
-    global original_code
-    with open(file_path, 'r') as file:
-        original_code = file.read()
-
-# Function to process each line of the CSV file
-def process_csv_lines(lines):
-    # Processes each line of the CSV to collect bug details and generate the prompt for the AI model.
-    # It also handles the file reading and bug issue extraction from the CSV.
-
-    global prompt, file_location, file_name
-    last_file_location = None
-    bug_details = []
-    
-    # Loop through each line in the CSV file
-    for line in lines:
-        current_file_location = line.get('file_Location')
-        
-        # Check if we need to read a new file based on file location changes
-        if current_file_location != last_file_location and last_file_location is not None:
-            if os.path.exists(last_file_location):
-                # Read the contents of the last file location
-                read_file_contents(last_file_location)
-                
-                # Prepare the bug details for the prompt
-                all_bugs = "\n".join([f"\nCode issue {i+1} detected by SonarQube is on line {bug[0]}, Description of how to solve the code issue is:{bug[1]}" for i, bug in enumerate(bug_details)])
-                
-                # Formulate the AI prompt with the original code and bug details
-                prompt = (
-                    f"""Please fix the issues and send back the corrected code without any additional details or descriptions.
-                    Ensure that the edited parts are included in the complete code, and all the original lines of code are preserved.
-                    The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.
-                    Here is the original code:
-
-                    {original_code}
-
-                    The code issues detected by SonarQube are:
-                    {all_bugs}
-
-                    If the same code issue is present on other lines, please fix those as well.
-                    Resolve this bug based on the SonarQube database, and send the corrected code back to me as specified.
-                    Ensure the code format matches the original code file.
-                    Please only send the code file itself, without any additional details or descriptions (such as the file type or other information).
-                    """
-                )
-                print(prompt)  # For debugging purposes
-                
-                # Call the main function to send the prompt to the AI for resolution
-                main() 
-            
-            bug_details = []  # Reset the bug details for the new file
-            
-        # Update the file location and bug details
-        file_location = current_file_location
-        file_name = line.get('file_name')
-        bug_line = line.get('line')
-        bug_message = line.get('message')
-        bug_details.append((bug_line, bug_message))  # Add the bug details to the list
-        
-        last_file_location = file_location  # Update the last file location
-
-    # If file location exists, process the remaining bugs
-    if file_location and os.path.exists(file_location):
-        read_file_contents(file_location)  # Read the last file
-        all_bugs = "\n".join([f"\nCode issue {i+1} detected by SonarQube is on line {bug[0]}, Description of how to solve the code issue is:{bug[1]}" for i, bug in enumerate(bug_details)])
-        
-        # Generate the prompt with the remaining bugs
-        prompt = (
-            f"""Please fix the issues and send back the corrected code without any additional details or descriptions.
-            Ensure that the edited parts are included in the complete code, and all the original lines of code are preserved.
-            The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.
-            Here is the original code:
-
-            {original_code}
-
-            The code issues detected by SonarQube are:
-            {all_bugs}
-
-            If the same code issue is present on other lines, please fix those as well.
-            Resolve this bug based on the SonarQube database, and send the corrected code back to me as specified.
-            Ensure the code format matches the original code file.
-            Please only send the code file itself, without any additional details or descriptions (such as the file type or other information).
-            """
-        )
-    # Call the main function to send the prompt to the AI for resolution
-    main()
-
-# Function to open and process the CSV file
-def open_files_from_csv(csv_file):
-    # Opens and processes the CSV file to extract bug information and generate the AI prompt.
+# Function to read the lines of the CSV file
+def read_csv_lines(csv_file):
     with open(csv_file, 'r') as file:
-        csv_reader = csv.DictReader(file)  # Read CSV as a dictionary
-        lines = list(csv_reader)  # Convert CSV rows to a list of dictionaries
-        process_csv_lines(lines)  # Process the CSV data
+        return list(csv.DictReader(file))  # Convert CSV rows to a list of dictionaries
 
-# Function to open a file chooser dialog for selecting a CSV file
-def open_csv_with_chooser():
-    # Opens a file dialog to allow the user to select a CSV file.
+# Function to open a file chooser dialog for selecting a CSV file (only when no CSV file is given on the command line)
+def choose_csv_file():
+    # tkinter is imported here, so the script runs without it (and without a display) when a CSV file is given
+    import tkinter as tk
+    from tkinter import filedialog
     root = tk.Tk()  # Create a root window
     root.withdraw()  # Hide the root window
-    file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")])  # Open file chooser dialog
-    if file_path:
-        open_files_from_csv(file_path)  # Process the selected CSV file
-
-# Function to save the AI response to a file
-def save_response_to_file(content, file_location):
-    # Saves the AI-generated response to a file in a revised directory.
-    global file_name
-    # Define the source directory to remove from the file path (e.g., the location of your original project)
-    # Example: to_remove = r"C:\Users\100909323\Desktop\open-instruct-main"
-    to_remove = r"Please enter your project location here"  # Replace with the path where your original project files are located
-
-    # Define the destination directory where the revised files will be saved
-    # Example: to_add = r"C:\Users\100909323\Desktop\open-instruct-main.Revised"
-    to_add = r"Please specify the destination for the revised files here. ( Make sure .Revised is added to the address of the to_remove in line 128) "  # Replace with the path where you want the revised files to be saved
-
-    # Adjust the file path for saving the revised file
-    Revised_location = to_add + file_location[len(to_remove):]
-    
-    # Prepend "Revised." to the file name
-    revised_file_name = f"Revised.{file_name}"
-    output_file_path = os.path.join(Revised_location, revised_file_name)
-    
+    return filedialog.askopenfilename(filetypes=[("CSV files", "*.csv")]) or None  # Open file chooser dialog
+
+# Function to find the CSV file of the last run from its manifest
+def last_run_csv_file(revised_root):
+    manifest_path = os.path.join(revised_root, MANIFEST_FILE_NAME)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, 'r', encoding='utf-8') as file:
+        return json.loads(file.readline())['run'].get('csv_path')
+
+# Function to show the requests a run would send, without calling the API
+def print_plan(lines, models):
+    jobs, _ = plan_project_jobs(lines, models)
+    for job in jobs:
+        chunk = f" (chunk {job['chunk_index'] + 1} of {job['chunk_count']})" if job['chunk_count'] > 1 else ""
+        print(f"{job['file_location']}{chunk}: {job['model']}, about {job['estimated_tokens']} tokens")
+    print(f"{len({job['file_location'] for job in jobs})} files, {len(jobs)} requests, "
+          f"about {sum(job['estimated_tokens'] for job in jobs)} tokens")
+    return {'files': len({job['file_location'] for job in jobs}), 'requests': len(jobs), 'failed': 0}
+
+# Function to revise every file listed in the CSV file
+def run(csv_file, source_root, revised_root, model=MODEL, fallback_models=FALLBACK_MODELS, max_in_flight=MAX_IN_FLIGHT,
+        requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE, output_mode='files',
+        resume=False, use_cache=True, backend=None, max_attempts=MAX_ATTEMPTS, batch=BATCH, poll_interval=POLL_INTERVAL):
+    lines = read_csv_lines(csv_file)
+    models = [model] + [fallback for fallback in fallback_models if fallback != model]
+    if output_mode == 'dry-run':
+        return print_plan(lines, models)
+
+    # The run is checkpointed in a manifest next to the revised files, so it can be resumed with `--resume`;
+    # requests that still fail after every retry are also logged to a dead-letter file next to it
+    response_cache = ResponseCache() if use_cache else None
+    manifest = RunManifest(os.path.join(revised_root, MANIFEST_FILE_NAME), {'csv_path': os.path.abspath(csv_file)}, resume)
+    dead_letters = DeadLetterList(os.path.join(revised_root, DEAD_LETTER_FILE_NAME))
     try:
-        # Create directories as necessary and save the content to the output file
-        os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
-        with open(output_file_path, 'w') as output_file:
-            output_file.write(content)
-        print(f"Response saved to {output_file_path}")
-    except Exception as e:
-        print(f"Failed to save the file: {e}")
-
-# Main function to interact with OpenAI and generate the revised code
-def main():
-    global prompt, file_location
-    # Send the prompt to OpenAI's Chat API and get the response
-    completion = openai.ChatCompletion.create(
-    # Example for changing the model to GPT-4o
-    model="gpt-3.5-turbo",  # Change this to gpt-4o for more advanced capabilities
-    # Alternatively, you could use other models as well:
-    # model="gpt-3.5-turbo-1106" for a different variant of GPT-3.5, if needed.
-        temperature=0.0,
-        messages=[
-            {
-                "role": "system",
-                "content": "You are a code developer and code assistant. Ensure that in output you should just generate the revised code without additional texts. DO NOT ADD ``` that shows the type of file language at the beginning of the file."
-            },
-            {"role": "user", "content": prompt}
-        ]
-    )
-    # Extract the generated content from the response
-    generated_content = completion.choices[0].message.content
-    
-    # Save the generated content to the appropriate file location
-    if file_location:
-        directory = os.path.dirname(file_location)
-        save_response_to_file(generated_content, directory)
-
-# Function to start the process of choosing and opening a CSV file
-open_csv_with_chooser()
+        # Send all prompts to OpenAI's Chat API with a bounded number of requests in flight (see `project_reviser.py`)
+        summary = revise_project(
+            lines,
+            source_root,
+            revised_root,
+            model=model,
+            candidate_models=models,
+            max_in_flight=max_in_flight,
+            requests_per_minute=requests_per_minute,
+            tokens_per_minute=tokens_per_minute,
+            cache=response_cache,
+            on_saved=on_file_saved,
+            manifest=manifest,
+            backend=backend,
+            retry_policy=RetryPolicy(max_attempts),
+            dead_letters=dead_letters,
+            output_format='patch' if output_mode == 'patch' else 'file',
+            batch_client=create_batch_client(backend, revised_root) if batch else None,
+            poll_interval=poll_interval
+        )
+    finally:
+        manifest.close()
+    print(f"Skipped {summary['skipped']} files completed in an earlier attempt")
+    print(f"Completed {summary['completed']} requests ({summary['cached']} from cache, {summary['retries']} retries, {summary['continuations']} continuations), "
+          f"{summary['failed']} failed")
+    if len(dead_letters):
+        print(f"Gave up on {len(dead_letters)} requests, see {dead_letters.path} (run again with --resume to retry them)")
+    if response_cache is not None:
+        print(f"Response cache: {response_cache.stats()}")
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Revise every file listed in a SonarQube issues CSV.")
+    parser.add_argument('csv_file', nargs='?',
+                        help="Issues CSV exported by WALL (a file chooser opens when it is left out and a display is available)")
+    parser.add_argument('--source-root', default=to_remove, help="Location of the original project files")
+    parser.add_argument('--revised-root', default=to_add, help="Location where the revised files are saved")
+    parser.add_argument('--model', default=MODEL, help="Preferred GPT model")
+    parser.add_argument('--fallback-models', nargs='*', default=FALLBACK_MODELS,
+                        help="Models tried in order when a file does not fit the preferred model")
+    parser.add_argument('--max-in-flight', type=int, default=MAX_IN_FLIGHT, help="Maximum number of requests at the same time")
+    parser.add_argument('--requests-per-minute', type=int, default=REQUESTS_PER_MINUTE, help="Requests-per-minute budget (0 disables it)")
+    parser.add_argument('--tokens-per-minute', type=int, default=TOKENS_PER_MINUTE, help="Tokens-per-minute budget (0 disables it)")
+    parser.add_argument('--max-attempts', type=int, default=MAX_ATTEMPTS,
+                        help="Attempts per request before giving up on rate limits, timeouts and server errors")
+    parser.add_argument('--backend', choices=list(BACKENDS), default='openai',
+                        help="Completion backend: the OpenAI API, an OpenAI-compatible server, or an offline mock")
+    parser.add_argument('--api-base', help="Base URL of the API, e.g. http://localhost:8000/v1 for a local server")
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help="Seconds to wait for a completion")
+    parser.add_argument('--output-mode', choices=OUTPUT_MODES, default='files',
+                        help="'files' saves the revised files; 'patch' asks only for a diff of the changes and applies it "
+                             "(much less output on large files); 'dry-run' only lists the requests that would be sent")
+    parser.add_argument('--batch', action='store_true', default=BATCH,
+                        help="Submit all prompts through the Batch API and wait for the results (the mock and "
+                             "openai-compatible backends use a local stand-in)")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL, help="Seconds between two checks of the batches")
+    parser.add_argument('--resume', action='store_true', help="Resume the last run, skipping the files it already completed")
+    parser.add_argument('--no-cache', action='store_true', help="Do not use the on-disk response cache")
+    return parser.parse_args(argv)
+
+# Main function: returns the exit status (1 when any file failed), so scheduled runs can detect failures
+def main(argv=None):
+    args = parse_args(argv)
+    openai.api_key = os.environ.get('OPENAI_API_KEY') or OPENAI_API_KEY
+
+    # Step 1: Find the CSV file: given on the command line, taken from the run being resumed, or chosen in a dialog
+    csv_file = args.csv_file
+    if csv_file is None and args.resume:
+        csv_file = last_run_csv_file(args.revised_root)
+        if csv_file is None:
+            print(f"No run to resume in {args.revised_root}", file=sys.stderr)
+            return 2
+        print(f"Resuming the run of {csv_file}")
+    if csv_file is None:
+        try:
+            csv_file = choose_csv_file()
+        except Exception as e:
+            print(f"No CSV file given and no file chooser available ({e})", file=sys.stderr)
+            return 2
+        if csv_file is None:
+            return 2
+
+    # Step 2: Revise the files (the connection pool is sized for the number of requests in flight)
+    backend = create_backend(args.backend, args.api_base, os.environ.get('OPENAI_API_KEY') or OPENAI_API_KEY,
+                             args.timeout, args.max_in_flight)
+    summary = run(csv_file, args.source_root, args.revised_root, args.model, args.fallback_models, args.max_in_flight,
+                  args.requests_per_minute, args.tokens_per_minute, args.output_mode, args.resume, not args.no_cache,
+                  backend, args.max_attempts, args.batch, args.poll_interval)
+    return 1 if summary['failed'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
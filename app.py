@@ -1,13 +1,40 @@
-from flask import Flask, render_template, request, redirect, url_for
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response, stream_with_context
 import os
 import csv
 import base64
+import heapq
+import tempfile
 import openai
-import difflib
+import html
+import json
 import requests
+import secrets
+import time
+from datetime import datetime, timedelta
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 from sklearn.metrics import precision_score, recall_score, f1_score
-from nltk.translate.bleu_score import sentence_bleu
-from rouge_score import rouge_scorer
+from llm_cache import ResponseCache, completion_cache_key
+from llm_backends import create_backend_from_env, cache_scope
+from token_budget import count_tokens
+from issue_windows import DEFAULT_CONTEXT_LINES, build_issue_windows, format_issue_windows, splice_window_response
+from issue_store import (open_issue_store, get_last_sync, set_last_sync, replace_issues, apply_issue_changes,
+                         iter_stored_issues, iter_stored_update_dates)
+from session_store import SessionStore, load_or_create_secret_key
+from job_queue import JobQueue, start_workers
+from project_reviser import revise_project
+from run_manifest import RunManifest, MANIFEST_FILE_NAME
+from rate_limiter import (RateLimiter, RetryPolicy, DeadLetterList, DEAD_LETTER_FILE_NAME, call_with_retries,
+                          handle_failure)
+from revision_engine import estimate_tokens
+from continuation import complete_with_continuation, stream_with_continuation, TruncatedCompletion
+from patch_edits import PATCH_INSTRUCTIONS, apply_patch
+from metrics_engine import score_pair
+from diff_engines import DIFF_ALGORITHMS, DEFAULT_DIFF_ALGORITHM
+from diff_cache import ComparisonCache, comparison_key, COMPARISON_CACHE_DIRECTORY_NAME
+from comparison_report import (comparison_pairs, revised_comparison_path, read_text, diff_texts, load_report,
+                               load_or_build_report, report_page, REPORT_DIRECTORY_NAME, METRIC_KEYS, DEFAULT_PAGE_SIZE)
 
 app = Flask(__name__)
 
@@ -15,63 +42,318 @@ app = Flask(__name__)
 UPLOAD_FOLDER = 'uploads'
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
-csv_lines = []
-current_line_index = 0
-
-# Global variables for managing user preferences and state
-csv_lines = []
-current_line_index = 0
-current_font_size = 14
-original_code_color = "#000000"
-background_color = "#FFFFFF"
-selected_font = "Courier"
+# Local SQLite store used for incremental SonarQube syncs
+ISSUE_STORE_PATH = os.path.join(UPLOAD_FOLDER, 'issues.sqlite3')
+# On-disk cache of API responses (shared with the batch script)
+response_cache = ResponseCache()
+# Completion backend (OpenAI by default; see `create_backend_from_env` for the environment variables)
+llm_backend = create_backend_from_env()
+
+# Default user preferences and state; each reviewer's own copy lives in the shared session store,
+# so the app can run under several worker processes
+DEFAULT_SESSION_STATE = {
+    'issue_set_id': None,  # Uploaded CSV, see `SessionStore.save_issue_set`
+    'current_line_index': 0,
+    'font_size': 14,
+    'code_color': "#000000",
+    'bg_color': "#FFFFFF",
+    'font': "Courier",
+    'prompt_mode': "file",  # "file" sends the whole file, "window" only the regions around the reported lines,
+                            # "patch" the whole file but only asks for a unified diff of the changes
+    'context_lines': DEFAULT_CONTEXT_LINES,
+    'diff_algorithm': DEFAULT_DIFF_ALGORITHM,  # Diff engine of the Code Comparer, see `diff_engines.py`
+    'api_model': 'gpt-4o',  # Model last selected on the reviser page (the first one offered by default)
+}
+SESSION_STORE_PATH = os.path.join(UPLOAD_FOLDER, 'sessions.sqlite3')
+session_store = SessionStore(SESSION_STORE_PATH, DEFAULT_SESSION_STATE)
+# Session cookies must be signed with the same key by every worker
+app.secret_key = os.environ.get('WALL_SECRET_KEY') or load_or_create_secret_key(os.path.join(UPLOAD_FOLDER, 'secret_key'))
 output_directory = ""
 
-### Function Definitions ###
-
-def get_all_issues(sonar_url, api_token, project_key):
-    page_size = 500  # Number of issues per page
-    page_number = 1  # Starting page number
-    all_issues = []  # List to store all retrieved issues
-
-    while True:
-        # Construct the API endpoint and query parameters
-        url = f"{sonar_url}/api/issues/search"
-        params = {
-            'componentKeys': project_key,  # Filter issues by project key
-            'resolved': 'false',           # Only fetch unresolved issues
-            'ps': page_size,               # Number of issues per page
-            'p': page_number               # Current page number
-        }
+# Background jobs: ingestion and revisions run in worker processes, requests only submit them and poll their status
+JOB_QUEUE_PATH = os.path.join(UPLOAD_FOLDER, 'jobs.sqlite3')
+JOB_WORKERS = 2  # Number of worker processes started with the app
+job_queue = JobQueue(JOB_QUEUE_PATH)
+
+# Single-file revisions from the Code Issue Reviser page
+REVISER_SYSTEM_MESSAGE = "You are a code developer assistant."
+REVISER_MAX_TOKENS = 1600  # Per request; answers cut off at this length are continued (see `continuation.py`)
+REVISER_MODELS = ['gpt-4o', 'gpt-4o-mini', 'gpt-3.5-turbo']  # Models offered on the reviser page
+
+# Rate limits shared by every revision of a worker process; both budgets also follow the rate-limit headers of the API.
+# Calls that are rate limited or time out are retried with backoff, and those that still fail are logged as dead letters.
+REVISER_REQUESTS_PER_MINUTE = 500
+REVISER_TOKENS_PER_MINUTE = 200000
+completion_limiter = RateLimiter(REVISER_REQUESTS_PER_MINUTE, REVISER_TOKENS_PER_MINUTE)
+completion_retry_policy = RetryPolicy()
+revision_dead_letters = DeadLetterList(os.path.join(UPLOAD_FOLDER, DEAD_LETTER_FILE_NAME))
+
+# Project-wide comparison reports of the Code Comparer, cached on disk until any of the compared files changes
+COMPARISON_REPORT_DIRECTORY = os.path.join(UPLOAD_FOLDER, REPORT_DIRECTORY_NAME)
+COMPARISON_REPORT_WORKERS = None  # Worker processes per report (None: one per CPU)
+# Diff HTML and metrics of the files viewed in the Code Comparer, keyed by the contents of both files
+comparison_cache = ComparisonCache(os.path.join(UPLOAD_FOLDER, COMPARISON_CACHE_DIRECTORY_NAME))
+# The Code Comparer page only loads the lines of its code and diff views that are scrolled into view
+COMPARER_BLOCK_LINES = 200  # Lines the page asks for at a time
+COMPARER_MAX_LINES = 2000  # Most lines served by one request
+
+# SonarQube ingestion settings
+SONAR_PAGE_SIZE = 500   # Number of issues per page
+SONAR_MAX_WORKERS = 8   # Maximum number of pages fetched concurrently
+SONAR_RESULT_CAP = 10000  # SonarQube refuses to page beyond this many results per query
+SONAR_PARTITION_FACETS = ['severities', 'rules', 'directories']  # Facets used to split oversized queries, in order
+SONAR_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S%z'  # Format of `creationDate`, `createdAfter` and `createdBefore`
+
+# CSV export settings
+CSV_FIELDNAMES = ['file_Location', 'file_name', 'line', 'message', 'type']
+CSV_SORT_CHUNK_SIZE = 10000  # Rows sorted in memory at once before spilling to a temporary file
 
-        # Encode API token in base64 for basic authentication
-        token = base64.b64encode(f"{api_token}:".encode('utf-8')).decode('utf-8')
-        headers = {
-            'Authorization': f'Basic {token}'  # Add authentication header
-        }
+### Function Definitions ###
 
-        # Make the API request to fetch issues
-        response = requests.get(url, params=params, headers=headers)
-        response.raise_for_status()  # Raise an error for bad responses
-        data = response.json()  # Parse the JSON response
+def create_sonar_session(api_token, max_workers=SONAR_MAX_WORKERS):
+    # Step 1: Encode API token in base64 for basic authentication (once per session, not per page)
+    token = base64.b64encode(f"{api_token}:".encode('utf-8')).decode('utf-8')
+
+    # Step 2: Create one keep-alive session with a connection pool large enough for every worker
+    session = requests.Session()
+    session.headers.update({'Authorization': f'Basic {token}'})
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+def fetch_issues_page(session, sonar_url, params, page_number):
+    # Make the API request to fetch a single page of issues
+    response = session.get(f"{sonar_url}/api/issues/search", params={**params, 'p': page_number})
+    response.raise_for_status()  # Raise an error for bad responses
+    return response.json()  # Parse the JSON response
+
+def fetch_issue_pages(session, sonar_url, pages, max_workers=SONAR_MAX_WORKERS):
+    # Fetch the given (params, page number) pairs concurrently over the shared session
+    # Pages are yielded in order, so callers see the same order as a serial loop, and at most
+    # `max_workers` pages are in flight (and held in memory) at any time
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for params, page_number in pages:
+            pending.append(executor.submit(fetch_issues_page, session, sonar_url, params, page_number))
+            if len(pending) >= max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def get_all_issues(sonar_url, api_token, project_key, max_workers=SONAR_MAX_WORKERS):
+    # Return the complete list of issues
+    return list(iter_all_issues(sonar_url, api_token, project_key, max_workers))
+
+def iter_all_issues(sonar_url, api_token, project_key, max_workers=SONAR_MAX_WORKERS):
+    # Yield issues page by page, so memory stays bounded by the page size rather than the project size
+    page_size = SONAR_PAGE_SIZE  # Number of issues per page
+    params = {
+        'componentKeys': project_key,  # Filter issues by project key
+        'resolved': 'false',           # Only fetch unresolved issues
+        'ps': page_size                # Number of issues per page
+    }
 
-        # Extract issues from the response
+    with create_sonar_session(api_token, max_workers) as session:
+        # Step 1: Fetch the first page, which also tells us how many issues exist in total
+        data = fetch_issues_page(session, sonar_url, params, 1)
         issues = data.get('issues', [])
-        if not issues:
-            break  # Exit the loop if no issues are returned
+        total = data.get('paging', {}).get('total', data.get('total'))
 
-        # Add the current batch of issues to the list
-        all_issues.extend(issues)
+        # SonarQube refuses to page beyond its result cap, so split the query into slices instead
+        if total is not None and total > SONAR_RESULT_CAP:
+            yield from iter_partitioned_issues(session, sonar_url, params, max_workers)
+            return
 
-        # Increment the page number to fetch the next batch
-        page_number += 1
+        yield from issues
 
-        # Stop if the current page has fewer issues than the page size
+        # Stop if the first page already holds every issue
         if len(issues) < page_size:
-            break
-
-    return all_issues  # Return the complete list of issues
+            return
+
+        # Step 2: Work out the number of remaining pages from `paging.total`
+        if total is None:
+            # Older servers without paging information are fetched page by page
+            page_number = 2
+            while True:
+                issues = fetch_issues_page(session, sonar_url, params, page_number).get('issues', [])
+                yield from issues
+                if len(issues) < page_size:
+                    return
+                page_number += 1
+        page_count = -(-total // page_size)
+
+        # Step 3: Fetch the remaining pages concurrently over the shared session
+        pages = fetch_issue_pages(session, sonar_url,
+                                  [(params, page_number) for page_number in range(2, page_count + 1)],
+                                  max_workers)
+        for page in pages:
+            issues = page.get('issues', [])
+            yield from issues
+
+            # Stop at the first short page, exactly like the serial loop
+            if len(issues) < page_size:
+                break
+
+def get_all_issues_partitioned(sonar_url, api_token, project_key, max_workers=SONAR_MAX_WORKERS):
+    # Always split the query into slices below the result cap, whatever the project size
+    params = {
+        'componentKeys': project_key,  # Filter issues by project key
+        'resolved': 'false',           # Only fetch unresolved issues
+        'ps': SONAR_PAGE_SIZE          # Number of issues per page
+    }
+    with create_sonar_session(api_token, max_workers) as session:
+        return list(iter_partitioned_issues(session, sonar_url, params, max_workers))
+
+def probe_issue_slice(session, sonar_url, params, facets=None, sort_ascending=None):
+    # Ask for a single issue to learn the slice size (and optionally its facet counts)
+    probe_params = {**params, 'ps': 1}
+    if facets:
+        probe_params['facets'] = ','.join(facets)
+    if sort_ascending is not None:
+        probe_params['s'] = 'CREATION_DATE'
+        probe_params['asc'] = 'true' if sort_ascending else 'false'
+    data = fetch_issues_page(session, sonar_url, probe_params, 1)
+    total = data.get('paging', {}).get('total', data.get('total', 0))
+    return total, data
+
+def plan_issue_slices(session, sonar_url, params):
+    # Step 1: Probe the slice together with the facets it could still be split by
+    remaining_facets = [facet for facet in SONAR_PARTITION_FACETS if facet not in params]
+    total, data = probe_issue_slice(session, sonar_url, params, remaining_facets)
+    if total == 0:
+        return []
+    if total <= SONAR_RESULT_CAP:
+        return [(params, total)]
+
+    # Step 2: Split by the first facet whose values cover every issue in the slice
+    facet_values = {facet['property']: facet.get('values', []) for facet in data.get('facets', [])}
+    for facet in remaining_facets:
+        values = [value for value in facet_values.get(facet, []) if value.get('count', 0) > 0]
+        if len(values) < 2 or sum(value['count'] for value in values) != total:
+            continue  # Splitting by this facet would either not help or lose issues
+
+        slices = []
+        for value in values:
+            sub_params = {**params, facet: value['val']}
+            if value['count'] <= SONAR_RESULT_CAP:
+                slices.append((sub_params, value['count']))
+            else:
+                slices.extend(plan_issue_slices(session, sonar_url, sub_params))
+        return slices
+
+    # Step 3: No facet helps any more, so fall back to creation-date windows
+    return plan_creation_date_slices(session, sonar_url, params, total)
+
+def plan_creation_date_slices(session, sonar_url, params, total):
+    # Step 1: Find the oldest and newest creation dates in the slice
+    _, oldest = probe_issue_slice(session, sonar_url, params, sort_ascending=True)
+    _, newest = probe_issue_slice(session, sonar_url, params, sort_ascending=False)
+    start = datetime.strptime(oldest['issues'][0]['creationDate'], SONAR_DATE_FORMAT)
+    end = datetime.strptime(newest['issues'][0]['creationDate'], SONAR_DATE_FORMAT) + timedelta(seconds=1)
+
+    # Step 2: Bisect the [start, end) window until each half fits under the cap
+    def split_window(window_start, window_end, window_total):
+        window_params = {**params,
+                         'createdAfter': window_start.strftime(SONAR_DATE_FORMAT),
+                         'createdBefore': window_end.strftime(SONAR_DATE_FORMAT)}
+        if window_total == 0:
+            return []
+        if window_total <= SONAR_RESULT_CAP or window_end - window_start <= timedelta(seconds=1):
+            if window_total > SONAR_RESULT_CAP:
+                print(f"Issue slice still exceeds the result cap and will be truncated: {window_params}")
+            return [(window_params, window_total)]
+
+        middle = window_start + (window_end - window_start) / 2
+        middle = middle.replace(microsecond=0)
+        first_total, _ = probe_issue_slice(session, sonar_url, {
+            **params,
+            'createdAfter': window_start.strftime(SONAR_DATE_FORMAT),
+            'createdBefore': middle.strftime(SONAR_DATE_FORMAT)})
+        return (split_window(window_start, middle, first_total)
+                + split_window(middle, window_end, window_total - first_total))
+
+    return split_window(start, end, total)
+
+def iter_partitioned_issues(session, sonar_url, params, max_workers=SONAR_MAX_WORKERS):
+    # Step 1: Split the query into slices that each fit under the result cap
+    slices = plan_issue_slices(session, sonar_url, params)
+
+    # Step 2: Fetch every page of every slice in parallel
+    page_size = params['ps']
+    pages = [(slice_params, page_number)
+             for slice_params, slice_total in slices
+             for page_number in range(1, min(-(-slice_total // page_size), SONAR_RESULT_CAP // page_size) + 1)]
+
+    # Step 3: Merge the slices, dropping issues that appear in more than one slice
+    # Only the issue keys are remembered, not the issues themselves
+    seen_keys = set()
+    for page in fetch_issue_pages(session, sonar_url, pages, max_workers):
+        for issue in page.get('issues', []):
+            if issue['key'] not in seen_keys:
+                seen_keys.add(issue['key'])
+                yield issue
+
+
+def fetch_changed_issues(sonar_url, api_token, project_key, since, max_workers=SONAR_MAX_WORKERS):
+    # Fetch every issue (resolved or not) updated at or after `since`, newest first
+    # Returns None when the change set is too large to page through, so the caller falls back to a full crawl
+    since_date = datetime.strptime(since, SONAR_DATE_FORMAT)
+    params = {
+        'componentKeys': project_key,  # Filter issues by project key
+        's': 'UPDATE_DATE',            # Sort by last update so the delta comes first
+        'asc': 'false',
+        'ps': SONAR_PAGE_SIZE          # Number of issues per page
+    }
+    changed_issues = []
+
+    with create_sonar_session(api_token, max_workers) as session:
+        for page_number in range(1, SONAR_RESULT_CAP // SONAR_PAGE_SIZE + 1):
+            issues = fetch_issues_page(session, sonar_url, params, page_number).get('issues', [])
+            for issue in issues:
+                # Stop as soon as we reach issues that were already seen by the previous sync
+                if datetime.strptime(issue['updateDate'], SONAR_DATE_FORMAT) < since_date:
+                    return changed_issues
+                changed_issues.append(issue)
+            if len(issues) < SONAR_PAGE_SIZE:
+                return changed_issues
+
+    return None
+
+def newest_update_date(dates, default=None):
+    # Return the most recent of the given `updateDate` values, to be used as the next sync timestamp
+    dates = [date for date in dates if date]
+    if default:
+        dates.append(default)
+    return max(dates, key=lambda date: datetime.strptime(date, SONAR_DATE_FORMAT)) if dates else None
+
+def sync_issues(store_path, sonar_url, api_token, project_key, max_workers=SONAR_MAX_WORKERS):
+    # Sync the local store and then yield its unresolved issues one at a time
+    with closing(open_issue_store(store_path)) as connection:
+        # Step 1: Ask only for the issues changed since the last sync, if there was one
+        last_sync = get_last_sync(connection, sonar_url, project_key)
+        changed_issues = None
+        if last_sync:
+            changed_issues = fetch_changed_issues(sonar_url, api_token, project_key, last_sync, max_workers)
+
+        if changed_issues is None:
+            # Step 2a: First sync (or too many changes), so stream every unresolved issue into the store
+            replace_issues(connection, sonar_url, project_key,
+                           iter_all_issues(sonar_url, api_token, project_key, max_workers), None)
+            # An empty project has no update date yet; the next sync is then a full one again
+            next_sync = newest_update_date(iter_stored_update_dates(connection, sonar_url, project_key), last_sync)
+            if next_sync:
+                with connection:
+                    set_last_sync(connection, sonar_url, project_key, next_sync)
+        else:
+            # Step 2b: Apply the inserts, updates and resolutions as a delta
+            inserted, updated, resolved = apply_issue_changes(
+                connection, sonar_url, project_key, changed_issues,
+                newest_update_date((issue.get('updateDate') for issue in changed_issues), last_sync))
+            print(f"Issue sync for {project_key}: {inserted} new, {updated} updated, {resolved} resolved")
 
+        # Step 3: Yield the up-to-date set of unresolved issues from the local store
+        yield from iter_stored_issues(connection, sonar_url, project_key)
 
 def modify_file_path(original_path, to_remove, to_add):
     # Step 1: Remove the specified prefix if it exists at the start of the path
@@ -88,9 +370,8 @@ def modify_file_path(original_path, to_remove, to_add):
     # Step 5: Convert any remaining backslashes to forward slashes for uniformity
     return os.path.normpath(to_add + modified_path).replace('\\', '/')
 
-def save_csv_file(issues, file_path, to_remove, to_add):
-    # Step 1: Prepare issue data with modified paths and selected fields
-    issue_data = [{
+def issue_to_csv_row(issue, to_remove, to_add):
+    return {
         # Modify the file path and remove/add segments as specified
         'file_Location': modify_file_path(issue['component'], to_remove, to_add),
         # Extract the base file name, optionally prefixed with "Revised."
@@ -102,18 +383,46 @@ def save_csv_file(issues, file_path, to_remove, to_add):
         # Include the issue's message and type
         'message': issue['message'],
         'type': issue['type']
-    } for issue in issues]
-
-    # Step 2: Sort issue data by file location
-    issue_data.sort(key=lambda x: x['file_Location'])
+    }
 
-    # Step 3: Write data to a CSV file
-    with open(file_path, mode='w', newline='', encoding='utf-8') as file:
-        # Define CSV columns and write header row
-        writer = csv.DictWriter(file, fieldnames=['file_Location', 'file_name', 'line', 'message', 'type'])
-        writer.writeheader()
-        # Write each issue's data row
-        writer.writerows(issue_data)
+def save_csv_file(issues, file_path, to_remove, to_add, chunk_size=CSV_SORT_CHUNK_SIZE):
+    # `issues` may be any iterable (e.g. a generator of pages), so at most `chunk_size` rows are held in memory
+    sort_key = lambda x: x['file_Location']
+
+    with tempfile.TemporaryDirectory() as run_directory:
+        # Step 1: Prepare issue data with modified paths and selected fields, one chunk at a time
+        # Step 2: Sort each chunk by file location and spill it to a temporary run file
+        run_paths = []
+        chunk = []
+        rows = (issue_to_csv_row(issue, to_remove, to_add) for issue in issues)
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                run_paths.append(write_sorted_run(chunk, run_directory, len(run_paths), sort_key))
+                chunk = []
+        chunk.sort(key=sort_key)
+
+        # Step 3: Merge the sorted runs (the merge is stable, like a single in-memory sort) and write the CSV file
+        run_files = [open(run_path, newline='', encoding='utf-8') for run_path in run_paths]
+        try:
+            runs = [csv.DictReader(run_file, fieldnames=CSV_FIELDNAMES) for run_file in run_files]
+            with open(file_path, mode='w', newline='', encoding='utf-8') as file:
+                # Define CSV columns and write header row
+                writer = csv.DictWriter(file, fieldnames=CSV_FIELDNAMES)
+                writer.writeheader()
+                # Write each issue's data row
+                writer.writerows(heapq.merge(*runs, chunk, key=sort_key))
+        finally:
+            for run_file in run_files:
+                run_file.close()
+
+def write_sorted_run(chunk, run_directory, run_index, sort_key):
+    # Sort one chunk of rows and write it to a headerless temporary CSV file
+    chunk.sort(key=sort_key)
+    run_path = os.path.join(run_directory, f"run_{run_index}.csv")
+    with open(run_path, mode='w', newline='', encoding='utf-8') as run_file:
+        csv.DictWriter(run_file, fieldnames=CSV_FIELDNAMES).writerows(chunk)
+    return run_path
 
 def read_file_contents(file_path):
     # Step 1: Open the file in read mode
@@ -124,17 +433,52 @@ def read_file_contents(file_path):
         # Step 3 & 4: Enumerate lines and join them with line numbers prefixed
         return ''.join(f"{i + 1}: {line}" for i, line in enumerate(lines))
 
-def generate_prompt(file_location, bug_lines, bug_messages, bug_types):
-    # Step 1: Read the original code from the file
-    original_code = read_file_contents(file_location)
-    
+def prompt_windows(file_location, bug_lines, prompt_mode, context_lines=DEFAULT_CONTEXT_LINES):
+    # Return the lines of the file and the regions to send in "window" mode; the regions are None when the whole file
+    # is sent instead (in the other modes, for an empty file, or when an issue has no line number)
+    if prompt_mode != 'window':
+        return None, None
+    with open(file_location, 'r') as file:
+        lines = file.readlines()
+    return lines, build_issue_windows(len(lines), bug_lines, context_lines)
+
+# Function to get the prompt mode a prompt is actually built in: "window" falls back to "file" when there are no regions,
+# and the response then holds the whole file, which must not be spliced
+def sent_prompt_mode(file_location, bug_lines, prompt_mode, context_lines=DEFAULT_CONTEXT_LINES):
+    if prompt_mode == 'window' and prompt_windows(file_location, bug_lines, prompt_mode, context_lines)[1] is None:
+        return 'file'
+    return prompt_mode
+
+def generate_prompt(file_location, bug_lines, bug_messages, bug_types, prompt_mode='file', context_lines=DEFAULT_CONTEXT_LINES):
+    # Step 1: In "window" mode, send only the regions around the reported lines instead of the whole file
+    lines, windows = prompt_windows(file_location, bug_lines, prompt_mode, context_lines)
+
     # Step 2: Create the initial prompt with general instructions
-    prompt = (
-        f"""Please fix the issues and send back the corrected code without any additional details or descriptions.\n"""
-        f"""Ensure that the edited parts are included in the complete code, and all the original lines of code are preserved.\n"""
-        f"""The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.\n"""
-        f"""Here is the original code:\n\n{original_code}\n"""
-    )
+    if windows:
+        prompt = (
+            f"""Please fix the issues in the code regions below and send back only the corrected regions without any additional details or descriptions.\n"""
+            f"""Each region starts with a header such as "@@ lines 10-30 @@" followed by the numbered original lines of that region.\n"""
+            f"""Send back every region with its original header on its own line, followed by the complete corrected code for those lines without the line numbers.\n"""
+            f"""The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.\n"""
+            f"""Here are the original code regions:\n\n{format_issue_windows(lines, windows)}\n"""
+        )
+    elif prompt_mode == 'patch':
+        # Send the numbered file and ask only for the changes, so the output does not grow with the file
+        original_code = read_file_contents(file_location)
+        prompt = (
+            f"""Please fix the issues and send back your changes as a unified diff without any additional details or descriptions.\n"""
+            f"""The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.\n"""
+            f"""Here is the original code, with line numbers:\n\n{original_code}\n"""
+        )
+    else:
+        # Read the original code from the file
+        original_code = read_file_contents(file_location)
+        prompt = (
+            f"""Please fix the issues and send back the corrected code without any additional details or descriptions.\n"""
+            f"""Ensure that the edited parts are included in the complete code, and all the original lines of code are preserved.\n"""
+            f"""The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.\n"""
+            f"""Here is the original code:\n\n{original_code}\n"""
+        )
 
     # Step 3: Add information about each detected issue
     for bug_line, bug_message, bug_type in zip(bug_lines, bug_messages, bug_types):
@@ -148,8 +492,11 @@ def generate_prompt(file_location, bug_lines, bug_messages, bug_types):
         f"""\nIf the same code issue is present on other lines, please fix those as well.\n"""
         f"""Resolve this bug based on the SonarQube database, and send the corrected code back to me as specified. """
         f"""Ensure the code format matches the original code file.\n"""
-        f"""Please only send the code file itself, without any additional details or descriptions (such as the file type or other information).\n"""
     )
+    if prompt_mode == 'patch':
+        prompt += f"""Please only send the diff itself, without any additional details or descriptions (such as the file type or other information).\n"""
+    else:
+        prompt += f"""Please only send the code file itself, without any additional details or descriptions (such as the file type or other information).\n"""
 
     # Step 5: Add few-shot learning examples for guidance
     prompt += f"""\n\n### Few-Shot Learning Examples ###\n"""
@@ -179,73 +526,302 @@ def generate_prompt(file_location, bug_lines, bug_messages, bug_types):
     )
 
     # Step 6: Conclude with a reminder of the expected format
-    prompt += (
-        f"""\n### End of Examples ###\n"""
-        f"""Please follow the examples provided and send back only the corrected code sections. """
-        f"""Ensure the format matches the original code file without extra descriptions or details.\n"""
-    )
+    if prompt_mode == 'patch':
+        prompt += f"""\n### End of Examples ###\n{PATCH_INSTRUCTIONS}"""
+    else:
+        prompt += (
+            f"""\n### End of Examples ###\n"""
+            f"""Please follow the examples provided and send back only the corrected code sections. """
+            f"""Ensure the format matches the original code file without extra descriptions or details.\n"""
+        )
 
     return prompt
 
+### Background Jobs ###
+
+def set_openai_api_key(api_key):
+    # Runs in each worker process, so the key never has to be stored with the jobs
+    openai.api_key = api_key
+
+def run_ingestion_job(params, report_progress):
+    # Step 1: Fetch issues from SonarQube (only the changes since the last sync, once the local store is populated)
+    report_progress("Fetching issues from SonarQube")
+    all_issues = sync_issues(ISSUE_STORE_PATH, params['sonar_url'], params['api_token'], params['project_key'])
+
+    # Step 2: Save the fetched issues to a CSV file
+    report_progress("Saving the CSV file")
+    save_csv_file(all_issues, params['save_path'], params['project_key'], params['original_project_location'] + "/")
+    return {'csv_path': params['save_path']}
+
+def revision_params(form, state):
+    # Collect the parameters of a single-file revision from the reviser's API form
+    file_name = form.get('file_name', '')  # Get the file name from form
+    save_directory = form.get('save_directory', '')  # Get the save directory from form
+    issue_set_id = state['issue_set_id']
+    current_line = session_store.get_issue_row(issue_set_id, state['current_line_index']) if issue_set_id else None
+    return {
+        'prompt': form.get('edited_prompt', ''),  # Get the edited prompt from form
+        'model': form.get('api_model', 'gpt-4o-mini'),  # Selected API model (default is 'gpt-4o-mini')
+        'prompt_mode': form.get('prompt_mode', 'file'),  # The mode the prompt was built in (see `sent_prompt_mode`)
+        'original_file_location': current_line.get('file_Location') if current_line else None,
+        'file_path': os.path.join(save_directory, file_name) if save_directory and file_name else None  # Full file path if provided
+    }
+
+def revision_messages(prompt):
+    return [
+        {"role": "system", "content": REVISER_SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt}
+    ]
+
+def finish_revision(api_response, params):
+    # Turn a raw API response into the revised code; shared by the background job and the streaming endpoint,
+    # so both save exactly the same file
+    api_response = api_response.strip()
+
+    # Step 1: In "window" mode, splice the returned regions back into the original file to get the complete revised code
+    # (a response without regions raises `WindowSpliceError`); in "patch" mode, apply the returned diff to it
+    # (a diff that does not match the file raises `PatchError`)
+    original_file_location = params.get('original_file_location')
+    if params.get('prompt_mode') in ('window', 'patch') and original_file_location and os.path.exists(original_file_location):
+        with open(original_file_location, 'r') as file:
+            original_text = file.read()
+        if params['prompt_mode'] == 'window':
+            api_response = splice_window_response(original_text, api_response)
+        else:
+            api_response = apply_patch(original_text, api_response)
+
+    # Step 2: Optionally save the API response to a file if a path is provided
+    if params.get('file_path'):
+        with open(params['file_path'], 'w') as file:
+            file.write(api_response)
+    return api_response
+
+def revision_cache_key(params, messages):
+    return completion_cache_key(params['model'], messages, REVISER_MAX_TOKENS, **cache_scope(llm_backend))
+
+def run_file_revision_job(params, report_progress):
+    messages = revision_messages(params['prompt'])
+
+    # Step 1: Reuse the cached response if the same prompt was already sent to the same model
+    cache_key = revision_cache_key(params, messages)
+    api_response = response_cache.get(cache_key)
+    if api_response is None:
+        # Make the API call with the selected model and prompt, retrying rate limits and timeouts
+        report_progress(f"Waiting for {params['model']}")
+
+        def complete(request_messages):
+            return call_with_retries(
+                lambda: llm_backend.complete(request_messages, params['model'], max_tokens=REVISER_MAX_TOKENS),
+                completion_limiter, completion_retry_policy, estimate_tokens(request_messages, REVISER_MAX_TOKENS),
+                revision_dead_letters, params.get('original_file_location'),
+                on_retry=lambda attempt, delay, error: report_progress(f"{error}; retrying in {delay:.1f} seconds")
+            )
+
+        # Answers cut off by REVISER_MAX_TOKENS are continued, so a long file is never saved half-finished
+        try:
+            completion, continuations = complete_with_continuation(complete, messages)
+        except TruncatedCompletion as e:
+            revision_dead_letters.add(params.get('original_file_location'), e, e.continuations + 1)
+            raise
+        if continuations:
+            report_progress(f"Joined {continuations + 1} parts of a truncated answer")
+        # Extract the response from the API and cache it
+        api_response = completion.content
+        response_cache.put(cache_key, api_response)
+
+    # Step 2: Splice and save the revised code
+    api_response = finish_revision(api_response, params)
+    return {'api_response': api_response, 'file_path': params.get('file_path')}
+
+def sse_event(event, data):
+    # Format one server-sent event with a JSON payload
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stream_file_revision(params):
+    # Relay the completion as server-sent events while it is generated: "delta" events carry the new text,
+    # and a final "done" event carries the revised code exactly as the background job would return and save it
+    messages = revision_messages(params['prompt'])
+    cache_key = revision_cache_key(params, messages)
+
+    def stream(request_messages):
+        # Every request (including the continuations of a truncated answer) waits for the shared rate limiter
+        completion_limiter.acquire_blocking(estimate_tokens(request_messages, REVISER_MAX_TOKENS))
+        return llm_backend.stream(request_messages, params['model'], max_tokens=REVISER_MAX_TOKENS)
+
+    try:
+        api_response = response_cache.get(cache_key)
+        if api_response is not None:
+            # A cached response is sent in one piece
+            yield sse_event('delta', {'content': api_response})
+        else:
+            attempt = 0
+            while True:
+                pieces = []
+                try:
+                    for content in stream_with_continuation(stream, messages):
+                        if content:
+                            pieces.append(content)
+                            yield sse_event('delta', {'content': content})
+                    break
+                except Exception as e:
+                    # Only retry before anything was sent; a stream cut off halfway is reported to the page as an error
+                    delay = None if pieces else handle_failure(e, attempt, completion_limiter, completion_retry_policy,
+                                                               revision_dead_letters, params.get('original_file_location'))
+                    if delay is None:
+                        raise
+                    time.sleep(delay)
+                    attempt += 1
+            api_response = ''.join(pieces)
+            response_cache.put(cache_key, api_response)
+        yield sse_event('done', {'api_response': finish_revision(api_response, params)})
+    except Exception as e:
+        print(f"API request failed: {e}")  # Print error if API request fails
+        yield sse_event('error', {'error': f"API request failed: {e}"})
+
+def run_project_revision_job(params, report_progress):
+    # Revise every file of an uploaded CSV, reporting progress as each revised file is saved
+    lines = session_store.get_issue_rows(params['issue_set_id'])
+    saved_files = []
+    failed_files = []
+
+    def on_saved(file_location, output_file_path, error):
+        if error is not None:
+            failed_files.append({'file_location': file_location, 'error': str(error)})
+        else:
+            saved_files.append(output_file_path)
+        report_progress(f"{len(saved_files)} files revised, {len(failed_files)} failed")
+
+    if not params['to_add']:
+        raise ValueError("No location was given for the revised files")
+
+    # The run is checkpointed, so a job queued again after a worker stopped (see `JobQueue.requeue_interrupted`) skips
+    # the files it already revised; a new job, or a manifest of a run with other settings, starts from scratch
+    run_info = {'issue_set_id': params['issue_set_id'], 'to_remove': params['to_remove'], 'model': params['model']}
+    manifest = RunManifest(os.path.join(params['to_add'], MANIFEST_FILE_NAME), run_info, resume=params.get('resume', False))
+    try:
+        summary = revise_project(lines, params['to_remove'], params['to_add'], params['model'],
+                                 cache=response_cache, on_saved=on_saved, manifest=manifest, backend=llm_backend,
+                                 limiter=completion_limiter, retry_policy=completion_retry_policy,
+                                 dead_letters=revision_dead_letters)
+    finally:
+        manifest.close()
+    return {**summary, 'saved_files': saved_files, 'failed_files': failed_files}
+
+def run_comparison_report_job(params, report_progress):
+    # Diff and score every file of an uploaded CSV against its revised copy; the report itself is cached on disk
+    pairs = comparison_pairs(session_store.get_issue_rows(params['issue_set_id']))
+    report_progress(f"Comparing {len(pairs)} files")
+    report_key, report = load_or_build_report(pairs, COMPARISON_REPORT_DIRECTORY, COMPARISON_REPORT_WORKERS)
+    summary = report['summary']
+    return {'report_key': report_key, 'files': summary['files'], 'compared': summary['compared'],
+            'missing': summary['missing'], 'errors': summary['errors'], 'outliers': summary['outliers']}
+
+JOB_HANDLERS = {
+    'ingest': run_ingestion_job,
+    'revise_file': run_file_revision_job,
+    'revise_project': run_project_revision_job,
+    'compare_project': run_comparison_report_job,
+}
+
+def get_session_id():
+    # Identify the reviewer's browser session; everything else about it is kept in the session store
+    if 'session_id' not in session:
+        session['session_id'] = secrets.token_hex(16)
+    return session['session_id']
+
+def build_issue_index(csv_lines):
+    # Index the CSV lines once, so each page view only touches the issues of the selected file
+    first_row = {}  # File name -> index of its first line
+    group_end = [0] * len(csv_lines)  # Line index -> end (exclusive) of the run of adjacent lines of the same file
+
+    # Step 1: Walk the runs of adjacent lines that belong to the same file
+    run_start = 0
+    for index in range(1, len(csv_lines) + 1):
+        if index == len(csv_lines) or csv_lines[index].get('file_name') != csv_lines[run_start].get('file_name'):
+            first_row.setdefault(csv_lines[run_start].get('file_name'), run_start)
+            for run_index in range(run_start, index):
+                group_end[run_index] = index
+            run_start = index
+
+    # Step 2: Precompute the sorted list of files for the selection dropdown
+    return {'files': sorted(first_row), 'first_row': first_row, 'group_end': group_end}
+
+def load_issue_csv(csv_file_path):
+    # Read an uploaded issue CSV into a list of lines and build its index
+    with open(csv_file_path, 'r') as file:
+        csv_lines = list(csv.DictReader(file))
+    return csv_lines, build_issue_index(csv_lines)
+
 def highlight_differences(diff):
     # Initialize an empty list to store the highlighted HTML lines
     highlighted_html = []
     
     # Step 2: Iterate through each line in the diff
     for line in diff:
+        # Escape the code, so that markup in it (e.g. JSX or HTML files) is shown instead of rendered
+        text = html.escape(line)
         if line.startswith('-'):
             # Highlight removed lines in yellow (background color)
-            highlighted_html.append(f'<span style="background-color: yellow;">{line}</span>')
+            highlighted_html.append(f'<span style="background-color: yellow;">{text}</span>')
         elif line.startswith('+'):
             # Highlight added lines in light green (background color)
-            highlighted_html.append(f'<span style="background-color: lightgreen;">{line}</span>')
+            highlighted_html.append(f'<span style="background-color: lightgreen;">{text}</span>')
         else:
             # No change, no highlight. Just add the line as is
-            highlighted_html.append(f'<span>{line}</span>')
+            highlighted_html.append(f'<span>{text}</span>')
     
     # Step 3: Join the list of highlighted HTML lines with line breaks (<br>)
     return '<br>'.join(highlighted_html)
 
 def calculate_all_metrics(original_lines, revised_lines):
-    # Step 1: Tokenize the original and revised lines by stripping extra spaces
-    original_tokens = [line.strip() for line in original_lines]
-    revised_tokens = [line.strip() for line in revised_lines]
-
-    # Step 2: Convert tokenized lines into sets for comparison
-    original_set = set(original_tokens)
-    revised_set = set(revised_tokens)
-
-    # Step 3: Calculate true positives, false positives, and false negatives
-    true_positives = original_set & revised_set
-    false_positives = revised_set - original_set
-    false_negatives = original_set - revised_set
-
-    # Step 4: Calculate precision, recall, and F1 score
-    precision = len(true_positives) / (len(true_positives) + len(false_positives)) if (len(true_positives) + len(false_positives)) > 0 else 0
-    recall = len(true_positives) / (len(true_positives) + len(false_negatives)) if (len(true_positives) + len(false_negatives)) > 0 else 0
-    f1 = (2 * precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
-
-    # Step 5: Calculate exact match (ratio of true positives to original tokens)
-    exact_match = len(true_positives) / len(original_tokens) if original_tokens else 0
-
-    # Step 6: Calculate BLEU score
-    bleu = sentence_bleu([original_tokens], revised_tokens)
-
-    # Step 7: Calculate ROUGE scores
-    rouge_scorer_instance = rouge_scorer.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
-    rouge_scores = rouge_scorer_instance.score("\n".join(original_tokens), "\n".join(revised_tokens))
-
-    # Step 8: Convert all metrics to percentages and return them as a dictionary
+    # Precision, recall, F1, exact match, BLEU and ROUGE as percentages; see `metrics_engine.py`, which sets up its
+    # scorers once per process and also scores whole lists of files (`score_pairs`, `score_files`) on a process pool
+    return score_pair(original_lines, revised_lines)
+
+def compare_contents(original_text, revised_text, original_file_name, revised_file_name, algorithm):
+    # Diff lines, hunk positions, diff engine and metrics of two files, served from the comparison cache while
+    # neither file changes
+    cache_key = comparison_key(original_text, revised_text, algorithm, original_file_name, revised_file_name)
+    result = comparison_cache.get(cache_key)
+    if result is None:
+        # A diff engine that runs out of time falls back to a faster one; `diff_engine` is the one that finished
+        diff, diff_engine = diff_texts(original_text, revised_text, original_file_name, revised_file_name, algorithm)
+        result = {
+            'diff_lines': diff,
+            'hunk_rows': [row for row, line in enumerate(diff) if line.startswith('@@')],
+            'diff_engine': diff_engine,
+            'metrics': calculate_all_metrics(original_text.splitlines(), revised_text.splitlines())
+        }
+        comparison_cache.put(cache_key, result)
+    return result
+
+def comparison_files(issue_set_id, file_name):
+    # Names and paths of a file of the uploaded CSV and of its revised copy, or None for a file that is not in the CSV
+    line_index = session_store.get_first_row(issue_set_id, file_name) if issue_set_id and file_name else None
+    if line_index is None:
+        return None
+    line = session_store.get_issue_row(issue_set_id, line_index)
+    # Ensure file paths use the appropriate format (forward slashes for compatibility);
+    # see `revised_comparison_path` for the folder structure assumed for the revised copy
+    original_file_path = line['file_Location'].replace("\\", "/")
     return {
-        'precision': precision * 100,  # Precision as percentage
-        'recall': recall * 100,        # Recall as percentage
-        'f1_score': f1 * 100,          # F1 score as percentage
-        'exact_match': exact_match * 100,  # Exact match as percentage
-        'bleu_score': bleu * 100,      # BLEU score as percentage
-        'rouge1_fmeasure': rouge_scores['rouge1'].fmeasure * 100,  # ROUGE-1 F-measure as percentage
-        'rougeL_fmeasure': rouge_scores['rougeL'].fmeasure * 100   # ROUGE-L F-measure as percentage
+        'original_file_name': line['file_name'],
+        'original_file_path': original_file_path,
+        'revised_file_name': f"Revised.{line['file_name']}",
+        'revised_file_path': revised_comparison_path(original_file_path, line['file_name'])
     }
 
+def read_comparison_texts(files):
+    # A missing revised file is compared as an empty file
+    revised_path = files['revised_file_path']
+    return read_text(files['original_file_path']), read_text(revised_path) if os.path.exists(revised_path) else ""
+
+def requested_line_range(total):
+    # The `start` and `count` query parameters of the line range endpoints, within bounds
+    start = min(max(0, request.args.get('start', 0, type=int)), total)
+    count = min(max(0, request.args.get('count', COMPARER_BLOCK_LINES, type=int)), COMPARER_MAX_LINES)
+    return start, min(total, start + count)
+
 ### App Routes###
 
 @app.route('/', methods=['GET'])
@@ -262,6 +838,7 @@ def sonarqube():
     preset_project_keys = ["<Replace with your SonarQube Project Key>"]
     preset_project_locations = ["<Replace with the project location on your system>"]
     preset_save_paths = ["<Replace with the path where you want to save the CSV file>"]
+    job_id = None
 
     if request.method == 'POST':
         # Capture form data sent via POST request
@@ -275,12 +852,14 @@ def sonarqube():
         if not original_project_location or not save_path:
             return "Please fill in all required fields.", 400
 
-        # Fetch issues from SonarQube
-        all_issues = get_all_issues(sonar_url, api_token, project_key)
-
-        # Save the fetched issues to a CSV file
-        if save_path:
-            save_csv_file(all_issues, save_path, project_key, original_project_location + "/")
+        # Fetch the issues and save them to a CSV file in a background job; the page polls the job until it is done
+        job_id = job_queue.submit('ingest', {
+            'sonar_url': sonar_url,
+            'api_token': api_token,
+            'project_key': project_key,
+            'original_project_location': original_project_location,
+            'save_path': save_path
+        })
 
     # Render the HTML form for both GET and POST requests
     return render_template('sonarqube.html',
@@ -288,13 +867,31 @@ def sonarqube():
                            preset_api_tokens=preset_api_tokens,
                            preset_project_keys=preset_project_keys,
                            preset_project_locations=preset_project_locations,
-                           preset_save_paths=preset_save_paths)
+                           preset_save_paths=preset_save_paths,
+                           job_id=job_id)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # Report the status of a background job, for the pages polling it
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify({
+        'job_id': job['job_id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'progress': job['progress'],
+        'result': job['result'],
+        'error': job['error']
+    })
 
 @app.route('/Code_Issue_Reviser', methods=['GET', 'POST'])
 def Code_Issue_Reviser():
-    # Global variables to store CSV lines and the current line index
-    global csv_lines, current_line_index
-    api_response = None  # Initialize api_response as None
+    # Load this reviewer's uploaded CSV, current line index and preferences from the session store
+    session_id = get_session_id()
+    state = session_store.get_state(session_id)
+    job_id = None  # Background job revising the current file
+    project_job_id = None  # Background job revising every file
 
     # Step 1: Handle CSV file upload if a file is provided in the request
     if 'csv_file' in request.files:
@@ -304,120 +901,126 @@ def Code_Issue_Reviser():
             csv_file_path = os.path.join(UPLOAD_FOLDER, csv_file.filename)
             csv_file.save(csv_file_path)
 
-            # Process the CSV file: Read and convert it into a list of lines
-            with open(csv_file_path, 'r') as file:
-                csv_reader = csv.DictReader(file)
-                csv_lines = list(csv_reader)
-                current_line_index = 0  # Start at the first line
+            # Process the CSV file: Read it once into a list of lines and index it by file
+            csv_lines, issue_index = load_issue_csv(csv_file_path)
+            state['current_line_index'] = 0  # Start at the first line
+            session_store.purge_expired(keep=job_queue.unfinished_params('issue_set_id'))
+            session_store.save_issue_set(session_id, state, csv_lines, issue_index)  # Also saves the session's state
 
             # Redirect to avoid form resubmission on page refresh
             return redirect(url_for('Code_Issue_Reviser'))
 
+    issue_set_id = state['issue_set_id']
+
     # Step 2: Handle form submission and perform actions based on the button clicked
     if request.method == 'POST':
+        if request.form.get('api_model') in REVISER_MODELS:
+            state['api_model'] = request.form['api_model']  # Remember the selected model for the prompt size
         # Check for the "save_prompt" button in the form to redirect for saving
         if 'save_prompt' in request.form:
             return redirect(url_for('select_save_location'))
 
         # Check for the "send_to_api" button to call the API with the edited prompt
         elif 'send_to_api' in request.form:
-            edited_prompt = request.form.get('edited_prompt', '')  # Get the edited prompt from form
-            file_name = request.form.get('file_name', '')  # Get the file name from form
-            save_directory = request.form.get('save_directory', '')  # Get the save directory from form
-            file_path = os.path.join(save_directory, file_name) if save_directory and file_name else None  # Create full file path if provided
-            
-            # Capture the selected API model from the form (default is 'gpt-4o-mini')
-            selected_model = request.form.get('api_model', 'gpt-4o-mini')
-
-            try:
-                # Step 3: Make the API call to OpenAI with the selected model and prompt
-                response = openai.ChatCompletion.create(
-                    model=selected_model,  # Use the selected model
-                    messages=[
-                        {"role": "system", "content": "You are a code developer assistant."},
-                        {"role": "user", "content": edited_prompt}
-                    ],
-                    max_tokens=1600
-                )
-                # Extract the response from the API
-                api_response = response.choices[0].message['content'].strip()
-
-                # Step 4: Optionally save the API response to a file if a path is provided
-                if file_path:
-                    with open(file_path, 'w') as file:
-                        file.write(api_response)
-
-            except Exception as e:
-                print(f"API request failed: {e}")  # Print error if API request fails
-                api_response = f"API request failed: {e}"
-
-        # Step 5: Handle changes to UI preferences such as font size, font, background color, and code color
+            # Step 3: Revise the file in a background job; the page polls the job for the response
+            # (browsers that can read streamed responses use `/Code_Issue_Reviser/stream` instead)
+            job_id = job_queue.submit('revise_file', revision_params(request.form, state))
+
+        # Step 4: Revise every file of the uploaded CSV in a background job
+        elif 'revise_project' in request.form:
+            if not request.form.get('to_add', '').strip():
+                return "Please fill in the revised files location.", 400
+            if issue_set_id:
+                project_job_id = job_queue.submit('revise_project', {
+                    'issue_set_id': issue_set_id,
+                    'to_remove': request.form.get('to_remove', ''),
+                    'to_add': request.form.get('to_add', ''),
+                    'model': request.form.get('api_model', 'gpt-4o-mini')
+                })
+
+        # Step 5: Handle changes to the prompt mode and UI preferences such as font size, font, background color, and code color
+        elif 'prompt_mode' in request.form:
+            state['prompt_mode'] = request.form.get('prompt_mode', 'file')  # Update prompt mode
+            state['context_lines'] = max(0, int(request.form.get('context_lines') or DEFAULT_CONTEXT_LINES))  # Update window context
         elif 'font_size' in request.form:
-            global current_font_size
-            current_font_size = int(request.form.get('font_size', 10))  # Update font size
+            state['font_size'] = int(request.form.get('font_size', 10))  # Update font size
         elif 'font' in request.form:
-            global selected_font
-            selected_font = request.form.get('font', 'Courier')  # Update font style
+            state['font'] = request.form.get('font', 'Courier')  # Update font style
         elif 'bg_color' in request.form:
-            global background_color
-            background_color = request.form.get('bg_color', '#FFFFFF')  # Update background color
+            state['bg_color'] = request.form.get('bg_color', '#FFFFFF')  # Update background color
         elif 'code_color' in request.form:
-            global original_code_color
-            original_code_color = request.form.get('code_color', '#000000')  # Update code color
+            state['code_color'] = request.form.get('code_color', '#000000')  # Update code color
         elif 'next_line' in request.form:
-            current_line_index += 1  # Move to the next line in the CSV
+            state['current_line_index'] += 1  # Move to the next line in the CSV
         elif 'file_selection' in request.form:
             selected_file_name = request.form.get('file_selection', '')  # Get the selected file name
-            current_line_index = next(
-                (i for i, line in enumerate(csv_lines) if line.get('file_name') == selected_file_name), 0)  # Find the line index for the selected file
+            first_row = session_store.get_first_row(issue_set_id, selected_file_name) if issue_set_id else None
+            state['current_line_index'] = first_row or 0  # Find the line index for the selected file
+            session_store.save_state(session_id, state)
             return redirect(url_for('Code_Issue_Reviser'))  # Redirect to update the page with the selected file
+        session_store.save_state(session_id, state)
 
     # Step 6: If CSV lines exist, process them and generate the prompt for the API
-    if csv_lines:
+    current_line_index = state['current_line_index']
+    line = session_store.get_issue_row(issue_set_id, current_line_index) if issue_set_id else None  # Get the current line based on the index
+    if line:
         # Get the list of unique file names in the CSV for the file selection dropdown
-        files = sorted(set(line.get('file_name') for line in csv_lines))
-        line = csv_lines[current_line_index]  # Get the current line based on the index
+        files = session_store.get_files(issue_set_id)
         file_location = line.get('file_Location')
         file_name = line.get('file_name')
 
         if file_location and os.path.exists(file_location):  # If the file location exists, process the bugs
-            bug_lines = [line.get('line')]
-            bug_messages = [line.get('message')]
-            bug_type = [line.get('type')]
-
-            # Step 7: Handle multiple lines with the same file and group them
-            next_line_index = current_line_index + 1
-            while next_line_index < len(csv_lines) and csv_lines[next_line_index].get('file_name') == file_name:
-                bug_lines.append(csv_lines[next_line_index].get('line'))
-                bug_messages.append(csv_lines[next_line_index].get('message'))
-                bug_type.append(csv_lines[next_line_index].get('type'))
-                next_line_index += 1
+            # Step 7: Handle multiple lines with the same file and group them (the group's end is precomputed)
+            group = session_store.get_issue_group(issue_set_id, current_line_index)
+            bug_lines = [group_line.get('line') for group_line in group]
+            bug_messages = [group_line.get('message') for group_line in group]
+            bug_type = [group_line.get('type') for group_line in group]
 
             # Step 8: Generate a prompt based on the selected issues and code file
-            prompt = generate_prompt(file_location, bug_lines, bug_messages, bug_type)
-            return render_template('Code_Issue_Reviser.html', prompt=prompt, font_size=current_font_size,
-                                   font=selected_font, bg_color=background_color,
-                                   code_color=original_code_color, file_name=file_name, files=files, api_response=api_response)
+            prompt = generate_prompt(file_location, bug_lines, bug_messages, bug_type, state['prompt_mode'], state['context_lines'])
+            # The API form sends back the mode the prompt was built in, so a whole-file answer is never spliced as regions
+            prompt_mode_sent = sent_prompt_mode(file_location, bug_lines, state['prompt_mode'], state['context_lines'])
+            # Measure the prompt offline with the tokenizer of every model on offer; the page shows the selected model's count
+            prompt_tokens = {model: count_tokens(prompt, model) for model in REVISER_MODELS}
+            return render_template('Code_Issue_Reviser.html', prompt=prompt, font_size=state['font_size'],
+                                   font=state['font'], bg_color=state['bg_color'],
+                                   code_color=state['code_color'], file_name=file_name, files=files,
+                                   prompt_mode=state['prompt_mode'], context_lines=state['context_lines'], prompt_tokens=prompt_tokens,
+                                   prompt_mode_sent=prompt_mode_sent, api_model=state['api_model'],
+                                   job_id=job_id, project_job_id=project_job_id)
 
     # Step 9: Get the list of unique files from the uploaded CSV lines if no issues are processed yet
-    files = sorted(set(line.get('file_name') for line in csv_lines))
-    file_name = csv_lines[current_line_index].get('file_name') if csv_lines else None
+    files = session_store.get_files(issue_set_id) if issue_set_id else []
+    file_name = line.get('file_name') if line else None
     prompt = generate_prompt(file_name) if file_name else ""  # Generate an empty prompt if no file is selected
     
-    return render_template('Code_Issue_Reviser.html', prompt=prompt, files=files, api_response=api_response)
+    return render_template('Code_Issue_Reviser.html', prompt=prompt, files=files,
+                           prompt_mode=state['prompt_mode'], context_lines=state['context_lines'],
+                           job_id=job_id, project_job_id=project_job_id)
+
+@app.route('/Code_Issue_Reviser/stream', methods=['POST'])
+def stream_revision():
+    # Stream the API response for the prompt in the reviser's API form as server-sent events
+    session_id = get_session_id()
+    state = session_store.get_state(session_id)
+    if request.form.get('api_model') in REVISER_MODELS:
+        state['api_model'] = request.form['api_model']  # Remember the selected model for the prompt size
+        session_store.save_state(session_id, state)
+    params = revision_params(request.form, state)
+    return Response(stream_with_context(stream_file_revision(params)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/Code_Comparer', methods=['GET', 'POST'])
 def compare_files():
-    global csv_lines
-     # Initialize variables to store file paths and contents
-    original_file_path = ""
-    revised_file_path = ""
-    original_code = ""
-    revised_code = ""
-    original_file_name = ""
-    revised_file_name = ""
-    diff_output = ""
-    metrics = {}
+    # Load this reviewer's uploaded CSV from the session store
+    session_id = get_session_id()
+    state = session_store.get_state(session_id)
+    issue_set_id = state['issue_set_id']
+    # The page is rendered without the code and the diff: its views fetch the lines they show from
+    # `/Code_Comparer/lines` and `/Code_Comparer/diff` while they are scrolled, so large files load as fast as small ones
+    files = None
+    comparison = {}
+    original_line_count = revised_line_count = 0
 
     if request.method == 'POST':
         # Handle CSV file upload
@@ -427,73 +1030,117 @@ def compare_files():
             csv_file_path = os.path.join(UPLOAD_FOLDER, csv_file.filename)
             csv_file.save(csv_file_path)
 
-            # Read the CSV file and store its contents
-            with open(csv_file_path, 'r') as file:
-                csv_reader = csv.DictReader(file)
-                csv_lines = list(csv_reader)
+            # Read the CSV file once and index its contents
+            csv_lines, issue_index = load_issue_csv(csv_file_path)
+            state['current_line_index'] = 0
+            session_store.purge_expired(keep=job_queue.unfinished_params('issue_set_id'))
+            session_store.save_issue_set(session_id, state, csv_lines, issue_index)  # Also saves the session's state
 
             # Redirect to the same page to display available files for comparison
             return redirect(url_for('compare_files'))
 
-        selected_file_name = request.form.get('file_selection')
-        if selected_file_name and csv_lines:
-            for line in csv_lines:
-                # Find the selected file's data in the CSV lines
-                if line['file_name'] == selected_file_name:
-                    original_file_path = line['file_Location']
-                    original_file_name = line['file_name']
-
-                    # Step 1: Adjust the path for the revised file
-                    # Adjust this line according to your folder structure if necessary.
-                    # This assumes the "open-instruct-main" directory needs to be replaced by "open-instruct-main.Revised" for the revised code.
-                    original_directory = os.path.dirname(original_file_path)
-                    # Adjust this line according to your folder structure if necessary. we cahnged it based on open-instruct-main Testdata folder
-                    revised_file_path = os.path.join(original_directory.replace("WALL", "WALL.Revised"), revised_file_name)
-                    revised_file_name = f"Revised.{original_file_name}"
-                    revised_file_path = os.path.join(revised_directory, revised_file_name)
-
-                    # Step 2: Normalize paths for different operating systems
-                    # Ensure file paths use the appropriate format (forward slashes for compatibility)
-                    original_file_path = original_file_path.replace("\\", "/")
-                    revised_file_path = revised_file_path.replace("\\", "/")
-
-                    # Step 3: Check if the revised file exists
-                    # If the revised file does not exist, print a message and proceed
-                    if not os.path.exists(revised_file_path):
-                        print(f"Revised file not found: {revised_file_path}")
-
-                    # Step 4: Read the contents of both original and revised files
-                    original_code = read_file_contents(original_file_path)
-                    revised_code = read_file_contents(revised_file_path)
-
-                    # Step 5: Generate the diff output between the original and revised code
-                    diff = difflib.unified_diff(
-                        original_code.splitlines(),
-                        revised_code.splitlines(),
-                        fromfile=original_file_name,
-                        tofile=revised_file_name,
-                        lineterm=''
-                    )
-                    diff_output = highlight_differences(diff)
-
-                    # Step 6: Calculate various metrics between the original and revised code
-                    metrics = calculate_all_metrics(original_code.splitlines(), revised_code.splitlines())
-                    break
-
-    # Step 7: List files available for selection (based on the CSV data)
+        # The diff algorithm can be chosen with every request, and is kept for the next comparisons
+        if request.form.get('diff_algorithm') in DIFF_ALGORITHMS:
+            state['diff_algorithm'] = request.form['diff_algorithm']
+            session_store.save_state(session_id, state)
+
+        # Step 1: Find the selected file and its revised copy through the CSV index (no scan over every line)
+        files = comparison_files(issue_set_id, request.form.get('file_selection'))
+        if files is not None:
+            # Step 2: Check if the revised file exists
+            # If the revised file does not exist, print a message and compare against an empty file
+            if not os.path.exists(files['revised_file_path']):
+                print(f"Revised file not found: {files['revised_file_path']}")
+
+            # Step 3: Generate the diff and calculate various metrics between the original and revised code
+            # (on the code itself: with line numbers, one added line would make every line below it differ).
+            # Files viewed before are served from the cache unless one of them changed.
+            original_text, revised_text = read_comparison_texts(files)
+            original_line_count = len(original_text.splitlines())
+            revised_line_count = len(revised_text.splitlines())
+            comparison = compare_contents(original_text, revised_text, files['original_file_name'],
+                                          files['revised_file_name'], state['diff_algorithm'])
+
+    # Step 4: List files available for selection (based on the CSV data)
     # Create a list of unique file names from the CSV and sort them
-    files = sorted(set(line.get('file_name') for line in csv_lines)) if csv_lines else []
+    file_names = session_store.get_files(issue_set_id) if issue_set_id else []
 
     # Return the results and render the template with relevant data
-    return render_template('Code_Comparison.html', files=files, original_code=original_code,
-                           revised_code=revised_code, original_file_name=original_file_name,
-                           original_file_path=original_file_path, revised_file_name=revised_file_name,
-                           revised_file_path=revised_file_path, diff_output=diff_output, metrics=metrics)
+    files = files or {'original_file_name': "", 'original_file_path': "", 'revised_file_name': "", 'revised_file_path': ""}
+    return render_template('Code_Comparison.html', files=file_names, **files, metrics=comparison.get('metrics', {}),
+                           original_line_count=original_line_count, revised_line_count=revised_line_count,
+                           diff_line_count=len(comparison.get('diff_lines', [])), hunk_rows=comparison.get('hunk_rows', []),
+                           diff_algorithms=DIFF_ALGORITHMS, diff_algorithm=state['diff_algorithm'],
+                           diff_engine=comparison.get('diff_engine', ""), block_lines=COMPARER_BLOCK_LINES)
+
+@app.route('/Code_Comparer/lines', methods=['GET'])
+def comparison_lines():
+    # A range of lines of the original (`side=original`) or revised (`side=revised`) file, as JSON
+    state = session_store.get_state(get_session_id())
+    files = comparison_files(state['issue_set_id'], request.args.get('file'))
+    side = request.args.get('side', 'original')
+    if files is None or side not in ('original', 'revised'):
+        return jsonify({'error': 'Unknown file'}), 404
+    path = files[f'{side}_file_path']
+    lines = read_text(path).splitlines() if os.path.exists(path) else []
+    start, end = requested_line_range(len(lines))
+    return jsonify({'start': start, 'total': len(lines), 'lines': lines[start:end]})
+
+@app.route('/Code_Comparer/diff', methods=['GET'])
+def comparison_diff():
+    # A range of rows of the highlighted diff, as JSON with the rows' HTML; the diff comes from the comparison cache
+    state = session_store.get_state(get_session_id())
+    files = comparison_files(state['issue_set_id'], request.args.get('file'))
+    if files is None:
+        return jsonify({'error': 'Unknown file'}), 404
+    algorithm = request.args.get('algorithm', state['diff_algorithm'])
+    if algorithm not in DIFF_ALGORITHMS:
+        return jsonify({'error': f'Unknown diff algorithm: {algorithm}'}), 400
+    original_text, revised_text = read_comparison_texts(files)
+    comparison = compare_contents(original_text, revised_text, files['original_file_name'], files['revised_file_name'],
+                                  algorithm)
+    diff_lines = comparison['diff_lines']
+    start, end = requested_line_range(len(diff_lines))
+    return jsonify({'start': start, 'total': len(diff_lines), 'html': highlight_differences(diff_lines[start:end]),
+                    'hunk_rows': comparison['hunk_rows'], 'diff_engine': comparison['diff_engine']})
+
+@app.route('/Code_Comparer/report', methods=['GET', 'POST'])
+def compare_project():
+    # Project-wide comparison of every file in this reviewer's uploaded CSV with its revised copy
+    state = session_store.get_state(get_session_id())
+    issue_set_id = state['issue_set_id']
+    if not issue_set_id:
+        return redirect(url_for('compare_files'))
+
+    # Step 1: Build the report in a background job; the page polls the job and reloads once the report is cached
+    if request.method == 'POST':
+        job_id = job_queue.submit('compare_project', {'issue_set_id': issue_set_id})
+        return redirect(url_for('compare_project', job_id=job_id))
+
+    # Step 2: Load the cached report of the current files (None if it was never built or a file changed since)
+    report = load_report(comparison_pairs(session_store.get_issue_rows(issue_set_id)), COMPARISON_REPORT_DIRECTORY)
+    page = None
+    if report is not None:
+        page = report_page(report, request.args.get('sort', 'f1_score'), request.args.get('order') == 'desc',
+                           request.args.get('page', 1, type=int), request.args.get('per_page', DEFAULT_PAGE_SIZE, type=int),
+                           request.args.get('outliers') == '1')
+
+    # Step 3: Serve the page as JSON (`?format=json`) or as HTML
+    if request.args.get('format') == 'json':
+        if report is None:
+            return jsonify({'error': 'No report for the current files; POST to this URL to build one'}), 404
+        return jsonify({**page, 'summary': report['summary']})
+    return render_template('Code_Comparison_Report.html', report=report, page=page, metric_keys=METRIC_KEYS,
+                           job_id=request.args.get('job_id'))
 
 if __name__ == '__main__':
     # Step 1: Set up the OpenAI API key
     openai.api_key = 'your-openai-api-key'  # Insert your OpenAI API key here
-    # Step 2: Run the Flask application
+    debug = True  # Replace with `debug = False` for production
+    # Step 2: Start the background job workers (only once: in debug mode this file is also run by the reloader)
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_workers(JOB_QUEUE_PATH, JOB_HANDLERS, JOB_WORKERS, set_openai_api_key, (openai.api_key,))
+    # Step 3: Run the Flask application
     # The app will run in debug mode, which is useful during development
     # Replace 'debug=True' with 'debug=False' for production deployment
-    app.run(debug=True)  # Replace with `debug=False` for production
+    app.run(debug=debug)
@@ -0,0 +1,244 @@
+import json
+import os
+import shutil
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import openai
+import requests
+from llm_cache import make_cache_key, completion_cache_key
+from llm_backends import OpenAIBackend, DEFAULT_TIMEOUT, cache_scope, request_options
+
+# Batch-API submission for whole-project runs that do not need interactive latency.
+# All prompts are packed into JSON Lines files, submitted as batches, polled until they finish, and every result is
+# handed back like a result of the revision engine. Requests are identified by a hash of their content, so an
+# interrupted run re-attaches to the batches it already submitted (see BATCH_STATE_FILE_NAME) instead of paying twice.
+# `LocalBatchClient` is an offline stand-in that answers batches with any completion backend (e.g. the mock).
+
+BATCH_STATE_FILE_NAME = '.wall_batches.jsonl'  # Batches of an unfinished run, kept next to the run manifest
+LOCAL_BATCH_DIRECTORY = '.wall_local_batches'  # Files and batches of the local stand-in
+DEFAULT_POLL_INTERVAL = 60  # Seconds between two status checks
+MAX_BATCH_REQUESTS = 50000  # Requests per batch accepted by the OpenAI Batch API
+MAX_BATCH_BYTES = 190 * 1024 * 1024  # Size of a batch input file, below the 200 MB limit
+FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+class BatchRequestError(Exception):
+    pass
+
+class OpenAIBatchClient:
+    # The OpenAI Batch API (`/v1/files` and `/v1/batches`), called over HTTP
+    def __init__(self, api_key, api_base='https://api.openai.com/v1', timeout=DEFAULT_TIMEOUT):
+        self.api_base = api_base.rstrip('/')
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers.update({'Authorization': f'Bearer {api_key}'})
+
+    def request(self, method, path, **kwargs):
+        response = self.session.request(method, f"{self.api_base}{path}", timeout=self.timeout, **kwargs)
+        response.raise_for_status()
+        return response
+
+    def upload(self, path):
+        with open(path, 'rb') as file:
+            return self.request('POST', '/files', data={'purpose': 'batch'},
+                                files={'file': (os.path.basename(path), file)}).json()['id']
+
+    def create(self, input_file_id, completion_window='24h'):
+        return self.request('POST', '/batches', json={'input_file_id': input_file_id, 'endpoint': '/v1/chat/completions',
+                                                      'completion_window': completion_window}).json()
+
+    def retrieve(self, batch_id):
+        return self.request('GET', f'/batches/{batch_id}').json()
+
+    def download(self, file_id):
+        return self.request('GET', f'/files/{file_id}/content').text
+
+class LocalBatchClient:
+    # Offline stand-in with the same calls and file formats, answering every request with a completion backend.
+    # Batches are processed when they are created and kept on disk, so a resumed run can re-attach to them too.
+    def __init__(self, backend, directory, max_workers=8):
+        self.backend = backend
+        self.directory = directory
+        self.max_workers = max_workers
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, object_id):
+        return os.path.join(self.directory, object_id)
+
+    def upload(self, path):
+        file_id = f"file-local-{uuid.uuid4().hex}"
+        shutil.copyfile(path, self.path(file_id))
+        return file_id
+
+    def answer(self, line):
+        # Answer one request line in the output (or error) format of the Batch API
+        request = json.loads(line)
+        body = request['body']
+        try:
+            completion = self.backend.complete(body['messages'], body['model'], body.get('temperature'), body.get('max_tokens'))
+        except Exception as e:
+            return False, {'custom_id': request['custom_id'], 'response': None, 'error': {'code': type(e).__name__, 'message': str(e)}}
+        return True, {'custom_id': request['custom_id'], 'error': None, 'response': {'status_code': 200, 'body': {
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': completion.content},
+                         'finish_reason': completion.finish_reason}],
+            'usage': completion.usage}}}
+
+    def create(self, input_file_id, completion_window='24h'):
+        with open(self.path(input_file_id), 'r', encoding='utf-8') as file:
+            lines = [line for line in file if line.strip()]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            answers = list(executor.map(self.answer, lines))
+
+        batch_id = f"batch-local-{uuid.uuid4().hex}"
+        batch = {'id': batch_id, 'status': 'completed', 'input_file_id': input_file_id, 'output_file_id': None,
+                 'error_file_id': None, 'request_counts': {'total': len(answers), 'completed': 0, 'failed': 0}}
+        for succeeded, key in ((True, 'output_file_id'), (False, 'error_file_id')):
+            results = [result for ok, result in answers if ok == succeeded]
+            batch['request_counts']['completed' if succeeded else 'failed'] = len(results)
+            if results:
+                batch[key] = f"file-local-{uuid.uuid4().hex}"
+                with open(self.path(batch[key]), 'w', encoding='utf-8') as file:
+                    file.writelines(json.dumps(result) + '\n' for result in results)
+        with open(self.path(batch_id), 'w', encoding='utf-8') as file:
+            json.dump(batch, file)
+        return batch
+
+    def retrieve(self, batch_id):
+        with open(self.path(batch_id), 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    def download(self, file_id):
+        with open(self.path(file_id), 'r', encoding='utf-8') as file:
+            return file.read()
+
+def create_batch_client(backend, directory):
+    # The OpenAI backend (the default) submits real batches; any other backend is served by the local stand-in
+    backend = backend or OpenAIBackend()
+    if isinstance(backend, OpenAIBackend):
+        return OpenAIBatchClient(backend.api_key or openai.api_key, backend.api_base or openai.api_base, backend.timeout)
+    return LocalBatchClient(backend, os.path.join(directory, LOCAL_BATCH_DIRECTORY))
+
+# Function to split the request lines into batch input files within the limits of the Batch API
+def split_batches(request_lines):
+    batches = [[]]
+    size = 0
+    for line in request_lines:
+        if batches[-1] and (len(batches[-1]) == MAX_BATCH_REQUESTS or size + len(line) > MAX_BATCH_BYTES):
+            batches.append([])
+            size = 0
+        batches[-1].append(line)
+        size += len(line)
+    return [batch for batch in batches if batch]
+
+# Function to read the batches an interrupted run already submitted, as a dict of batch index -> batch id
+def load_batch_state(state_path):
+    submitted = {}
+    if os.path.exists(state_path):
+        with open(state_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A line cut off by a crash
+                submitted[entry['index']] = entry['batch_id']
+    return submitted
+
+# Function to submit every prompt in batches, wait for them and hand each result back
+def revise_in_batches(jobs, on_result, model, client, state_path, poll_interval=DEFAULT_POLL_INTERVAL, temperature=0.0,
+                      max_tokens=None, cache=None, backend=None):
+    # `jobs` and `on_result(job, content, error)` are the same as for `revision_engine.run_revision_jobs`.
+    # Returns a summary; jobs whose answer was cut off by `max_tokens` or is missing from the results (e.g. an expired
+    # batch) are returned in summary['incomplete'], so they can be sent through the revision engine instead.
+    summary = {'completed': 0, 'failed': 0, 'cached': 0, 'batches': 0, 'incomplete': []}
+
+    # Step 1: Answer unchanged prompts from the cache and give every other request a content-based id
+    pending = {}  # Request id -> jobs with that prompt
+    request_lines = []
+    for job in jobs:
+        job_model = job.get('model', model)
+        job_max_tokens = job.get('max_tokens', max_tokens)
+        cache_key = completion_cache_key(job_model, job['messages'], job_max_tokens, temperature, **cache_scope(backend))
+        content = cache.get(cache_key) if cache is not None else None
+        if content is not None:
+            summary['completed'] += 1
+            summary['cached'] += 1
+            on_result(job, content, None)
+            continue
+        request_id = make_cache_key(job_model, job['messages'], temperature=temperature, max_tokens=job_max_tokens)
+        if request_id not in pending:
+            request_lines.append(json.dumps({'custom_id': request_id, 'method': 'POST', 'url': '/v1/chat/completions',
+                                             'body': {'model': job_model, 'messages': job['messages'],
+                                                      **request_options(temperature, job_max_tokens)}}) + '\n')
+        pending.setdefault(request_id, []).append((job, cache_key))
+    if not pending:
+        return summary
+
+    # Step 2: Re-attach to the batches of an interrupted run and submit the ones it did not get to. Every batch is
+    # appended to the state file as soon as it is created, so a run stopped halfway never forgets a batch it paid for
+    submitted = load_batch_state(state_path)
+    if submitted:
+        print(f"Re-attaching to {len(submitted)} submitted batches")
+    with open(state_path, 'a', encoding='utf-8') as state_file:
+        for index, lines in enumerate(split_batches(request_lines)):
+            if index in submitted:
+                continue
+            input_path = f"{state_path}.{index}.jsonl"
+            with open(input_path, 'w', encoding='utf-8') as file:
+                file.writelines(lines)
+            submitted[index] = client.create(client.upload(input_path))['id']
+            state_file.write(json.dumps({'index': index, 'batch_id': submitted[index], 'submitted_at': time.time()}) + '\n')
+            state_file.flush()
+            os.fsync(state_file.fileno())
+            os.remove(input_path)
+            print(f"Submitted batch {index + 1} ({len(lines)} requests)")
+    batch_ids = list(submitted.values())
+    summary['batches'] = len(batch_ids)
+
+    # Step 3: Poll until every batch has finished
+    batches = {}
+    while True:
+        batches = {batch_id: client.retrieve(batch_id) for batch_id in batch_ids}
+        if all(batch['status'] in FINAL_STATUSES for batch in batches.values()):
+            break
+        counts = [batch.get('request_counts') or {} for batch in batches.values()]
+        print(f"Batches: {sum(count.get('completed', 0) for count in counts)} of "
+              f"{sum(count.get('total', 0) for count in counts)} requests done, checking again in {poll_interval} seconds")
+        time.sleep(poll_interval)
+
+    # Step 4: Hand back the results of every batch, including partial results of expired or cancelled ones
+    for batch in batches.values():
+        if batch['status'] != 'completed':
+            print(f"Batch {batch['id']} {batch['status']}: {json.dumps(batch.get('errors'))}")
+        for key in ('output_file_id', 'error_file_id'):
+            if not batch.get(key):
+                continue
+            for line in client.download(batch[key]).splitlines():
+                if not line.strip():
+                    continue
+                result = json.loads(line)
+                entries = pending.pop(result.get('custom_id'), None)
+                if entries is None:
+                    continue  # A request of an earlier plan, or a duplicate
+                response = result.get('response') or {}
+                body = response.get('body') or {}
+                if result.get('error') or response.get('status_code') != 200:
+                    message = (result.get('error') or body.get('error') or {}).get('message', 'Batch request failed')
+                    for job, _ in entries:
+                        summary['failed'] += 1
+                        on_result(job, None, BatchRequestError(message))
+                    continue
+                choice = body['choices'][0]
+                if choice.get('finish_reason') == 'length':
+                    summary['incomplete'].extend(job for job, _ in entries)
+                    continue
+                for job, cache_key in entries:
+                    if cache is not None:
+                        cache.put(cache_key, choice['message']['content'])
+                    summary['completed'] += 1
+                    on_result(job, choice['message']['content'], None)
+
+    # Step 5: Requests without any result are left to the caller; the batches are consumed, so forget them
+    for entries in pending.values():
+        summary['incomplete'].extend(job for job, _ in entries)
+    os.remove(state_path)
+    return summary
@@ -0,0 +1,124 @@
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+# Benchmark harness for the diff engines of the Code Comparer (`diff_engines.py`) against `difflib`.
+# It diffs the original/revised pairs of the bundled Test.Dataset and a large generated file, checks that every diff
+# is valid, and reports the time and the number of changed lines (fewer is a tighter diff) of each engine.
+#
+#   python benchmarks/benchmark_diff.py --original-root /path/to/open-instruct-main
+#
+# Test.Dataset only ships the revised files; without --original-root, each original is rebuilt from its revised file
+# with a few seeded edits, which keeps the file sizes and contents realistic.
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_engines import DIFF_ALGORITHMS, diff_opcodes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_CSV = os.path.join(ROOT, 'Test.Dataset', 'open-instruct.Issues.csv')
+DEFAULT_REVISED_ROOT = os.path.join(ROOT, 'Test.Dataset', 'open-instruct-main.Revised')
+
+def edit_lines(rng, lines, edit_count):
+    # A copy of the lines with a few lines changed, added or removed
+    edited = list(lines)
+    for _ in range(edit_count):
+        index = rng.randrange(len(edited) + 1)
+        operation = rng.random()
+        if operation < 0.3 and index < len(edited):
+            del edited[index]
+        elif operation < 0.6 or index == len(edited):
+            edited.insert(index, f"# edited line {index}")
+        else:
+            edited[index] = edited[index] + "  # edited"
+    return edited
+
+def dataset_pairs(csv_path, revised_root, original_root, rng, edit_count):
+    # (name, original lines, revised lines) for every file of the CSV that has a revised copy
+    project = os.path.basename(revised_root.rstrip('/\\'))[:-len('.Revised')]
+    pairs = []
+    seen = set()
+    with open(csv_path, 'r', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            location = row['file_Location'].replace('\\', '/')
+            if location in seen or f"/{project}/" not in location:
+                continue
+            seen.add(location)
+            relative = location.split(f"/{project}/", 1)[1]
+            revised_path = os.path.join(revised_root, os.path.dirname(relative), f"Revised.{row['file_name']}")
+            if not os.path.exists(revised_path):
+                continue
+            with open(revised_path, 'r', encoding='utf-8', errors='replace') as revised_file:
+                revised = revised_file.read().splitlines()
+            original_path = os.path.join(original_root, relative) if original_root else None
+            if original_path and os.path.exists(original_path):
+                with open(original_path, 'r', encoding='utf-8', errors='replace') as original_file:
+                    original = original_file.read().splitlines()
+            else:
+                original = edit_lines(rng, revised, edit_count)
+            pairs.append((relative, original, revised))
+    return pairs
+
+def generated_pair(rng, line_count, edit_count):
+    # A large generated file made of a few repeated blocks, the worst case for `difflib`
+    original = []
+    for index in range(line_count // 8):
+        original += ["    {", f"        \"id\": {index % 50},", "        \"enabled\": true,", "        \"tags\": [],",
+                     "    },", "", f"    value_{rng.randrange(150)} = compute()", "return None"]
+    return f"generated ({len(original)} lines)", original, edit_lines(rng, original, edit_count)
+
+def changed_lines(original, revised, opcodes):
+    # Check that the opcodes rebuild the revised file, and count the lines they mark as changed
+    i = j = 0
+    changed = 0
+    for tag, i1, i2, j1, j2 in opcodes:
+        assert (i1, j1) == (i, j), "opcodes do not cover both files in order"
+        if tag == 'equal':
+            assert original[i1:i2] == revised[j1:j2], "an 'equal' opcode covers different lines"
+        else:
+            changed += max(i2 - i1, j2 - j1)
+        i, j = i2, j2
+    assert (i, j) == (len(original), len(revised)), "opcodes do not cover both files"
+    return changed
+
+def run(pairs, algorithm, budget):
+    # Total and slowest time, changed lines and fallbacks of one engine over all pairs
+    total = slowest = 0.0
+    changed = fallbacks = 0
+    for _, original, revised in pairs:
+        started = time.perf_counter()
+        opcodes, engine = diff_opcodes(original, revised, algorithm, budget)
+        seconds = time.perf_counter() - started
+        total += seconds
+        slowest = max(slowest, seconds)
+        changed += changed_lines(original, revised, opcodes)
+        fallbacks += engine != algorithm
+    return total, slowest, changed, fallbacks
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the diff engines against difflib.")
+    parser.add_argument('--csv', default=DEFAULT_CSV, help="Issue CSV listing the files")
+    parser.add_argument('--revised-root', default=DEFAULT_REVISED_ROOT, help="Folder of the Revised.* files")
+    parser.add_argument('--original-root', default=None, help="Folder of the original project (default: rebuild the originals)")
+    parser.add_argument('--edits', type=int, default=5, help="Edits per rebuilt original")
+    parser.add_argument('--large-lines', type=int, default=20000, help="Lines of the generated file (0 to skip it)")
+    parser.add_argument('--large-edits', type=int, default=200, help="Edits of the generated file")
+    parser.add_argument('--budget', type=float, default=None, help="Time budget per engine in seconds (default: none)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cases = [('Test.Dataset', dataset_pairs(args.csv, args.revised_root, args.original_root, rng, args.edits))]
+    if args.large_lines:
+        name, original, revised = generated_pair(rng, args.large_lines, args.large_edits)
+        cases.append((name, [(name, original, revised)]))
+
+    for case, pairs in cases:
+        print(f"{case}: {len(pairs)} pairs, {sum(len(original) for _, original, _ in pairs)} original lines")
+        print(f"  {'engine':<10} {'total s':>9} {'slowest s':>10} {'changed lines':>14} {'fallbacks':>10}")
+        for algorithm in DIFF_ALGORITHMS:
+            total, slowest, changed, fallbacks = run(pairs, algorithm, args.budget)
+            print(f"  {algorithm:<10} {total:>9.3f} {slowest:>10.3f} {changed:>14} {fallbacks:>10}")
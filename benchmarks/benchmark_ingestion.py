@@ -0,0 +1,132 @@
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+try:
+    import resource  # Peak RSS is only available on Unix-like systems
+except ImportError:
+    resource = None
+
+# Benchmark harness for the SonarQube ingestion path in `app.py` (`get_all_issues` and `save_csv_file`).
+# It runs against the bundled fake server, so no SonarQube instance is needed.
+#
+#   python benchmarks/benchmark_ingestion.py --sizes 1000 10000 100000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_sonarqube import start_fake_sonarqube
+
+PROJECT_KEY = 'fake-project'
+
+def serve(issue_count, seed, latency_ms, url_queue, stop_event):
+    # Run the fake server in its own process so it does not count towards the measured RSS
+    server = start_fake_sonarqube(issue_count, PROJECT_KEY, seed, latency_ms)
+    url_queue.put(server.url)
+    stop_event.wait()
+    server.shutdown()
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_case(url, max_workers, streaming, result_queue):
+    import app
+
+    # Step 1: Time every page request by wrapping the page fetcher used by the ingestion functions
+    latencies = []
+    fetch_issues_page = app.fetch_issues_page
+
+    def timed_fetch_issues_page(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fetch_issues_page(*args, **kwargs)
+        finally:
+            latencies.append(time.perf_counter() - started)
+
+    app.fetch_issues_page = timed_fetch_issues_page
+
+    with tempfile.TemporaryDirectory() as output_directory:
+        csv_path = os.path.join(output_directory, 'issues.csv')
+
+        # Step 2: Fetch the issues and write the CSV file
+        started = time.perf_counter()
+        if streaming:
+            issue_count = 0
+
+            def counted(issues):
+                nonlocal issue_count
+                for issue in issues:
+                    issue_count += 1
+                    yield issue
+
+            app.save_csv_file(counted(app.iter_all_issues(url, 'benchmark-token', PROJECT_KEY, max_workers)),
+                              csv_path, PROJECT_KEY + ':', '/project/')
+            fetch_seconds = save_seconds = time.perf_counter() - started
+        else:
+            issues = app.get_all_issues(url, 'benchmark-token', PROJECT_KEY, max_workers)
+            fetch_seconds = time.perf_counter() - started
+            issue_count = len(issues)
+            started = time.perf_counter()
+            app.save_csv_file(issues, csv_path, PROJECT_KEY + ':', '/project/')
+            save_seconds = time.perf_counter() - started
+
+    # Step 3: Report the measurements back to the parent process
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None
+    result_queue.put({
+        'issues': issue_count,
+        'requests': len(latencies),
+        'fetch_seconds': fetch_seconds,
+        'save_seconds': save_seconds,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p90_ms': percentile(latencies, 0.90) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'mean_ms': statistics.mean(latencies) * 1000 if latencies else 0.0,
+        'peak_rss_mb': peak_rss_mb,
+    })
+
+def run_benchmark(issue_count, seed, latency_ms, max_workers, streaming):
+    # Each size gets a fresh server and a fresh client process, so peak RSS is measured per size
+    url_queue = multiprocessing.Queue()
+    stop_event = multiprocessing.Event()
+    server_process = multiprocessing.Process(target=serve, args=(issue_count, seed, latency_ms, url_queue, stop_event))
+    server_process.start()
+    try:
+        url = url_queue.get(timeout=300)
+        result_queue = multiprocessing.Queue()
+        client_process = multiprocessing.Process(target=run_case, args=(url, max_workers, streaming, result_queue))
+        client_process.start()
+        result = result_queue.get()
+        client_process.join()
+        return result
+    finally:
+        stop_event.set()
+        server_process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SonarQube issue ingestion against the fake server.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000], help="Synthetic issue counts")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Artificial latency added to every request")
+    parser.add_argument('--max-workers', type=int, default=8, help="Concurrency cap passed to the fetcher")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Pipe iter_all_issues straight into save_csv_file instead of materializing the list")
+    args = parser.parse_args()
+
+    print(f"{'issues':>8} {'requests':>8} {'fetch s':>8} {'issues/s':>10} {'csv s':>7} "
+          f"{'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'peak RSS MB':>11}")
+    for issue_count in args.sizes:
+        result = run_benchmark(issue_count, args.seed, args.latency_ms, args.max_workers, args.streaming)
+        total_seconds = result['fetch_seconds'] + (0 if args.streaming else result['save_seconds'])
+        peak_rss = f"{result['peak_rss_mb']:.1f}" if result['peak_rss_mb'] is not None else 'n/a'
+        print(f"{result['issues']:>8} {result['requests']:>8} {result['fetch_seconds']:>8.2f} "
+              f"{result['issues'] / total_seconds:>10.0f} {result['save_seconds']:>7.2f} "
+              f"{result['p50_ms']:>7.1f} {result['p90_ms']:>7.1f} {result['p99_ms']:>7.1f} {peak_rss:>11}")
+
+if __name__ == '__main__':
+    main()
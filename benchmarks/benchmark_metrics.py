@@ -0,0 +1,78 @@
+import argparse
+import os
+import random
+import sys
+import time
+import warnings
+
+# Benchmark harness for the comparison metrics (`metrics_engine.py`).
+# It scores synthetic revisions (a few edited lines per file, like real revisions) serially and on the process pool,
+# and times the former per-pair implementation (a new RougeScorer per call) on a sample for comparison.
+#
+#   python benchmarks/benchmark_metrics.py --files 2000 --lines 300
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics_engine import score_pairs
+
+WORDS = ['value', 'result', 'items', 'index', 'config', 'response', 'total', 'name', 'path', 'data']
+
+def make_pair(rng, line_count, edit_count):
+    # An original file and a revision of it with a few lines changed, added or removed
+    original = [f"{'    ' * rng.randint(0, 2)}{rng.choice(WORDS)}_{i} = {rng.choice(WORDS)}({rng.randint(0, 99)})\n"
+                for i in range(line_count)]
+    revised = list(original)
+    for _ in range(edit_count):
+        index = rng.randrange(len(revised))
+        operation = rng.random()
+        if operation < 0.3:
+            del revised[index]
+        elif operation < 0.6:
+            revised.insert(index, f"checked_{index} = validate({rng.choice(WORDS)})\n")
+        else:
+            revised[index] = revised[index].replace('(', '(safe_', 1)
+    return original, revised
+
+def reference_metrics(original_lines, revised_lines):
+    # The per-pair implementation the engine replaced, for timing only
+    from nltk.translate.bleu_score import sentence_bleu
+    from rouge_score import rouge_scorer
+    original_tokens = [line.strip() for line in original_lines]
+    revised_tokens = [line.strip() for line in revised_lines]
+    bleu = sentence_bleu([original_tokens], revised_tokens)
+    scorer = rouge_scorer.RougeScorer(['rouge1', 'rougeL'], use_stemmer=True)
+    return bleu, scorer.score("\n".join(original_tokens), "\n".join(revised_tokens))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the comparison metrics over many file pairs.")
+    parser.add_argument('--files', type=int, default=2000, help="Number of original/revised pairs")
+    parser.add_argument('--lines', type=int, default=300, help="Lines per file")
+    parser.add_argument('--edits', type=int, default=5, help="Edited lines per revision")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--reference-sample', type=int, default=5, help="Pairs timed with the former implementation")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    warnings.filterwarnings('ignore')  # BLEU warns about missing n-gram overlaps on short files
+
+    rng = random.Random(args.seed)
+    pairs = [make_pair(rng, args.lines, args.edits) for _ in range(args.files)]
+
+    started = time.perf_counter()
+    serial = score_pairs(pairs, max_workers=1)
+    serial_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    pooled = score_pairs(pairs, max_workers=args.workers)
+    pooled_seconds = time.perf_counter() - started
+    assert pooled == serial
+
+    print(f"{args.files} pairs of {args.lines} lines")
+    print(f"metrics engine, serial: {serial_seconds:.2f} s ({args.files / serial_seconds:.0f} pairs/s)")
+    print(f"metrics engine, pool:   {pooled_seconds:.2f} s ({args.files / pooled_seconds:.0f} pairs/s)")
+
+    if args.reference_sample:
+        started = time.perf_counter()
+        for original, revised in pairs[:args.reference_sample]:
+            reference_metrics(original, revised)
+        per_pair = (time.perf_counter() - started) / args.reference_sample
+        print(f"former implementation:  {per_pair:.3f} s per pair, about {per_pair * args.files:.0f} s for {args.files} pairs")
@@ -0,0 +1,190 @@
+import argparse
+import difflib
+import os
+import random
+import sys
+import time
+
+# Reproducible checks of the diff engines (`diff_engines.py`), the patch applier (`patch_edits.py`) and the stitching of
+# continued completions (`continuation.py`) on seeded random inputs. Every check rebuilds the expected text from the
+# output under test, so a failing case is printed with its seed and stops the run with a non-zero exit status.
+#
+#   python benchmarks/check_engines.py --cases 3000
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from diff_engines import DIFF_ALGORITHMS, DIFF_ENGINES, diff_opcodes, format_unified_diff
+from patch_edits import PatchError, apply_patch
+from continuation import complete_with_continuation, stitch
+from llm_backends import Completion
+from benchmark_diff import changed_lines, edit_lines
+
+class CheckFailed(Exception):
+    pass
+
+def check(condition, message, seed):
+    if not condition:
+        raise CheckFailed(f"{message} (seed {seed})")
+
+def random_lines(rng, max_lines, alphabet):
+    # Lines drawn from a small alphabet, so the files repeat lines like real code does (the hard case for diffs)
+    return [f"line {rng.randrange(alphabet)}" for _ in range(rng.randrange(max_lines + 1))]
+
+def numbered_text(rng, max_lines):
+    # Text whose lines are all different, so a hunk or an overlap can only match in one place
+    return ''.join(f"value_{index} = compute({rng.randrange(100)})\n" for index in range(rng.randrange(1, max_lines + 1)))
+
+def lcs_length(a, b):
+    # Length of the longest common subsequence, by dynamic programming (only for small inputs)
+    previous = [0] * (len(b) + 1)
+    for line in a:
+        current = [0]
+        for index, other in enumerate(b):
+            current.append(previous[index] + 1 if line == other else max(previous[index + 1], current[-1]))
+        previous = current
+    return previous[-1]
+
+def apply_unified_diff(a, diff):
+    # Rebuild the second file from the first one and the hunks of a unified diff, checking every context and removed line
+    result = []
+    cursor = 0
+    for line in diff:
+        if line.startswith(('--- ', '+++ ')):
+            continue
+        if line.startswith('@@'):
+            old_range = line.split()[1][1:]
+            start = int(old_range.split(',')[0])
+            count = int(old_range.split(',')[1]) if ',' in old_range else 1
+            start = start if count == 0 else start - 1  # An empty range names the line before it
+            result.extend(a[cursor:start])
+            cursor = start
+        elif line.startswith('+'):
+            result.append(line[1:])
+        else:
+            if a[cursor] != line[1:]:
+                raise ValueError(f"line {cursor + 1} of the diff does not match the original")
+            if line.startswith(' '):
+                result.append(a[cursor])
+            cursor += 1
+    return result + a[cursor:]
+
+# Function to check that every engine's opcodes and hunks rebuild the second file, and that Myers' diffs are minimal
+def check_diff_engines(rng, cases):
+    engines = DIFF_ALGORITHMS + ['coarse']
+    for case in range(cases):
+        seed = rng.randrange(1 << 30)
+        case_rng = random.Random(seed)
+        a = random_lines(case_rng, 40, case_rng.choice([3, 10, 50]))
+        b = edit_lines(case_rng, a, case_rng.randrange(8)) if a and case_rng.random() < 0.8 else random_lines(case_rng, 40, 10)
+        for engine in engines:
+            opcodes, used = diff_opcodes(a, b, engine, None)
+            check(used == engine, f"{engine} fell back to {used} without a time budget", seed)
+            try:
+                changed = changed_lines(a, b, opcodes)
+                rebuilt = apply_unified_diff(a, format_unified_diff(a, b, opcodes, lineterm=''))
+            except (AssertionError, ValueError, IndexError) as e:
+                raise CheckFailed(f"{engine}: {e} (seed {seed})")
+            check(rebuilt == b, f"the {engine} hunks do not rebuild the revised file", seed)
+            if engine == 'myers':
+                minimal = len(a) + len(b) - 2 * lcs_length(a, b)
+                removed_added = sum((i2 - i1) + (j2 - j1) for tag, i1, i2, j1, j2 in opcodes if tag != 'equal')
+                check(removed_added == minimal, f"myers changed {removed_added} lines, the minimum is {minimal}", seed)
+            if engine == 'difflib':
+                expected = list(difflib.unified_diff(a, b, 'a', 'b', lineterm=''))
+                check(format_unified_diff(a, b, opcodes, 'a', 'b', lineterm='') == expected,
+                      "the difflib engine is not formatted like difflib.unified_diff", seed)
+    return f"{cases} cases x {len(engines)} engines"
+
+# Function to check that the time budget is shared by the fallback engines
+def check_time_budget(rng, budget):
+    a = [f"line {rng.randrange(40)}" for _ in range(60000)]
+    b = edit_lines(rng, a, 6000)
+    results = []
+    for engine in [name for name in DIFF_ENGINES if name not in ('difflib', 'coarse')]:
+        started = time.perf_counter()
+        opcodes, used = diff_opcodes(a, b, engine, budget)
+        seconds = time.perf_counter() - started
+        changed_lines(a, b, opcodes)
+        results.append(f"{engine} -> {used} in {seconds:.2f} s")
+    return f"budget {budget} s: " + ', '.join(results)
+
+# Function to check that diffs apply, also with wrong line numbers, and that diffs of other code are refused
+def check_patches(rng, cases):
+    for case in range(cases):
+        seed = rng.randrange(1 << 30)
+        case_rng = random.Random(seed)
+        original = numbered_text(case_rng, 60)
+        revised_lines = edit_lines(case_rng, original.splitlines(), case_rng.randrange(1, 6))
+        revised = ''.join(line + '\n' for line in revised_lines)
+        diff = '\n'.join(difflib.unified_diff(original.splitlines(), revised_lines, 'a', 'b', n=2, lineterm=''))
+        try:
+            check(apply_patch(original, diff) == revised, "the diff does not rebuild the revised file", seed)
+
+            # Models get line numbers wrong: move every hunk header by the same few lines
+            shift = case_rng.randint(-3, 3)
+            shifted = '\n'.join(shift_hunk_header(line, shift) for line in diff.splitlines())
+            check(apply_patch(original, shifted) == revised, f"the diff does not apply with line numbers off by {shift}", seed)
+        except PatchError as e:
+            raise CheckFailed(f"{e} (seed {seed})")
+
+        # A diff made for other code must be refused instead of being applied somewhere
+        if diff:
+            try:
+                apply_patch(numbered_text(case_rng, 60).replace('value_', 'other_'), diff)
+            except PatchError:
+                pass
+            else:
+                raise CheckFailed(f"a diff of other code was applied (seed {seed})")
+    return f"{cases} cases"
+
+def shift_hunk_header(line, shift):
+    if not line.startswith('@@'):
+        return line
+    _, old_range, new_range, _ = line.split(' ', 3)
+    start, _, count = old_range[1:].partition(',')
+    return f"@@ -{max(1, int(start) + shift)}{',' + count if count else ''} {new_range} @@"
+
+# Function to check that truncated completions and their continuations are stitched back into the full answer
+def check_stitching(rng, cases):
+    for case in range(cases):
+        seed = rng.randrange(1 << 30)
+        case_rng = random.Random(seed)
+        full = numbered_text(case_rng, 80)
+        limit = case_rng.randint(20, 400)  # Characters per answer, like `max_tokens`
+
+        def complete(messages):
+            # A model that is cut off after `limit` characters and repeats the end of what it already sent
+            sent = messages[-2]['content'] if len(messages) > 1 else ''
+            unfinished_line = len(sent) - sent.rfind('\n') - 1
+            repeat = min(len(sent), case_rng.choice([0, unfinished_line, 10, 30]))
+            start = len(sent) - repeat
+            piece = full[start:start + limit + repeat]
+            return Completion(piece, 'length' if start + len(piece) < len(full) else 'stop')
+
+        completion, _ = complete_with_continuation(complete, [{'role': 'user', 'content': 'revise'}], max_continuations=10000)
+        check(completion.content == full, "the stitched answer differs from the full answer", seed)
+
+        # A continuation without any repeated text is appended as it is
+        middle = case_rng.randrange(1, len(full))
+        check(stitch(full[:middle], full[middle:]) == full, "text was dropped from a continuation without overlap", seed)
+    return f"{cases} cases"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check the diff engines, the patch applier and continuation stitching.")
+    parser.add_argument('--cases', type=int, default=1000, help="Random cases per check")
+    parser.add_argument('--budget', type=float, default=0.5, help="Time budget of the fallback check in seconds (0 to skip it)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    checks = [('diff engines', lambda: check_diff_engines(rng, args.cases)),
+              ('patch applier', lambda: check_patches(rng, args.cases)),
+              ('continuation stitching', lambda: check_stitching(rng, args.cases))]
+    if args.budget:
+        checks.append(('time budget', lambda: check_time_budget(rng, args.budget)))
+    try:
+        for name, run_check in checks:
+            print(f"{name}: OK, {run_check()}")
+    except CheckFailed as e:
+        print(f"{name}: FAILED, {e}")
+        sys.exit(1)
@@ -0,0 +1,89 @@
+import argparse
+import os
+import sys
+import tempfile
+import threading
+
+# Checks of the shared session store (`session_store.py`) together with the job queue (`job_queue.py`): uploaded issue
+# sets must survive a purge as long as a session or an unfinished job still refers to them, also while other workers
+# upload and purge at the same time. A failing check stops the run with a non-zero exit status.
+#
+#   python benchmarks/check_session_store.py --uploads 200
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionStore
+from job_queue import JobQueue
+
+class CheckFailed(Exception):
+    pass
+
+def check(condition, message):
+    if not condition:
+        raise CheckFailed(message)
+
+def issue_set(name, rows=3):
+    # A parsed CSV like `load_issue_csv` returns it: every row of one file, indexed by that file
+    csv_lines = [{'file_Location': f"{name}.py", 'message': f"issue {index}"} for index in range(rows)]
+    return csv_lines, {'group_end': [rows] * rows, 'first_row': {f"{name}.py": 0}}
+
+def upload(session_store, job_queue, session_id, name):
+    # The upload of a CSV, as the reviser and the comparer do it
+    state = session_store.get_state(session_id)
+    state['current_line_index'] = 0
+    session_store.purge_expired(keep=job_queue.unfinished_params('issue_set_id'))
+    return session_store.save_issue_set(session_id, state, *issue_set(name))
+
+# Function to check that a purge keeps the issue sets of queued and running jobs, and drops them once the jobs finish
+def check_purge_with_jobs(session_store, job_queue):
+    first = upload(session_store, job_queue, 'reviewer', 'first')
+    job_id = job_queue.submit('revise_project', {'issue_set_id': first})
+
+    # The reviewer moves on to another CSV while the job is still queued, then the job starts and the session expires
+    upload(session_store, job_queue, 'reviewer', 'second')
+    check(session_store.get_issue_rows(first), "the issue set of a queued job was purged")
+    job_queue.claim()
+    session_store.purge_expired(keep=job_queue.unfinished_params('issue_set_id'), max_age=-1)
+    check(session_store.get_issue_rows(first), "the issue set of a running job was purged")
+
+    job_queue.complete(job_id, {})
+    session_store.purge_expired(keep=job_queue.unfinished_params('issue_set_id'))
+    check(not session_store.get_issue_rows(first), "the issue set of a finished job was kept")
+    return "queued, running and finished jobs"
+
+# Function to check that concurrent uploads and purges never leave a session pointing to a purged issue set
+def check_concurrent_uploads(session_store, job_queue, uploads, workers):
+    failures = []
+
+    def reviewer(worker):
+        for index in range(uploads):
+            session_id = f"reviewer {worker}"
+            issue_set_id = upload(session_store, job_queue, session_id, f"{worker}-{index}")
+            if session_store.get_state(session_id)['issue_set_id'] == issue_set_id and not session_store.get_issue_rows(issue_set_id):
+                failures.append(f"the upload {index} of reviewer {worker} was purged")
+
+    threads = [threading.Thread(target=reviewer, args=(worker,)) for worker in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    check(not failures, failures[0] if failures else '')
+    return f"{workers} reviewers x {uploads} uploads"
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Check that purging the session store keeps the issue sets still in use.")
+    parser.add_argument('--uploads', type=int, default=100, help="Uploads per reviewer in the concurrency check")
+    parser.add_argument('--workers', type=int, default=4, help="Reviewers uploading at the same time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        session_store = SessionStore(os.path.join(directory, 'sessions.sqlite3'), {'issue_set_id': None, 'current_line_index': 0})
+        job_queue = JobQueue(os.path.join(directory, 'jobs.sqlite3'))
+        checks = [('purge with jobs', lambda: check_purge_with_jobs(session_store, job_queue)),
+                  ('concurrent uploads', lambda: check_concurrent_uploads(session_store, job_queue, args.uploads, args.workers))]
+        try:
+            for name, run_check in checks:
+                print(f"{name}: OK, {run_check()}")
+        except CheckFailed as e:
+            print(f"{name}: FAILED, {e}")
+            sys.exit(1)
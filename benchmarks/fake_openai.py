@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Deterministic stand-in for OpenAI's `/v1/chat/completions` endpoint, with and without `stream=True`.
+# The completion depends only on the model and the messages, so a streamed and a non-streamed request for the
+# same prompt return exactly the same text; streamed completions are sent as server-sent events, piece by piece.
+# Point the `openai` package at it with `openai.api_base = server.url + "/v1"`.
+# Like a real model, completions are cut off after `max_tokens` pieces (finish_reason "length"), and a request that sends
+# a partial answer back as an assistant message gets the rest of it, optionally repeating the last `continuation_overlap`
+# characters to exercise the overlap guard of `continuation.py`.
+
+WORDS = ['value', 'result', 'items', 'index', 'config', 'response', 'total', 'name', 'path', 'data']
+
+def fake_completion(model, messages, line_count=40):
+    # Build a short, code-like completion seeded by a hash of the request
+    seed = hashlib.sha256(json.dumps({'model': model, 'messages': messages}, sort_keys=True).encode('utf-8')).hexdigest()
+    rng = random.Random(seed)
+    lines = []
+    for i in range(line_count):
+        indent = '    ' * rng.randint(0, 2)
+        lines.append(f"{indent}{rng.choice(WORDS)}_{i} = {rng.choice(WORDS)}({rng.randint(0, 99)})  # revised")
+    return '\n'.join(lines) + '\n'
+
+def split_pieces(text):
+    # Split the completion into token-sized pieces (a word with its leading whitespace), like the real stream
+    pieces = []
+    current = ''
+    for character in text:
+        if current and not character.isspace() and current[-1].isspace():
+            pieces.append(current)
+            current = ''
+        current += character
+    if current:
+        pieces.append(current)
+    return pieces
+
+class FakeOpenAI:
+    def __init__(self, line_count=40, first_token_ms=0, token_ms=0, continuation_overlap=0):
+        self.line_count = line_count
+        self.first_token_ms = first_token_ms  # Delay before the first piece (or the whole non-streamed response)
+        self.token_ms = token_ms              # Delay between streamed pieces
+        self.continuation_overlap = continuation_overlap  # Characters of the partial answer repeated by a continuation
+        self.request_count = 0
+        self._lock = threading.Lock()
+
+    def answer(self, model, messages, max_tokens=None):
+        # Return the pieces of the completion and its finish reason
+        assistant_index = next((i for i, message in enumerate(messages) if message.get('role') == 'assistant'), None)
+        if assistant_index is None:
+            content = fake_completion(model, messages, self.line_count)
+        else:
+            partial = messages[assistant_index].get('content', '')
+            full = fake_completion(model, messages[:assistant_index], self.line_count)
+            content = full[max(0, len(partial) - self.continuation_overlap):]
+        pieces = split_pieces(content)
+        if max_tokens is not None and len(pieces) > max_tokens:
+            return pieces[:max_tokens], 'length'
+        return pieces, 'stop'
+
+    def completion_chunk(self, model, delta, finish_reason=None):
+        return {'id': 'chatcmpl-fake', 'object': 'chat.completion.chunk', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]}
+
+    def completion(self, model, content, finish_reason='stop'):
+        return {'id': 'chatcmpl-fake', 'object': 'chat.completion', 'created': int(time.time()), 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': finish_reason}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(split_pieces(content)), 'total_tokens': 0}}
+
+def make_handler(fake):
+    class FakeOpenAIHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def send_json(self, status, body):
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def send_event(self, data):
+            # One server-sent event in one HTTP chunk
+            event = f"data: {data}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(event):x}\r\n".encode('ascii') + event + b"\r\n")
+            self.wfile.flush()
+
+        def do_POST(self):
+            if self.path.rstrip('/') != '/v1/chat/completions':
+                self.send_json(404, {'error': {'message': 'Unknown url'}})
+                return
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            with fake._lock:
+                fake.request_count += 1
+            model = request.get('model', 'gpt-4o-mini')
+            pieces, finish_reason = fake.answer(model, request.get('messages', []), request.get('max_tokens'))
+            if fake.first_token_ms:
+                time.sleep(fake.first_token_ms / 1000)
+
+            if not request.get('stream'):
+                self.send_json(200, fake.completion(model, ''.join(pieces), finish_reason))
+                return
+
+            # Stream the completion piece by piece, then the finish reason and the end marker
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+            self.send_event(json.dumps(fake.completion_chunk(model, {'role': 'assistant', 'content': ''})))
+            for piece in pieces:
+                if fake.token_ms:
+                    time.sleep(fake.token_ms / 1000)
+                self.send_event(json.dumps(fake.completion_chunk(model, {'content': piece})))
+            self.send_event(json.dumps(fake.completion_chunk(model, {}, finish_reason)))
+            self.send_event('[DONE]')
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, format, *args):
+            pass  # Keep test output clean
+
+    return FakeOpenAIHandler
+
+def start_fake_openai(line_count=40, first_token_ms=0, token_ms=0, port=0, continuation_overlap=0):
+    # Start the server on a background thread and return it; `server.url` is the base URL of the server
+    fake = FakeOpenAI(line_count, first_token_ms, token_ms, continuation_overlap)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    server.fake = fake
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve deterministic chat completions on /v1/chat/completions.")
+    parser.add_argument('--lines', type=int, default=40, help="Number of lines in every completion")
+    parser.add_argument('--first-token-ms', type=float, default=0, help="Delay before the first token")
+    parser.add_argument('--token-ms', type=float, default=0, help="Delay between streamed tokens")
+    parser.add_argument('--port', type=int, default=9098, help="Port to listen on")
+    parser.add_argument('--continuation-overlap', type=int, default=0,
+                        help="Characters of a truncated answer repeated at the start of its continuation")
+    args = parser.parse_args()
+
+    server = start_fake_openai(args.lines, args.first_token_ms, args.token_ms, args.port, args.continuation_overlap)
+    print(f"Fake OpenAI serving chat completions at {server.url}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,197 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+# Deterministic, seeded stand-in for SonarQube's `/api/issues/search` endpoint.
+# It serves synthetic issues with the same shape as a real server (paging, the 10,000-result cap,
+# severity/rule/directory/date filters and facets), so the ingestion path can be benchmarked without SonarQube.
+
+RESULT_CAP = 10000
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S%z'
+SEVERITIES = ['INFO', 'MINOR', 'MAJOR', 'CRITICAL', 'BLOCKER']
+TYPES = ['CODE_SMELL', 'BUG', 'VULNERABILITY']
+MESSAGES = [
+    "Remove this commented out code.",
+    "Rename this local variable to match the regular expression ^[_a-z][a-z0-9_]*$.",
+    "Remove the unused local variable \"result\".",
+    "Define a constant instead of duplicating this literal \"utf-8\" 3 times.",
+    "Refactor this function to reduce its Cognitive Complexity from 23 to the 15 allowed.",
+    "Specify an exception class to catch or reraise the exception.",
+    "Make sure this weak hash algorithm is not used in a sensitive context here.",
+    "Visible, non-interactive elements with click handlers must have at least one keyboard listener.",
+]
+EXTENSIONS = ['py', 'js', 'jsx', 'yaml', 'java']
+
+def generate_issues(issue_count, project_key='fake-project', seed=0):
+    # Step 1: Seed a private random generator so every run produces the same issues
+    rng = random.Random(seed)
+
+    # Step 2: Build a fixed pool of directories, files and rules to draw from
+    directories = [f"src/module_{i}" + (f"/sub_{i % 7}" if i % 3 else "") for i in range(max(1, issue_count // 2000) + 10)]
+    files = [f"{rng.choice(directories)}/file_{i}.{rng.choice(EXTENSIONS)}" for i in range(max(1, issue_count // 20))]
+    rules = [f"{language}:S{rng.randint(100, 6000)}" for language in ('python', 'javascript', 'yaml', 'java') for _ in range(10)]
+    start = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+    # Step 3: Generate the issues, oldest first
+    issues = []
+    for i in range(issue_count):
+        path = rng.choice(files)
+        created = start + timedelta(seconds=i * 37 + rng.randint(0, 36))
+        issue = {
+            'key': f"AY{seed:04d}{i:010d}",
+            'rule': rng.choice(rules),
+            'severity': rng.choice(SEVERITIES),
+            'component': f"{project_key}:{path}",
+            'project': project_key,
+            'line': rng.randint(1, 400),
+            'hash': f"{rng.getrandbits(128):032x}",
+            'textRange': {},
+            'flows': [],
+            'status': 'OPEN',
+            'message': rng.choice(MESSAGES),
+            'effort': f"{rng.choice([1, 2, 5, 10, 20])}min",
+            'tags': [],
+            'creationDate': created.strftime(DATE_FORMAT),
+            'updateDate': (created + timedelta(hours=rng.randint(0, 48))).strftime(DATE_FORMAT),
+            'type': rng.choice(TYPES),
+            'scope': 'MAIN',
+        }
+        issue['textRange'] = {'startLine': issue['line'], 'endLine': issue['line'], 'startOffset': 0, 'endOffset': 10}
+        issues.append(issue)
+    return issues
+
+def issue_directory(issue):
+    path = issue['component'].split(':', 1)[-1]
+    return path.rsplit('/', 1)[0] if '/' in path else '/'
+
+class FakeSonarQube:
+    def __init__(self, issue_count, project_key='fake-project', seed=0, latency_ms=0):
+        self.issues = generate_issues(issue_count, project_key, seed)
+        self.latency_ms = latency_ms
+        self.request_count = 0
+        self._query_cache = {}
+        self._lock = threading.Lock()
+
+    def query(self, params):
+        # Filter and sort the issues for one query; results are cached because the data never changes
+        cache_key = tuple(sorted((name, value) for name, value in params.items()
+                                 if name in ('severities', 'rules', 'directories', 'createdAfter',
+                                             'createdBefore', 's', 'asc', 'resolved')))
+        with self._lock:
+            if cache_key in self._query_cache:
+                return self._query_cache[cache_key]
+
+        issues = self.issues
+        if 'severities' in params:
+            issues = [issue for issue in issues if issue['severity'] in params['severities'].split(',')]
+        if 'rules' in params:
+            issues = [issue for issue in issues if issue['rule'] in params['rules'].split(',')]
+        if 'directories' in params:
+            issues = [issue for issue in issues if issue_directory(issue) in params['directories'].split(',')]
+        if 'createdAfter' in params:
+            created_after = datetime.strptime(params['createdAfter'], DATE_FORMAT)
+            issues = [issue for issue in issues if datetime.strptime(issue['creationDate'], DATE_FORMAT) >= created_after]
+        if 'createdBefore' in params:
+            created_before = datetime.strptime(params['createdBefore'], DATE_FORMAT)
+            issues = [issue for issue in issues if datetime.strptime(issue['creationDate'], DATE_FORMAT) < created_before]
+        if params.get('s') in ('CREATION_DATE', 'UPDATE_DATE'):
+            field = 'creationDate' if params['s'] == 'CREATION_DATE' else 'updateDate'
+            issues = sorted(issues, key=lambda issue: issue[field], reverse=params.get('asc') == 'false')
+
+        with self._lock:
+            self._query_cache[cache_key] = issues
+        return issues
+
+    def search(self, params):
+        # Step 1: Validate paging the same way SonarQube does
+        page_size = int(params.get('ps', 100))
+        page_number = int(params.get('p', 1))
+        if page_size * page_number > RESULT_CAP:
+            return 400, {'errors': [{'msg': f"Can return only the first {RESULT_CAP} results. "
+                                            f"{page_size * page_number}th result asked."}]}
+
+        # Step 2: Select the requested page
+        issues = self.query(params)
+        body = {
+            'total': len(issues),
+            'p': page_number,
+            'ps': page_size,
+            'paging': {'pageIndex': page_number, 'pageSize': page_size, 'total': len(issues)},
+            'issues': issues[(page_number - 1) * page_size:page_number * page_size],
+            'components': [],
+            'facets': [],
+        }
+
+        # Step 3: Add the requested facets
+        facet_fields = {'severities': 'severity', 'rules': 'rule', 'directories': None}
+        for facet in filter(None, params.get('facets', '').split(',')):
+            if facet not in facet_fields:
+                continue
+            if facet_fields[facet]:
+                counts = Counter(issue[facet_fields[facet]] for issue in issues)
+            else:
+                counts = Counter(issue_directory(issue) for issue in issues)
+            body['facets'].append({'property': facet,
+                                   'values': [{'val': value, 'count': count} for value, count in counts.most_common()]})
+        return 200, body
+
+def make_handler(fake):
+    class FakeSonarQubeHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # Keep-alive, like a real server
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/api/issues/search':
+                status, body = 404, {'errors': [{'msg': 'Unknown url'}]}
+            else:
+                params = {name: values[0] for name, values in parse_qs(url.query).items()}
+                with fake._lock:
+                    fake.request_count += 1
+                if fake.latency_ms:
+                    time.sleep(fake.latency_ms / 1000)
+                status, body = fake.search(params)
+
+            payload = json.dumps(body).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # Keep benchmark output clean
+
+    return FakeSonarQubeHandler
+
+def start_fake_sonarqube(issue_count, project_key='fake-project', seed=0, latency_ms=0, port=0):
+    # Start the server on a background thread and return it; `server.url` is the base URL to pass to `get_all_issues`
+    fake = FakeSonarQube(issue_count, project_key, seed, latency_ms)
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(fake))
+    server.daemon_threads = True
+    server.fake = fake
+    server.url = f"http://127.0.0.1:{server.server_port}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve synthetic SonarQube issues on /api/issues/search.")
+    parser.add_argument('--issues', type=int, default=10000, help="Number of synthetic issues to serve")
+    parser.add_argument('--project-key', default='fake-project', help="Project key used in issue components")
+    parser.add_argument('--seed', type=int, default=0, help="Seed for the synthetic data")
+    parser.add_argument('--latency-ms', type=float, default=0, help="Artificial latency added to every request")
+    parser.add_argument('--port', type=int, default=9099, help="Port to listen on (SonarQube in the README uses 9099)")
+    args = parser.parse_args()
+
+    server = start_fake_sonarqube(args.issues, args.project_key, args.seed, args.latency_ms, args.port)
+    print(f"Fake SonarQube serving {args.issues} issues for '{args.project_key}' at {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,207 @@
+import hashlib
+import json
+import os
+import statistics
+import time
+from metrics_engine import score_pair, run_batched
+from diff_engines import diff_opcodes, format_unified_diff, DEFAULT_DIFF_ALGORITHM, DEFAULT_DIFF_TIME_BUDGET
+
+# Project-wide comparison of original files and their `Revised.*` copies.
+# Every original/revised pair of an uploaded CSV is diffed (see `diff_engines.py`) and scored in worker processes,
+# and the rows are summed up into a sortable report with aggregates and outliers. Reports are cached on disk under a
+# key built from the paths, sizes and modification times of all files, so a report is only computed again when a file
+# changed.
+
+REPORT_VERSION = 2  # Part of the cache key; increase it when the rows or the summary change
+REPORT_DIRECTORY_NAME = '.wall_reports'
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+METRIC_KEYS = ['precision', 'recall', 'f1_score', 'exact_match', 'bleu_score', 'rouge1_fmeasure', 'rougeL_fmeasure']
+COUNT_KEYS = ['original_lines', 'revised_lines', 'added_lines', 'removed_lines', 'hunks']
+SORT_KEYS = ['file_name', 'status', 'outliers'] + COUNT_KEYS + METRIC_KEYS
+OUTLIER_METRICS = ['f1_score', 'bleu_score', 'rougeL_fmeasure']  # A file is an outlier if any of these is unusually low
+OUTLIER_IQR_FACTOR = 1.5  # Tukey's fence: below the first quartile by this many interquartile ranges
+
+# Function to build the path of the revised copy of a file, as the Code Comparer looks it up
+def revised_comparison_path(original_file_path, original_file_name):
+    # Adjust this line according to your folder structure if necessary: the "WALL" directory of the original files
+    # is replaced by "WALL.Revised", and "Revised." is prepended to the file name
+    revised_directory = os.path.dirname(original_file_path).replace("WALL", "WALL.Revised")
+    return os.path.join(revised_directory, f"Revised.{original_file_name}").replace("\\", "/")
+
+# Function to list the original/revised pairs of the files in the CSV lines, once per file
+def comparison_pairs(lines):
+    pairs = []
+    seen = set()
+    for line in lines:
+        original_path = (line.get('file_Location') or '').replace("\\", "/")
+        if not original_path or original_path in seen:
+            continue
+        seen.add(original_path)
+        pairs.append({'file_name': line.get('file_name'), 'original_path': original_path,
+                      'revised_path': revised_comparison_path(original_path, line.get('file_name'))})
+    return pairs
+
+def read_text(path):
+    with open(path, 'r') as file:
+        return file.read()
+
+# Function to diff two texts line by line; returns the unified diff lines and the diff engine that produced them
+def diff_texts(original_text, revised_text, original_name='', revised_name='', algorithm=DEFAULT_DIFF_ALGORITHM,
+               time_budget=DEFAULT_DIFF_TIME_BUDGET):
+    original_lines, revised_lines = original_text.splitlines(), revised_text.splitlines()
+    opcodes, engine = diff_opcodes(original_lines, revised_lines, algorithm, time_budget)
+    return format_unified_diff(original_lines, revised_lines, opcodes, original_name, revised_name, lineterm=''), engine
+
+# Function to count the added lines, removed lines and hunks of a unified diff
+def count_changes(diff):
+    added = removed = hunks = 0
+    for line in diff:
+        if line.startswith('@@'):
+            hunks += 1
+        elif line.startswith('+') and not line.startswith('+++'):
+            added += 1
+        elif line.startswith('-') and not line.startswith('---'):
+            removed += 1
+    return added, removed, hunks
+
+# Function to diff and score one pair of files into a report row
+def compare_file_pair(pair):
+    row = {**pair, 'status': 'compared', 'error': None, 'outliers': []}
+    if not os.path.exists(pair['revised_path']):
+        return {**row, 'status': 'missing'}
+    try:
+        original_text = read_text(pair['original_path'])
+        revised_text = read_text(pair['revised_path'])
+    except (OSError, UnicodeDecodeError) as e:
+        return {**row, 'status': 'error', 'error': str(e)}
+
+    diff, row['diff_algorithm'] = diff_texts(original_text, revised_text)
+    row['added_lines'], row['removed_lines'], row['hunks'] = count_changes(diff)
+    row['original_lines'] = len(original_text.splitlines())
+    row['revised_lines'] = len(revised_text.splitlines())
+    row.update(score_pair(original_text.splitlines(), revised_text.splitlines()))
+    return row
+
+def compare_chunk(pairs):
+    return [compare_file_pair(pair) for pair in pairs]
+
+def file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+# Function to build the cache key of a report; it changes whenever any original or revised file changes
+def report_key(pairs):
+    signatures = [[pair['original_path'], file_signature(pair['original_path']),
+                   pair['revised_path'], file_signature(pair['revised_path'])] for pair in pairs]
+    return hashlib.sha256(json.dumps([REPORT_VERSION, signatures]).encode('utf-8')).hexdigest()
+
+def lower_fence(values):
+    # Values below the fence are outliers; too few values have no fence
+    if len(values) < 4:
+        return None
+    first_quartile, _, third_quartile = statistics.quantiles(values, n=4)
+    return first_quartile - OUTLIER_IQR_FACTOR * (third_quartile - first_quartile)
+
+# Function to sum up the rows of a report and flag the outliers
+def summarize(rows):
+    compared = [row for row in rows if row['status'] == 'compared']
+    summary = {
+        'files': len(rows),
+        'compared': len(compared),
+        'missing': sum(1 for row in rows if row['status'] == 'missing'),
+        'errors': sum(1 for row in rows if row['status'] == 'error'),
+        'unchanged': sum(1 for row in compared if row['added_lines'] == 0 and row['removed_lines'] == 0),
+        'added_lines': sum(row['added_lines'] for row in compared),
+        'removed_lines': sum(row['removed_lines'] for row in compared),
+        'metrics': {},
+        'outlier_fences': {},
+    }
+
+    # Step 1: Mean, median, minimum and maximum of every metric over the compared files
+    for key in METRIC_KEYS:
+        values = [row[key] for row in compared]
+        summary['metrics'][key] = {
+            'mean': statistics.fmean(values) if values else None,
+            'median': statistics.median(values) if values else None,
+            'min': min(values, default=None),
+            'max': max(values, default=None),
+        }
+
+    # Step 2: Flag the files far below the rest on any outlier metric
+    for key in OUTLIER_METRICS:
+        fence = lower_fence([row[key] for row in compared])
+        summary['outlier_fences'][key] = fence
+        if fence is None:
+            continue
+        for row in compared:
+            if row[key] < fence:
+                row['outliers'].append(key)
+    summary['outliers'] = sum(1 for row in compared if row['outliers'])
+    return summary
+
+# Function to diff and score every pair in worker processes and build the report
+def build_report(pairs, max_workers=None):
+    started = time.perf_counter()
+    rows = run_batched(compare_chunk, pairs, max_workers)
+    summary = summarize(rows)
+    summary['seconds'] = time.perf_counter() - started
+    return {'version': REPORT_VERSION, 'created_at': time.time(), 'summary': summary, 'rows': rows}
+
+def report_path(directory, key):
+    return os.path.join(directory, f"{key}.json")
+
+# Function to load the cached report of the pairs, or None if their files changed since it was built
+def load_report(pairs, directory):
+    path = report_path(directory, report_key(pairs))
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+# Function to load the cached report of the pairs, building and caching it first if necessary
+def load_or_build_report(pairs, directory, max_workers=None):
+    key = report_key(pairs)
+    report = load_report(pairs, directory)
+    if report is None:
+        report = build_report(pairs, max_workers)
+        # Write to a temporary file first, so a reader never sees half a report
+        os.makedirs(directory, exist_ok=True)
+        temporary_path = f"{report_path(directory, key)}.{os.getpid()}.tmp"
+        with open(temporary_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file)
+        os.replace(temporary_path, report_path(directory, key))
+    return key, report
+
+def sort_value(row, key):
+    # Rows without the value (e.g. files without a revised copy) sort after all others in either order
+    if key == 'outliers':
+        return len(row['outliers'])
+    value = row.get(key)
+    return value.lower() if isinstance(value, str) else value
+
+# Function to sort the rows of a report and return one page of them
+def report_page(report, sort_key='f1_score', descending=False, page=1, page_size=DEFAULT_PAGE_SIZE, outliers_only=False):
+    sort_key = sort_key if sort_key in SORT_KEYS else 'f1_score'
+    page_size = min(max(1, page_size), MAX_PAGE_SIZE)
+    rows = [row for row in report['rows'] if row['outliers']] if outliers_only else report['rows']
+    present = [row for row in rows if sort_value(row, sort_key) is not None]
+    absent = [row for row in rows if sort_value(row, sort_key) is None]
+    present.sort(key=lambda row: sort_value(row, sort_key), reverse=descending)
+    rows = present + absent
+
+    page_count = max(1, -(-len(rows) // page_size))
+    page = min(max(1, page), page_count)
+    return {
+        'rows': rows[(page - 1) * page_size:page * page_size],
+        'page': page,
+        'page_size': page_size,
+        'page_count': page_count,
+        'total_rows': len(rows),
+        'sort': sort_key,
+        'order': 'desc' if descending else 'asc',
+        'outliers_only': outliers_only,
+    }
@@ -0,0 +1,113 @@
+from llm_backends import Completion
+
+# Continuation of completions cut off by `max_tokens`.
+# When a completion ends with finish_reason "length", the partial answer is sent back as an assistant message with a
+# request to carry on, and the pieces are stitched together. Models often repeat the end of what they already sent
+# (typically the unfinished last line), so the overlap between the two pieces is removed before joining them.
+
+MAX_CONTINUATIONS = 5  # Continuation requests per completion before giving up
+MAX_OVERLAP_CHARS = 2000  # Longest repeated text looked for at the start of a continuation
+MIN_OVERLAP_CHARS = 8  # Shorter overlaps are only removed when they start at the beginning of a line
+CONTINUE_PROMPT = ("Your previous answer was cut off. Continue exactly where it stopped, without repeating anything "
+                   "already sent and without any additional text.")
+
+class TruncatedCompletion(Exception):
+    # Raised when a completion is still cut off after MAX_CONTINUATIONS continuations, so it is never saved as complete
+    def __init__(self, content, continuations):
+        super().__init__(f"Completion still truncated after {continuations} continuation requests ({len(content)} characters)")
+        self.content = content
+        self.continuations = continuations
+
+# Function to build the messages that ask for the rest of a truncated completion
+def continuation_messages(messages, partial_content):
+    return messages + [
+        {"role": "assistant", "content": partial_content},
+        {"role": "user", "content": CONTINUE_PROMPT}
+    ]
+
+# Function to find how many leading characters of a continuation repeat the end of the text before it
+def find_overlap(previous, continuation):
+    longest = min(len(previous), len(continuation), MAX_OVERLAP_CHARS)
+    for size in range(longest, 0, -1):
+        if not previous.endswith(continuation[:size]):
+            continue
+        # Guard against dropping text that only matches by chance: short overlaps must cover a whole line start
+        at_line_start = size == len(previous) or previous[-size - 1] == '\n'
+        if size >= MIN_OVERLAP_CHARS or (at_line_start and continuation[:size].strip()):
+            return size
+    return 0
+
+# Function to join a truncated completion and its continuation
+def stitch(previous, continuation):
+    return previous + continuation[find_overlap(previous, continuation):]
+
+# Function to merge the token usage of several requests
+def add_usage(total, usage):
+    for key, value in (usage or {}).items():
+        if isinstance(value, int):
+            total[key] = total.get(key, 0) + value
+    return total
+
+# Function to complete a prompt, continuing as long as the completion is cut off by `max_tokens`
+def complete_with_continuation(complete, messages, max_continuations=MAX_CONTINUATIONS):
+    # `complete(messages)` sends one request and returns an `llm_backends.Completion`;
+    # returns the stitched completion and the number of continuation requests it took
+    completion = complete(messages)
+    content, usage = completion.content or '', add_usage({}, completion.usage)
+    continuations = 0
+    while completion.finish_reason == 'length':
+        if continuations == max_continuations:
+            raise TruncatedCompletion(content, continuations)
+        continuations += 1
+        completion = complete(continuation_messages(messages, content))
+        content = stitch(content, completion.content or '')
+        add_usage(usage, completion.usage)
+    return Completion(content, completion.finish_reason, usage, completion.headers), continuations
+
+# Asyncio variant of `complete_with_continuation`, for the revision engine
+async def acomplete_with_continuation(acomplete, messages, max_continuations=MAX_CONTINUATIONS):
+    completion = await acomplete(messages)
+    content, usage = completion.content or '', add_usage({}, completion.usage)
+    continuations = 0
+    while completion.finish_reason == 'length':
+        if continuations == max_continuations:
+            raise TruncatedCompletion(content, continuations)
+        continuations += 1
+        completion = await acomplete(continuation_messages(messages, content))
+        content = stitch(content, completion.content or '')
+        add_usage(usage, completion.usage)
+    return Completion(content, completion.finish_reason, usage, completion.headers), continuations
+
+# Function to stream a completion, continuing as long as it is cut off by `max_tokens`
+def stream_with_continuation(stream, messages, max_continuations=MAX_CONTINUATIONS):
+    # `stream(messages)` yields (text, finish_reason) pairs like the backends' `stream`; this yields the stitched text.
+    # The start of each continuation is held back until it is long enough to tell whether it repeats earlier text.
+    content = ''
+    continuations = 0
+    request_messages = messages
+    while True:
+        finish_reason = None
+        held_back = None if continuations == 0 else ''
+        for text, reason in stream(request_messages):
+            finish_reason = reason or finish_reason
+            if held_back is None:
+                content += text
+                yield text
+                continue
+            held_back += text
+            if len(held_back) > min(len(content), MAX_OVERLAP_CHARS):
+                new_text = held_back[find_overlap(content, held_back):]
+                content += new_text
+                yield new_text
+                held_back = None
+        if held_back:
+            new_text = held_back[find_overlap(content, held_back):]
+            content += new_text
+            yield new_text
+
+        if finish_reason != 'length':
+            return
+        if continuations == max_continuations:
+            raise TruncatedCompletion(content, continuations)
+        continuations += 1
+        request_messages = continuation_messages(messages, content)
@@ -0,0 +1,80 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from llm_cache import ResponseCache
+from diff_engines import DIFF_ENGINE_VERSION
+
+# Cache of Code Comparer results (diff lines, diff engine and metrics) for pairs of files.
+# Entries are keyed by the content hashes of both files, their names (they appear in the diff headers), the diff
+# algorithm and the versions of the diff engines and of this cache, so an entry is never used once either file changed.
+# Recently used entries are kept in memory in each process; all entries are also kept on disk (an LRU-evicted
+# `llm_cache.ResponseCache`), where every worker process can find them.
+
+COMPARISON_CACHE_VERSION = 2  # Increase it when the cached diff or metrics change
+COMPARISON_CACHE_DIRECTORY_NAME = '.wall_comparison_cache'
+DEFAULT_MEMORY_ENTRIES = 128  # Results kept in memory per process
+DEFAULT_DISK_BYTES = 256 * 1024 * 1024  # 256 MB
+
+def content_hash(text):
+    return hashlib.sha256(text.encode('utf-8', 'surrogatepass')).hexdigest()
+
+# Function to build the cache key of the comparison of two file contents
+def comparison_key(original_text, revised_text, algorithm, original_name='', revised_name=''):
+    payload = json.dumps({
+        'version': COMPARISON_CACHE_VERSION,
+        'diff_engines': DIFF_ENGINE_VERSION,
+        'original': content_hash(original_text),
+        'revised': content_hash(revised_text),
+        'algorithm': algorithm,
+        'names': [original_name, revised_name],
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class ComparisonCache:
+    def __init__(self, directory, memory_entries=DEFAULT_MEMORY_ENTRIES, max_bytes=DEFAULT_DISK_BYTES):
+        self.memory_entries = memory_entries
+        self.memory = OrderedDict()  # Key -> result, from least to most recently used
+        self.memory_hits = 0
+        self.lock = threading.Lock()
+        self.disk = ResponseCache(directory, max_bytes)
+
+    def get(self, key):
+        # Return the cached result, or None on a miss; results found on disk are kept in memory from then on
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return self.memory[key]
+        result = self.disk.get(key)
+        if result is not None:
+            self.remember(key, result)
+        return result
+
+    def put(self, key, result):
+        self.disk.put(key, result)
+        self.remember(key, result)
+
+    def remember(self, key, result):
+        # Keep the result in memory, evicting the least recently used ones beyond `memory_entries`
+        with self.lock:
+            self.memory[key] = result
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_entries:
+                self.memory.popitem(last=False)
+
+    def stats(self):
+        disk = self.disk.stats()
+        with self.lock:
+            hits = self.memory_hits + disk['hits']
+            lookups = hits + disk['misses']
+            return {
+                'memory_hits': self.memory_hits,
+                'disk_hits': disk['hits'],
+                'misses': disk['misses'],
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self.memory),
+                'disk_entries': disk['entries'],
+                'disk_bytes': disk['bytes'],
+                'evictions': disk['evictions'],
+            }
@@ -0,0 +1,360 @@
+import difflib
+import time
+from bisect import bisect_left
+
+# Line diff engines for the Code Comparer.
+# `difflib.SequenceMatcher` goes quadratic on large or repetitive files, so the comparer can use Myers' O(ND)
+# algorithm (in linear space), patience diff or histogram diff (as in git) instead. The engines of one diff share a time
+# budget: an engine that runs out of its share hands over to the next one in FALLBACK_CHAIN, down to a coarse diff that
+# only trims the unchanged start and end of the files and always takes linear time. All engines produce difflib-style
+# opcodes, and `unified_diff` formats them exactly like `difflib.unified_diff`.
+
+DIFF_ENGINE_VERSION = 1  # Part of the keys of cached diffs; increase it when any engine's output changes
+DIFF_ALGORITHMS = ['histogram', 'patience', 'myers', 'difflib']
+DEFAULT_DIFF_ALGORITHM = 'histogram'
+DEFAULT_DIFF_TIME_BUDGET = 1.0  # Seconds for all the engines of one diff together (the coarse diff aside)
+FALLBACK_CHAIN = ['histogram', 'coarse']  # Engines tried, in order, after the requested one runs out of time
+MAX_CHAIN_LENGTH = 64  # Lines repeated more often than this are not used as histogram anchors (as in git)
+DEADLINE_CHECK_INTERVAL = 64  # Steps between two looks at the clock
+
+class DiffTimeout(Exception):
+    pass
+
+class Deadline:
+    # A point in time after which an engine gives up; the clock is only read every few steps
+    def __init__(self, seconds):
+        self.at = time.perf_counter() + seconds if seconds is not None else None
+        self.steps = 0
+
+    def check(self):
+        self.steps += 1
+        if self.at is not None and self.steps % DEADLINE_CHECK_INTERVAL == 0 and time.perf_counter() > self.at:
+            raise DiffTimeout()
+
+def intern_lines(a, b):
+    # Replace every distinct line by a small integer, so the engines compare integers instead of strings
+    ids = {}
+    return [ids.setdefault(line, len(ids)) for line in a], [ids.setdefault(line, len(ids)) for line in b]
+
+def trim_common(a, alo, ahi, b, blo, bhi, matches):
+    # Record the unchanged start and end of a region as matches and return the changed middle
+    start = 0
+    while alo + start < ahi and blo + start < bhi and a[alo + start] == b[blo + start]:
+        start += 1
+    if start:
+        matches.append((alo, blo, start))
+    alo, blo = alo + start, blo + start
+    end = 0
+    while alo < ahi - end and blo < bhi - end and a[ahi - 1 - end] == b[bhi - 1 - end]:
+        end += 1
+    if end:
+        matches.append((ahi - end, bhi - end, end))
+    return alo, ahi - end, blo, bhi - end
+
+def myers_split(a, alo, ahi, b, blo, bhi, deadline):
+    # Find the middle snake of a region by running Myers' algorithm forwards and backwards at once
+    # (the bisection of diff-match-patch); returns the point to split the region at, or None if nothing matches
+    n, m = ahi - alo, bhi - blo
+    max_d = (n + m + 1) // 2
+    offset = max_d
+    length = 2 * max_d + 2
+    forward = [-1] * length
+    backward = [-1] * length
+    forward[offset + 1] = 0
+    backward[offset + 1] = 0
+    delta = n - m
+    front = delta % 2 != 0
+    k1_start = k1_end = k2_start = k2_end = 0
+    for d in range(max_d):
+        deadline.check()
+        for k1 in range(-d + k1_start, d + 1 - k1_end, 2):
+            index = offset + k1
+            if k1 == -d or (k1 != d and forward[index - 1] < forward[index + 1]):
+                x1 = forward[index + 1]
+            else:
+                x1 = forward[index - 1] + 1
+            y1 = x1 - k1
+            while x1 < n and y1 < m and a[alo + x1] == b[blo + y1]:
+                x1 += 1
+                y1 += 1
+            forward[index] = x1
+            if x1 > n:
+                k1_end += 2
+            elif y1 > m:
+                k1_start += 2
+            elif front:
+                other = offset + delta - k1
+                if 0 <= other < length and backward[other] != -1 and x1 >= n - backward[other]:
+                    return x1, y1
+        for k2 in range(-d + k2_start, d + 1 - k2_end, 2):
+            index = offset + k2
+            if k2 == -d or (k2 != d and backward[index - 1] < backward[index + 1]):
+                x2 = backward[index + 1]
+            else:
+                x2 = backward[index - 1] + 1
+            y2 = x2 - k2
+            while x2 < n and y2 < m and a[ahi - 1 - x2] == b[bhi - 1 - y2]:
+                x2 += 1
+                y2 += 1
+            backward[index] = x2
+            if x2 > n:
+                k2_end += 2
+            elif y2 > m:
+                k2_start += 2
+            elif not front:
+                other = offset + delta - k2
+                if 0 <= other < length and forward[other] != -1:
+                    x1 = forward[other]
+                    if x1 >= n - x2:
+                        return x1, offset + x1 - other
+    return None
+
+def myers_regions(a, b, regions, deadline, matches):
+    # Minimal diff of each region: split it at its middle snake, then diff both halves the same way
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = trim_common(a, alo, ahi, b, blo, bhi, matches)
+        if alo == ahi or blo == bhi:
+            continue
+        split = myers_split(a, alo, ahi, b, blo, bhi, deadline)
+        if split is None or split in ((0, 0), (ahi - alo, bhi - blo)):
+            continue  # Nothing in common: the whole region is replaced
+        x, y = split
+        regions.append((alo + x, ahi, blo + y, bhi))
+        regions.append((alo, alo + x, blo, blo + y))
+
+def myers_matches(a, b, deadline):
+    matches = []
+    myers_regions(a, b, [(0, len(a), 0, len(b))], deadline, matches)
+    return matches
+
+def unique_positions(lines, lo, hi):
+    # Position of every line of lines[lo:hi], or -1 for lines that occur more than once
+    positions = {}
+    for index in range(lo, hi):
+        line = lines[index]
+        positions[line] = -1 if line in positions else index
+    return positions
+
+def longest_increasing_run(pairs):
+    # Patience sorting: the longest chain of (a position, b position) pairs that increases in both, for pairs sorted by a
+    tails = []  # Smallest b position that ends a chain of each length
+    tail_pairs = []
+    previous = {}
+    for pair in pairs:
+        index = bisect_left(tails, pair[1])
+        if index == len(tails):
+            tails.append(pair[1])
+            tail_pairs.append(pair)
+        else:
+            tails[index] = pair[1]
+            tail_pairs[index] = pair
+        previous[pair] = tail_pairs[index - 1] if index else None
+    chain = []
+    pair = tail_pairs[-1] if tail_pairs else None
+    while pair is not None:
+        chain.append(pair)
+        pair = previous[pair]
+    return chain[::-1]
+
+def patience_matches(a, b, deadline):
+    # Anchor the diff on lines that occur exactly once in both files, in the longest order both files share;
+    # the regions between anchors are diffed the same way, and regions without such lines with Myers' algorithm
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        deadline.check()
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = trim_common(a, alo, ahi, b, blo, bhi, matches)
+        if alo == ahi or blo == bhi:
+            continue
+        a_unique = unique_positions(a, alo, ahi)
+        b_unique = unique_positions(b, blo, bhi)
+        pairs = sorted((position, b_unique[line]) for line, position in a_unique.items()
+                       if position != -1 and b_unique.get(line, -1) != -1)
+        anchors = longest_increasing_run(pairs)
+        if not anchors:
+            myers_regions(a, b, [(alo, ahi, blo, bhi)], deadline, matches)
+            continue
+        for ai, bi in anchors:
+            matches.append((ai, bi, 1))
+        bounds = [(alo - 1, blo - 1)] + anchors + [(ahi, bhi)]
+        for (start_a, start_b), (end_a, end_b) in zip(bounds, bounds[1:]):
+            if start_a + 1 < end_a or start_b + 1 < end_b:
+                regions.append((start_a + 1, end_a, start_b + 1, end_b))
+    return matches
+
+def histogram_matches(a, b, deadline):
+    # Histogram diff (as in git): split each region at the longest common run around its rarest shared line,
+    # then diff both sides the same way; regions whose shared lines are all very common are diffed with Myers' algorithm
+    matches = []
+    regions = [(0, len(a), 0, len(b))]
+    while regions:
+        alo, ahi, blo, bhi = regions.pop()
+        alo, ahi, blo, bhi = trim_common(a, alo, ahi, b, blo, bhi, matches)
+        if alo == ahi or blo == bhi:
+            continue
+
+        # Step 1: Where each line occurs in this region of the first file
+        occurrences = {}
+        for index in range(alo, ahi):
+            occurrences.setdefault(a[index], []).append(index)
+
+        # Step 2: Extend every occurrence of each line of the second file into a common run, keeping the run
+        # whose rarest line is rarest, and the longest of those
+        best = None  # (lowest count, -length, a start, b start, length)
+        bi = blo
+        while bi < bhi:
+            deadline.check()
+            positions = occurrences.get(b[bi])
+            if positions is None or len(positions) > MAX_CHAIN_LENGTH or (best and len(positions) > best[0]):
+                bi += 1
+                continue
+            next_bi = bi + 1
+            for ai in positions:
+                start_a, start_b, count = ai, bi, len(positions)
+                while start_a > alo and start_b > blo and a[start_a - 1] == b[start_b - 1]:
+                    start_a -= 1
+                    start_b -= 1
+                    count = min(count, len(occurrences[a[start_a]]))
+                end_a, end_b = ai + 1, bi + 1
+                while end_a < ahi and end_b < bhi and a[end_a] == b[end_b]:
+                    count = min(count, len(occurrences[a[end_a]]))
+                    end_a += 1
+                    end_b += 1
+                candidate = (count, start_a - end_a, start_a, start_b, end_a - start_a)
+                if best is None or candidate < best:
+                    best = candidate
+                next_bi = max(next_bi, end_b)
+            bi = next_bi
+
+        # Step 3: Split the region at the best run
+        if best is None:
+            myers_regions(a, b, [(alo, ahi, blo, bhi)], deadline, matches)
+            continue
+        _, _, start_a, start_b, length = best
+        matches.append((start_a, start_b, length))
+        regions.append((start_a + length, ahi, start_b + length, bhi))
+        regions.append((alo, start_a, blo, start_b))
+    return matches
+
+def coarse_matches(a, b, deadline):
+    # Only the unchanged start and end of the files; everything in between is one replaced block
+    matches = []
+    trim_common(a, 0, len(a), b, 0, len(b), matches)
+    return matches
+
+def difflib_matches(a, b, deadline):
+    # `difflib.SequenceMatcher`, as used by `difflib.unified_diff`; it cannot be interrupted, so it has no time budget
+    return [tuple(block) for block in difflib.SequenceMatcher(None, a, b).get_matching_blocks() if block.size]
+
+DIFF_ENGINES = {
+    'histogram': histogram_matches,
+    'patience': patience_matches,
+    'myers': myers_matches,
+    'difflib': difflib_matches,
+    'coarse': coarse_matches,
+}
+
+# Function to turn matching blocks into difflib-style opcodes
+def opcodes_from_matches(matches, a_length, b_length):
+    # Merge adjacent blocks first, so each unchanged run becomes one "equal" opcode
+    merged = []
+    for ai, bi, size in sorted(matches):
+        if merged and merged[-1][0] + merged[-1][2] == ai and merged[-1][1] + merged[-1][2] == bi:
+            merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + size)
+        else:
+            merged.append((ai, bi, size))
+
+    opcodes = []
+    i = j = 0
+    for ai, bi, size in merged + [(a_length, b_length, 0)]:
+        if i < ai and j < bi:
+            opcodes.append(('replace', i, ai, j, bi))
+        elif i < ai:
+            opcodes.append(('delete', i, ai, j, bi))
+        elif j < bi:
+            opcodes.append(('insert', i, ai, j, bi))
+        i, j = ai + size, bi + size
+        if size:
+            opcodes.append(('equal', ai, i, bi, j))
+    return opcodes
+
+# Function to diff two lists of lines with the chosen engine, falling back to faster ones if it runs out of time
+def diff_opcodes(a, b, algorithm=DEFAULT_DIFF_ALGORITHM, time_budget=DEFAULT_DIFF_TIME_BUDGET):
+    # Returns the opcodes and the name of the engine that produced them
+    if algorithm not in DIFF_ENGINES:
+        raise ValueError(f"Unknown diff algorithm: {algorithm}")
+    a_ids, b_ids = intern_lines(a, b)
+    chain = [algorithm] + [name for name in FALLBACK_CHAIN if name != algorithm]
+
+    # The engines share one budget: each one may use the time left divided by the number of timed engines still to try,
+    # so a diff that falls back still takes about `time_budget` seconds at most (plus the linear-time coarse diff)
+    end = time.perf_counter() + time_budget if time_budget is not None else None
+    timed_engines = sum(1 for name in chain if name != 'coarse')
+    for name in chain:
+        seconds = None
+        if name != 'coarse' and end is not None:
+            seconds = max(0.0, end - time.perf_counter()) / timed_engines
+            timed_engines -= 1
+        try:
+            matches = DIFF_ENGINES[name](a_ids, b_ids, Deadline(seconds))
+        except DiffTimeout:
+            continue
+        return opcodes_from_matches(matches, len(a), len(b)), name
+
+# Function to group opcodes into hunks with `context` unchanged lines around each change (as difflib does)
+def group_opcodes(opcodes, context=3):
+    codes = list(opcodes) or [('equal', 0, 1, 0, 1)]
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        # An unchanged run longer than the context on both sides ends the current hunk
+        if tag == 'equal' and i2 - i1 > 2 * context:
+            group.append((tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - context), max(j1, j2 - context)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+def format_range(start, stop):
+    # Line range of a hunk header, as in `difflib.unified_diff`
+    beginning = start + 1
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1
+    return f"{beginning},{length}"
+
+# Function to format opcodes as the lines of a unified diff, exactly like `difflib.unified_diff`
+def format_unified_diff(a, b, opcodes, fromfile='', tofile='', n=3, lineterm='\n'):
+    lines = []
+    for group in group_opcodes(opcodes, n):
+        if not lines:
+            lines.append(f"--- {fromfile}{lineterm}")
+            lines.append(f"+++ {tofile}{lineterm}")
+        first, last = group[0], group[-1]
+        lines.append(f"@@ -{format_range(first[1], last[2])} +{format_range(first[3], last[4])} @@{lineterm}")
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                lines.extend(' ' + line for line in a[i1:i2])
+                continue
+            if tag in ('replace', 'delete'):
+                lines.extend('-' + line for line in a[i1:i2])
+            if tag in ('replace', 'insert'):
+                lines.extend('+' + line for line in b[j1:j2])
+    return lines
+
+# Function to diff two lists of lines into unified diff lines; a drop-in for `difflib.unified_diff` with an engine choice
+def unified_diff(a, b, fromfile='', tofile='', n=3, lineterm='\n', algorithm=DEFAULT_DIFF_ALGORITHM,
+                 time_budget=DEFAULT_DIFF_TIME_BUDGET):
+    opcodes, _ = diff_opcodes(a, b, algorithm, time_budget)
+    return format_unified_diff(a, b, opcodes, fromfile, tofile, n, lineterm)
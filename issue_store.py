@@ -0,0 +1,127 @@
+import json
+import sqlite3
+import uuid
+from itertools import islice
+
+# Local SQLite store of SonarQube issues, keyed by issue key.
+# It lets `/sonarqube` apply only the issues changed since the last sync instead of re-downloading everything.
+
+STAGING_BATCH_SIZE = 1000  # Issues of a full crawl written per transaction, so the write lock is never held while fetching
+
+def open_issue_store(db_path):
+    # Step 1: Open (or create) the database file; in WAL mode, reading the stored issues does not block other syncs' writes
+    connection = sqlite3.connect(db_path, timeout=30)
+    connection.execute("PRAGMA journal_mode=WAL")
+
+    # Step 2: Create the issue and sync-state tables if they do not exist yet
+    connection.execute("""CREATE TABLE IF NOT EXISTS issues (
+        sonar_url TEXT NOT NULL,
+        project_key TEXT NOT NULL,
+        issue_key TEXT NOT NULL,
+        component TEXT,
+        update_date TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (sonar_url, issue_key))""")
+    connection.execute("""CREATE INDEX IF NOT EXISTS issues_by_project
+        ON issues (sonar_url, project_key, component)""")
+    connection.execute("""CREATE TABLE IF NOT EXISTS sync_state (
+        sonar_url TEXT NOT NULL,
+        project_key TEXT NOT NULL,
+        last_sync TEXT NOT NULL,
+        PRIMARY KEY (sonar_url, project_key))""")
+    connection.execute("""CREATE TABLE IF NOT EXISTS staged_issues (
+        staging_id TEXT NOT NULL,
+        issue_key TEXT NOT NULL,
+        component TEXT,
+        update_date TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (staging_id, issue_key))""")
+    connection.commit()
+    return connection
+
+def get_last_sync(connection, sonar_url, project_key):
+    # Return the `updateDate` of the newest issue seen by the previous sync, or None before the first sync
+    row = connection.execute(
+        "SELECT last_sync FROM sync_state WHERE sonar_url = ? AND project_key = ?",
+        (sonar_url, project_key)).fetchone()
+    return row[0] if row else None
+
+def set_last_sync(connection, sonar_url, project_key, last_sync):
+    connection.execute(
+        "INSERT OR REPLACE INTO sync_state (sonar_url, project_key, last_sync) VALUES (?, ?, ?)",
+        (sonar_url, project_key, last_sync))
+
+def replace_issues(connection, sonar_url, project_key, issues, last_sync):
+    # Replace every stored issue of the project with a full crawl. `issues` may be a generator that fetches pages as it
+    # goes, so the crawl is first written to a staging table in short transactions, and only the swap holds the write lock
+    # for the whole project; other syncs and ingestion jobs can write between the batches instead of timing out
+    staging_id = uuid.uuid4().hex
+    try:
+        # Step 1: Stage the crawl, one batch of issues per transaction
+        issues = iter(issues)
+        while True:
+            batch = list(islice(issues, STAGING_BATCH_SIZE))
+            if not batch:
+                break
+            with connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO staged_issues (staging_id, issue_key, component, update_date, data) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    ((staging_id, issue['key'], issue.get('component'), issue.get('updateDate'), json.dumps(issue))
+                     for issue in batch))
+
+        # Step 2: Swap the staged issues in, in one short transaction
+        with connection:
+            connection.execute("DELETE FROM issues WHERE sonar_url = ? AND project_key = ?", (sonar_url, project_key))
+            connection.execute(
+                "INSERT OR REPLACE INTO issues (sonar_url, project_key, issue_key, component, update_date, data) "
+                "SELECT ?, ?, issue_key, component, update_date, data FROM staged_issues WHERE staging_id = ?",
+                (sonar_url, project_key, staging_id))
+            connection.execute("DELETE FROM staged_issues WHERE staging_id = ?", (staging_id,))
+            if last_sync:
+                set_last_sync(connection, sonar_url, project_key, last_sync)
+    finally:
+        # A crawl that failed halfway leaves the stored issues as they were
+        with connection:
+            connection.execute("DELETE FROM staged_issues WHERE staging_id = ?", (staging_id,))
+
+def apply_issue_changes(connection, sonar_url, project_key, issues, last_sync):
+    # Apply a delta of changed issues: resolved issues are removed, everything else is inserted or updated
+    inserted = updated = resolved = 0
+    with connection:
+        for issue in issues:
+            exists = connection.execute(
+                "SELECT 1 FROM issues WHERE sonar_url = ? AND issue_key = ?", (sonar_url, issue['key'])).fetchone()
+            if issue.get('resolution'):
+                if exists:
+                    connection.execute(
+                        "DELETE FROM issues WHERE sonar_url = ? AND issue_key = ?", (sonar_url, issue['key']))
+                    resolved += 1
+                continue
+
+            connection.execute(
+                "INSERT OR REPLACE INTO issues (sonar_url, project_key, issue_key, component, update_date, data) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (sonar_url, project_key, issue['key'], issue.get('component'), issue.get('updateDate'), json.dumps(issue)))
+            if exists:
+                updated += 1
+            else:
+                inserted += 1
+        if last_sync:
+            set_last_sync(connection, sonar_url, project_key, last_sync)
+    return inserted, updated, resolved
+
+def iter_stored_issues(connection, sonar_url, project_key):
+    # Yield the stored (unresolved) issues of a project, ordered by component
+    rows = connection.execute(
+        "SELECT data FROM issues WHERE sonar_url = ? AND project_key = ? ORDER BY component, issue_key",
+        (sonar_url, project_key))
+    for (data,) in rows:
+        yield json.loads(data)
+
+def iter_stored_update_dates(connection, sonar_url, project_key):
+    # Yield the `updateDate` of every stored issue of a project, without loading the issues themselves
+    rows = connection.execute(
+        "SELECT update_date FROM issues WHERE sonar_url = ? AND project_key = ?", (sonar_url, project_key))
+    for (update_date,) in rows:
+        yield update_date
@@ -0,0 +1,100 @@
+import re
+
+# Issue-window prompts: instead of the whole file, only the regions around the lines reported by SonarQube
+# are sent to the model. Each region is introduced by a "@@ lines <start>-<end> @@" header, and the corrected
+# regions returned by the model are spliced back into the original file.
+
+DEFAULT_CONTEXT_LINES = 10  # Lines of context kept above and below each reported line
+HUNK_HEADER = re.compile(r'^@@ lines (\d+)-(\d+) @@[ \t]*\r?$', re.MULTILINE)
+LINE_NUMBER_PREFIX = re.compile(r'^\d+: ?')
+CODE_FENCE = re.compile(r'^\s*```')
+
+class WindowSpliceError(Exception):
+    pass
+
+def parse_bug_line(bug_line):
+    try:
+        return int(bug_line)
+    except (TypeError, ValueError):
+        return None  # Issues reported on the file itself have no line ('N/A')
+
+def build_issue_windows(line_count, bug_lines, context_lines=DEFAULT_CONTEXT_LINES):
+    # Return the merged (start, end) line ranges around the reported lines, 1-based and inclusive,
+    # or None when an issue has no line number and the whole file has to be sent instead
+    if line_count == 0:
+        return None
+
+    # Step 1: Build one window per reported line, clamped to the file
+    windows = []
+    for bug_line in bug_lines:
+        line_number = parse_bug_line(bug_line)
+        if line_number is None:
+            return None
+        line_number = min(max(line_number, 1), line_count)
+        windows.append((max(1, line_number - context_lines), min(line_count, line_number + context_lines)))
+
+    # Step 2: Merge overlapping and touching windows
+    merged = []
+    for start, end in sorted(windows):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+def format_issue_windows(lines, windows):
+    # Render each window with its header and numbered lines, matching `read_file_contents`
+    sections = []
+    for start, end in windows:
+        body = ''.join(f"{i}: {lines[i - 1]}" for i in range(start, end + 1))
+        if not body.endswith('\n'):
+            body += '\n'
+        sections.append(f"@@ lines {start}-{end} @@\n{body}")
+    return ''.join(sections)
+
+def parse_window_hunks(response):
+    # Return the (start, end, replacement lines) hunks found in a model response
+    matches = list(HUNK_HEADER.finditer(response))
+    hunks = []
+    for index, match in enumerate(matches):
+        body_end = matches[index + 1].start() if index + 1 < len(matches) else len(response)
+        body = response[match.end():body_end]
+
+        # Step 1: Drop the newline that ends the header, trailing blank lines and any code fences
+        if body.startswith('\r\n'):
+            body = body[2:]
+        elif body.startswith('\n'):
+            body = body[1:]
+        body_lines = [line for line in body.rstrip('\r\n').splitlines() if not CODE_FENCE.match(line)]
+
+        # Step 2: Remove line-number prefixes if the model echoed them back on every line
+        if body_lines and all(LINE_NUMBER_PREFIX.match(line) for line in body_lines if line.strip()):
+            body_lines = [LINE_NUMBER_PREFIX.sub('', line, count=1) for line in body_lines]
+
+        hunks.append((int(match.group(1)), int(match.group(2)), body_lines))
+    return hunks
+
+def splice_window_response(original_text, response):
+    # Replace each returned region in the original file; regions the model left out stay unchanged.
+    # A response without any region that fits the file raises `WindowSpliceError` instead of returning the original code
+    lines = original_text.splitlines(keepends=True)
+    newline = '\r\n' if lines and lines[0].endswith('\r\n') else '\n'
+    hunks = parse_window_hunks(response)
+    if not hunks:
+        raise WindowSpliceError("The response does not contain any \"@@ lines\" regions")
+
+    # Apply the hunks from the bottom of the file up, so earlier line numbers stay valid
+    applied_start = len(lines) + 1
+    applied = 0
+    for start, end, body_lines in sorted(hunks, key=lambda hunk: hunk[0], reverse=True):
+        if start < 1 or end > len(lines) or start > end or end >= applied_start:
+            continue  # Ignore hunks outside the file or overlapping a hunk that was already applied
+        replacement = [line + newline for line in body_lines]
+        if end == len(lines) and replacement and not lines[-1].endswith('\n'):
+            replacement[-1] = replacement[-1][:-len(newline)]  # Keep a missing final newline missing
+        lines[start - 1:end] = replacement
+        applied_start = start
+        applied += 1
+    if not applied:
+        raise WindowSpliceError("None of the returned regions matches the lines of the original code")
+    return ''.join(lines)
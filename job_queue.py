@@ -0,0 +1,157 @@
+import atexit
+import json
+import multiprocessing
+import os
+import sqlite3
+import time
+import traceback
+import uuid
+from contextlib import closing
+
+# Persistent background job queue.
+# Long-running work (SonarQube ingestion, API revisions) is stored as a job in a local SQLite database and run by
+# separate worker processes, so HTTP requests only submit a job and poll its status instead of waiting on the work.
+
+JOB_POLL_INTERVAL = 0.5  # Seconds an idle worker waits before looking for new jobs again
+SECRET_PARAMS = ('api_token',)  # Parameters removed from a job once it has finished
+
+class JobQueue:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress TEXT,
+                result TEXT,
+                error TEXT,
+                worker_pid INTEGER,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL)""")
+            connection.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def submit(self, kind, params):
+        # Queue a job and return its ID straight away
+        job_id = uuid.uuid4().hex
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                "INSERT INTO jobs (job_id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params), time.time()))
+        return job_id
+
+    def get(self, job_id):
+        # Return the job as a dict, or None for an unknown ID
+        with closing(self.connect()) as connection:
+            connection.row_factory = sqlite3.Row
+            row = connection.execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        return job
+
+    def claim(self):
+        # Atomically take the oldest queued job, or return None; the write lock keeps two workers from taking the same job
+        with closing(self.connect()) as connection:
+            connection.isolation_level = None
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                row = connection.execute(
+                    "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+                if row is not None:
+                    connection.execute(
+                        "UPDATE jobs SET status = 'running', worker_pid = ?, started_at = ? WHERE job_id = ?",
+                        (os.getpid(), time.time(), row[0]))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        return self.get(row[0]) if row is not None else None
+
+    def set_progress(self, job_id, progress):
+        with closing(self.connect()) as connection, connection:
+            connection.execute("UPDATE jobs SET progress = ? WHERE job_id = ?", (progress, job_id))
+
+    def finish(self, job_id, status, result=None, error=None):
+        # Record the outcome of a job; credentials such as SonarQube tokens are not kept once they are no longer needed
+        with closing(self.connect()) as connection, connection:
+            row = connection.execute("SELECT params FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            params = {key: value for key, value in json.loads(row[0]).items() if key not in SECRET_PARAMS} if row else {}
+            connection.execute(
+                "UPDATE jobs SET status = ?, params = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (status, json.dumps(params), json.dumps(result) if result is not None else None, error, time.time(), job_id))
+
+    def complete(self, job_id, result):
+        self.finish(job_id, 'completed', result=result)
+
+    def fail(self, job_id, error):
+        self.finish(job_id, 'failed', error=error)
+
+    def unfinished_params(self, key):
+        # Values of one parameter across the queued and running jobs, e.g. the uploaded issue sets they still need
+        with closing(self.connect()) as connection:
+            rows = connection.execute("SELECT params FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        return {json.loads(params).get(key) for (params,) in rows} - {None}
+
+    def requeue_interrupted(self):
+        # Put jobs that were running when their workers stopped back in the queue; call before starting new workers.
+        # Their parameters get `'resume': True`, so a handler can continue the work instead of starting it again
+        with closing(self.connect()) as connection, connection:
+            rows = connection.execute("SELECT job_id, params FROM jobs WHERE status = 'running'").fetchall()
+            for job_id, params in rows:
+                connection.execute(
+                    "UPDATE jobs SET status = 'queued', params = ?, worker_pid = NULL, started_at = NULL WHERE job_id = ?",
+                    (json.dumps({**json.loads(params), 'resume': True}), job_id))
+            return len(rows)
+
+def run_worker(db_path, handlers, initializer=None, initargs=(), poll_interval=JOB_POLL_INTERVAL):
+    # Worker loop: `handlers` maps a job kind to `handler(params, report_progress)`, whose return value is the job result.
+    # `initializer(*initargs)` runs once in the worker first, e.g. to set API keys that are not stored with the jobs.
+    if initializer is not None:
+        initializer(*initargs)
+    queue = JobQueue(db_path)
+    while True:
+        job = queue.claim()
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        handler = handlers.get(job['kind'])
+        if handler is None:
+            queue.fail(job['job_id'], f"Unknown job kind: {job['kind']}")
+            continue
+
+        # A failed job is recorded with its error; the worker goes on with the next one
+        try:
+            result = handler(job['params'], lambda progress: queue.set_progress(job['job_id'], progress))
+        except Exception as e:
+            traceback.print_exc()
+            queue.fail(job['job_id'], f"{type(e).__name__}: {e}")
+        else:
+            queue.complete(job['job_id'], result)
+
+def stop_workers(workers):
+    for worker in workers:
+        if worker.is_alive():
+            worker.terminate()
+
+def start_workers(db_path, handlers, count, initializer=None, initargs=()):
+    # Start `count` worker processes; interrupted jobs from a previous run are queued again first.
+    # Workers are not daemonic, so that jobs can run process pools of their own (see `metrics_engine.run_batched`);
+    # like daemonic processes, they are stopped when this process exits.
+    JobQueue(db_path).requeue_interrupted()
+    workers = []
+    for _ in range(count):
+        worker = multiprocessing.Process(target=run_worker, args=(db_path, handlers, initializer, initargs))
+        worker.start()
+        workers.append(worker)
+    atexit.register(stop_workers, workers)
+    return workers
@@ -0,0 +1,14 @@
+import os
+from app import JOB_QUEUE_PATH, JOB_HANDLERS, JOB_WORKERS, set_openai_api_key
+from job_queue import start_workers
+
+# Runs the background job workers on their own, for deployments where the app is not started with `python app.py`
+# (e.g. `gunicorn -w 4 app:app`, which does not start any workers)
+
+if __name__ == '__main__':
+    # Step 1: Read the OpenAI API key from the environment
+    api_key = os.environ.get('OPENAI_API_KEY', 'your-openai-api-key')
+    # Step 2: Start the workers and keep them running
+    workers = start_workers(JOB_QUEUE_PATH, JOB_HANDLERS, JOB_WORKERS, set_openai_api_key, (api_key,))
+    for worker in workers:
+        worker.join()
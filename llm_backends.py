@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+import aiohttp
+import openai
+import requests
+
+# Pluggable completion backends.
+# Every backend offers the same three calls: `complete` (blocking), `acomplete` (asyncio) and `stream` (a generator of
+# text pieces), plus `aclose` to release its asyncio connections before an event loop ends, so the web app, the revision
+# engine and the batch script do not depend on one provider:
+# - "openai": the OpenAI API through the legacy `openai` package pinned in requirements.txt (0.28, `openai.ChatCompletion`);
+#   the client objects of openai>=1.0 (`openai.OpenAI(...)`) are not supported
+# - "openai-compatible": any server with an OpenAI-compatible `/chat/completions` endpoint (e.g. a self-hosted model)
+# - "mock": deterministic, offline completions for benchmarks and tests
+
+DEFAULT_TIMEOUT = 120  # Seconds to wait for a completion
+DEFAULT_POOL_SIZE = 10  # Connections kept open per backend
+
+class Completion:
+    def __init__(self, content, finish_reason='stop', usage=None, headers=None):
+        self.content = content
+        self.finish_reason = finish_reason  # 'length' when the completion was cut off by `max_tokens`
+        self.usage = usage or {}
+        self.headers = headers or {}  # Response headers, when the backend exposes them (read by `rate_limiter`)
+
+def request_options(temperature, max_tokens):
+    # Only send the sampling options that were given, so each provider's defaults apply otherwise
+    options = {}
+    if temperature is not None:
+        options['temperature'] = temperature
+    if max_tokens is not None:
+        options['max_tokens'] = max_tokens
+    return options
+
+class OpenAIBackend:
+    # Connection pools: asyncio calls go through an aiohttp session owned by this backend, handed to the package per call
+    # (`openai.aiosession` is a context variable). For blocking calls, openai 0.28 only reads the module-global
+    # `openai.requestssession`, and only when a thread makes its first request, so the blocking pool is shared by every
+    # OpenAIBackend of the process; use OpenAICompatibleBackend with https://api.openai.com/v1 for a blocking pool of its own.
+    def __init__(self, api_key=None, api_base=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE):
+        self.api_key = api_key  # Defaults to `openai.api_key`
+        self.api_base = api_base  # Defaults to `openai.api_base`
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.session = None
+        self.async_session = None
+        self.async_loop = None  # An aiohttp session only works in the event loop it was created in
+        self.cache_scope = api_base  # Responses of the default endpoint keep their existing cache keys
+
+    def connection_options(self):
+        options = {'request_timeout': self.timeout}
+        if self.api_key:
+            options['api_key'] = self.api_key
+        if self.api_base:
+            options['api_base'] = self.api_base
+        return options
+
+    def use_session(self):
+        # Install this backend's blocking session for the threads that have not sent a request yet (see above)
+        if self.session is None:
+            self.session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            self.session.mount('http://', adapter)
+            self.session.mount('https://', adapter)
+        openai.requestssession = self.session
+
+    def use_async_session(self):
+        # This backend's aiohttp session for the running event loop, with at most `pool_size` open connections
+        loop = asyncio.get_running_loop()
+        if self.async_session is None or self.async_session.closed or self.async_loop is not loop:
+            self.async_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.pool_size))
+            self.async_loop = loop
+        return self.async_session
+
+    def complete(self, messages, model, temperature=None, max_tokens=None):
+        self.use_session()
+        response = openai.ChatCompletion.create(model=model, messages=messages, **request_options(temperature, max_tokens),
+                                                **self.connection_options())
+        choice = response.choices[0]
+        return Completion(choice.message['content'], choice.get('finish_reason'), dict(response.get('usage') or {}))
+
+    async def acomplete(self, messages, model, temperature=None, max_tokens=None):
+        # Setting the context variable only affects this call, so concurrent backends keep their own sessions
+        token = openai.aiosession.set(self.use_async_session())
+        try:
+            response = await openai.ChatCompletion.acreate(model=model, messages=messages,
+                                                           **request_options(temperature, max_tokens),
+                                                           **self.connection_options())
+        finally:
+            openai.aiosession.reset(token)
+        choice = response.choices[0]
+        return Completion(choice.message['content'], choice.get('finish_reason'), dict(response.get('usage') or {}))
+
+    async def aclose(self):
+        # Close the aiohttp session before its event loop ends
+        if self.async_session is not None and not self.async_session.closed and self.async_loop is asyncio.get_running_loop():
+            await self.async_session.close()
+        self.async_session = self.async_loop = None
+
+    def stream(self, messages, model, temperature=None, max_tokens=None):
+        # Yield (text, finish_reason) pairs; the finish reason is only set on the last one
+        self.use_session()
+        for chunk in openai.ChatCompletion.create(model=model, messages=messages, stream=True,
+                                                  **request_options(temperature, max_tokens), **self.connection_options()):
+            if not chunk['choices']:
+                continue
+            choice = chunk['choices'][0]
+            content = choice['delta'].get('content') or ''
+            if content or choice.get('finish_reason'):
+                yield content, choice.get('finish_reason')
+
+class OpenAICompatibleBackend:
+    def __init__(self, api_base, api_key=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE):
+        self.api_base = api_base.rstrip('/')  # e.g. "http://localhost:8000/v1"
+        self.timeout = timeout
+        self.cache_scope = self.api_base
+
+        # One keep-alive session per backend, with a connection pool large enough for `pool_size` concurrent requests
+        self.session = requests.Session()
+        if api_key:
+            self.session.headers.update({'Authorization': f'Bearer {api_key}'})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, messages, model, temperature, max_tokens, stream=False):
+        response = self.session.post(f"{self.api_base}/chat/completions", timeout=self.timeout, stream=stream,
+                                     json={'model': model, 'messages': messages, 'stream': stream,
+                                           **request_options(temperature, max_tokens)})
+        response.raise_for_status()
+        return response
+
+    def complete(self, messages, model, temperature=None, max_tokens=None):
+        response = self.post(messages, model, temperature, max_tokens)
+        body = response.json()
+        choice = body['choices'][0]
+        return Completion(choice['message']['content'], choice.get('finish_reason'), body.get('usage'),
+                          dict(response.headers))
+
+    async def acomplete(self, messages, model, temperature=None, max_tokens=None):
+        # The pooled session is blocking, so each call runs on a worker thread without blocking the event loop
+        return await asyncio.to_thread(self.complete, messages, model, temperature, max_tokens)
+
+    async def aclose(self):
+        pass  # The blocking session stays open for later calls
+
+    def stream(self, messages, model, temperature=None, max_tokens=None):
+        # Read the server-sent events of a streamed completion and yield (text, finish_reason) pairs
+        with self.post(messages, model, temperature, max_tokens, stream=True) as response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                chunk = json.loads(data)
+                if not chunk.get('choices'):
+                    continue
+                choice = chunk['choices'][0]
+                content = choice.get('delta', {}).get('content') or ''
+                if content or choice.get('finish_reason'):
+                    yield content, choice.get('finish_reason')
+
+class MockBackend:
+    def __init__(self, latency_ms=0, token_ms=0, seed=0):
+        self.latency_ms = latency_ms  # Delay of every call (before the first piece when streaming)
+        self.token_ms = token_ms  # Delay between streamed pieces
+        self.seed = seed
+        self.request_count = 0
+        self.cache_scope = f"mock:{seed}"
+
+    def response_text(self, messages, model):
+        # A code-like response about as long as the prompt (revisions echo the whole file), seeded by the request
+        key = json.dumps({'seed': self.seed, 'model': model, 'messages': messages}, sort_keys=True)
+        rng = random.Random(hashlib.sha256(key.encode('utf-8')).hexdigest())
+        line_count = max(1, len(messages[-1]['content']) // 60)
+        words = ['value', 'result', 'items', 'index', 'config', 'response', 'total', 'name', 'path', 'data']
+        return ''.join(f"{'    ' * rng.randint(0, 2)}{rng.choice(words)}_{i} = {rng.choice(words)}({rng.randint(0, 99)})\n"
+                       for i in range(line_count))
+
+    def build(self, messages, model, max_tokens):
+        self.request_count += 1
+        # A continuation request (the partial answer sent back as an assistant message) gets the rest of the same answer
+        assistant_index = next((i for i, message in enumerate(messages) if message['role'] == 'assistant'), None)
+        if assistant_index is None:
+            content = self.response_text(messages, model)
+        else:
+            content = self.response_text(messages[:assistant_index], model)[len(messages[assistant_index]['content']):]
+        # Cut the response off at `max_tokens` (about 4 characters per token), like a real model
+        if max_tokens is not None and len(content) > max_tokens * 4:
+            return Completion(content[:max_tokens * 4], 'length')
+        return Completion(content, 'stop')
+
+    def complete(self, messages, model, temperature=None, max_tokens=None):
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self.build(messages, model, max_tokens)
+
+    async def acomplete(self, messages, model, temperature=None, max_tokens=None):
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        return self.build(messages, model, max_tokens)
+
+    async def aclose(self):
+        pass
+
+    def stream(self, messages, model, temperature=None, max_tokens=None):
+        completion = self.complete(messages, model, temperature, max_tokens)
+        lines = completion.content.splitlines(keepends=True)
+        for index, line in enumerate(lines):
+            if self.token_ms:
+                time.sleep(self.token_ms / 1000)
+            yield line, completion.finish_reason if index == len(lines) - 1 else None
+
+def cache_scope(backend):
+    # Extra cache key parameters that keep the responses of different backends apart in a shared response cache
+    scope = getattr(backend, 'cache_scope', None)
+    return {'backend': scope} if scope else {}
+
+BACKENDS = {
+    'openai': OpenAIBackend,
+    'openai-compatible': OpenAICompatibleBackend,
+    'mock': MockBackend,
+}
+
+def create_backend(name='openai', api_base=None, api_key=None, timeout=DEFAULT_TIMEOUT, pool_size=DEFAULT_POOL_SIZE):
+    # Build a backend by name with its connection settings
+    if name == 'openai':
+        return OpenAIBackend(api_key, api_base, timeout, pool_size)
+    if name == 'openai-compatible':
+        if not api_base:
+            raise ValueError("The openai-compatible backend needs an API base URL")
+        return OpenAICompatibleBackend(api_base, api_key, timeout, pool_size)
+    if name == 'mock':
+        return MockBackend()
+    raise ValueError(f"Unknown LLM backend '{name}', expected one of: {', '.join(BACKENDS)}")
+
+def create_backend_from_env():
+    # Backend of the web app: LLM_BACKEND, LLM_API_BASE, LLM_API_KEY, LLM_TIMEOUT and LLM_POOL_SIZE
+    return create_backend(
+        os.environ.get('LLM_BACKEND', 'openai'),
+        os.environ.get('LLM_API_BASE') or None,
+        os.environ.get('LLM_API_KEY') or None,
+        float(os.environ.get('LLM_TIMEOUT', DEFAULT_TIMEOUT)),
+        int(os.environ.get('LLM_POOL_SIZE', DEFAULT_POOL_SIZE))
+    )
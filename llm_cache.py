@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Content-addressed on-disk cache of LLM responses.
+# Entries are keyed by a hash of the model, the messages (system message and prompt) and the sampling parameters,
+# and the least recently used entries are evicted once the cache grows past its size limit.
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.llm_cache')
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024  # 512 MB
+
+def make_cache_key(model, messages, **params):
+    # Hash everything that influences the completion; `sort_keys` keeps the key independent of argument order
+    payload = json.dumps({'model': model, 'messages': messages, 'params': params}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def completion_cache_key(model, messages, max_tokens=None, temperature=None, **scope):
+    # Key of a revision answer, shared by the web app, the revision engine and the batch mode so they use the same
+    # entries; `continued` keeps apart answers cached before truncated answers were continued, which may be incomplete,
+    # and `scope` holds the `llm_backends.cache_scope` of the backend
+    params = {'max_tokens': max_tokens, 'continued': True, **scope}
+    if temperature is not None:
+        params['temperature'] = temperature
+    return make_cache_key(model, messages, **params)
+
+class ResponseCache:
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Index of key -> size, ordered from least to most recently used (file modification time survives restarts)
+        entries = []
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(directory, name))
+                entries.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        self.entries = OrderedDict((key, size) for _, key, size in sorted(entries))
+        self.total_bytes = sum(self.entries.values())
+
+    def path_for(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        # Return the cached response text, or None on a miss
+        path = self.path_for(key)
+        with self.lock:
+            try:
+                with open(path, 'r', encoding='utf-8') as file:
+                    content = json.load(file)['content']
+            except (OSError, ValueError, KeyError):
+                # Missing (or evicted by another process) or unreadable entry
+                if key in self.entries:
+                    self.total_bytes -= self.entries.pop(key)
+                self.misses += 1
+                return None
+
+            # Mark the entry as most recently used, in memory and on disk
+            if key not in self.entries:
+                self.entries[key] = os.path.getsize(path)
+                self.total_bytes += self.entries[key]
+            self.entries.move_to_end(key)
+            os.utime(path)
+            self.hits += 1
+            return content
+
+    def put(self, key, content):
+        # Step 1: Write the entry atomically, so concurrent readers never see a partial file
+        data = json.dumps({'content': content}).encode('utf-8')
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'wb') as file:
+            file.write(data)
+        os.replace(temp_path, self.path_for(key))
+
+        with self.lock:
+            # Step 2: Update the index
+            self.total_bytes += len(data) - self.entries.pop(key, 0)
+            self.entries[key] = len(data)
+
+            # Step 3: Evict the least recently used entries until the cache fits its size limit again
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                old_key, old_size = self.entries.popitem(last=False)
+                self.total_bytes -= old_size
+                self.evictions += 1
+                try:
+                    os.remove(self.path_for(old_key))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+            }
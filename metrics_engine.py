@@ -0,0 +1,148 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from nltk.stem import porter
+from nltk.translate.bleu_score import sentence_bleu
+from rouge_score import tokenize as rouge_tokenize
+
+# Similarity metrics between original and revised files, for one pair or a whole project at once.
+# The scores are the same as those of `sklearn`-style set precision/recall, `nltk`'s sentence BLEU and
+# `rouge_score`'s RougeScorer(['rouge1', 'rougeL'], use_stemmer=True), but the expensive parts are set up once per
+# process: Porter stems are memoized, and ROUGE-L uses a bit-parallel longest common subsequence after trimming the
+# unchanged start and end of the file instead of a full table. Large batches are spread over a process pool.
+
+MIN_PARALLEL_PAIRS = 16  # Smaller batches are scored in the calling process
+PAIRS_PER_TASK = 20  # Pairs sent to a worker at a time
+
+class CachingStemmer:
+    # Porter stemmer that remembers every word it stemmed; code repeats the same identifiers over and over
+    def __init__(self):
+        self.stemmer = porter.PorterStemmer()
+        self.stems = {}
+
+    def stem(self, word):
+        stem = self.stems.get(word)
+        if stem is None:
+            stem = self.stems[word] = self.stemmer.stem(word)
+        return stem
+
+_stemmer = None
+
+def get_stemmer():
+    # One stemmer (and stem cache) per process
+    global _stemmer
+    if _stemmer is None:
+        _stemmer = CachingStemmer()
+    return _stemmer
+
+def fmeasure(precision, recall):
+    return 2 * precision * recall / (precision + recall) if precision + recall > 0 else 0.0
+
+def lcs_length(first, second):
+    # Step 1: Tokens at the start and end that did not change are always part of a longest common subsequence
+    start = 0
+    while start < len(first) and start < len(second) and first[start] == second[start]:
+        start += 1
+    end = 0
+    while end < len(first) - start and end < len(second) - start and first[-1 - end] == second[-1 - end]:
+        end += 1
+    first = first[start:len(first) - end]
+    second = second[start:len(second) - end]
+    if not first or not second:
+        return start + end
+
+    # Step 2: Bit-parallel LCS (Hyyrö) over the changed middle: one big-integer step per token instead of a table row
+    masks = {}
+    for index, token in enumerate(second):
+        masks[token] = masks.get(token, 0) | (1 << index)
+    all_ones = (1 << len(second)) - 1
+    vector = all_ones
+    for token in first:
+        matches = vector & masks.get(token, 0)
+        vector = ((vector + matches) | (vector - matches)) & all_ones
+    return start + end + len(second) - bin(vector).count('1')
+
+def rouge_scores(target, prediction):
+    # ROUGE-1 and ROUGE-L F-measures, identical to `rouge_score` with `use_stemmer=True`
+    target_tokens = rouge_tokenize.tokenize(target, get_stemmer())
+    prediction_tokens = rouge_tokenize.tokenize(prediction, get_stemmer())
+
+    # ROUGE-1 from unigram overlaps
+    target_counts = Counter(target_tokens)
+    prediction_counts = Counter(prediction_tokens)
+    overlap = sum(min(count, prediction_counts[token]) for token, count in target_counts.items())
+    rouge1 = fmeasure(overlap / max(len(prediction_tokens), 1), overlap / max(len(target_tokens), 1))
+
+    # ROUGE-L from the longest common subsequence
+    if not target_tokens or not prediction_tokens:
+        return rouge1, 0.0
+    lcs = lcs_length(target_tokens, prediction_tokens)
+    return rouge1, fmeasure(lcs / len(prediction_tokens), lcs / len(target_tokens))
+
+# Function to calculate every metric for one original/revised pair of files (as lists of lines)
+def score_pair(original_lines, revised_lines):
+    # Step 1: Tokenize the original and revised lines by stripping extra spaces
+    original_tokens = [line.strip() for line in original_lines]
+    revised_tokens = [line.strip() for line in revised_lines]
+
+    # Step 2: Calculate precision, recall, F1 and exact match over the sets of lines
+    original_set = set(original_tokens)
+    revised_set = set(revised_tokens)
+    true_positives = len(original_set & revised_set)
+    false_positives = len(revised_set - original_set)
+    false_negatives = len(original_set - revised_set)
+    precision = true_positives / (true_positives + false_positives) if (true_positives + false_positives) > 0 else 0
+    recall = true_positives / (true_positives + false_negatives) if (true_positives + false_negatives) > 0 else 0
+    f1 = (2 * precision * recall) / (precision + recall) if (precision + recall) > 0 else 0
+    exact_match = true_positives / len(original_tokens) if original_tokens else 0
+
+    # Step 3: Calculate BLEU and ROUGE scores
+    bleu = sentence_bleu([original_tokens], revised_tokens)
+    rouge1, rougeL = rouge_scores("\n".join(original_tokens), "\n".join(revised_tokens))
+
+    # Step 4: Convert all metrics to percentages
+    return {
+        'precision': precision * 100,
+        'recall': recall * 100,
+        'f1_score': f1 * 100,
+        'exact_match': exact_match * 100,
+        'bleu_score': bleu * 100,
+        'rouge1_fmeasure': rouge1 * 100,
+        'rougeL_fmeasure': rougeL * 100
+    }
+
+def read_lines(path):
+    with open(path, 'r', encoding='utf-8', errors='replace') as file:
+        return file.readlines()
+
+def score_file_pair(original_path, revised_path):
+    # Score two files on disk; a file that cannot be read gives an 'error' entry instead of metrics
+    try:
+        return score_pair(read_lines(original_path), read_lines(revised_path))
+    except OSError as e:
+        return {'error': str(e)}
+
+def score_pair_chunk(pairs):
+    return [score_pair(original_lines, revised_lines) for original_lines, revised_lines in pairs]
+
+def score_file_chunk(pairs):
+    return [score_file_pair(original_path, revised_path) for original_path, revised_path in pairs]
+
+def run_batched(score_chunk, pairs, max_workers=None):
+    # Score the pairs in order, in chunks spread over a process pool (each worker sets up its stemmer once)
+    pairs = list(pairs)
+    if len(pairs) < MIN_PARALLEL_PAIRS or max_workers == 1:
+        return score_chunk(pairs)
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = max(1, min(PAIRS_PER_TASK, len(pairs) // max_workers))
+    chunks = [pairs[index:index + chunk_size] for index in range(0, len(pairs), chunk_size)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return [metrics for chunk in executor.map(score_chunk, chunks) for metrics in chunk]
+
+# Function to score a list of (original lines, revised lines) pairs in one batched pass
+def score_pairs(pairs, max_workers=None):
+    return run_batched(score_pair_chunk, pairs, max_workers)
+
+# Function to score a list of (original path, revised path) pairs; workers read the files themselves
+def score_files(path_pairs, max_workers=None):
+    return run_batched(score_file_chunk, path_pairs, max_workers)
@@ -0,0 +1,117 @@
+import re
+from issue_windows import LINE_NUMBER_PREFIX, CODE_FENCE
+
+# Patch-format revisions: instead of echoing the whole file, the model returns a unified diff against the numbered
+# file it was sent (see `read_file_contents`), and the diff is applied locally. Models often get line numbers,
+# counts or whitespace slightly wrong, so each hunk is looked up near its stated position by its content, with
+# progressively looser matching, before it is applied.
+
+HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+MAX_FUZZ = 2  # Context lines that may be dropped from each end of a hunk that does not match as sent
+
+PATCH_INSTRUCTIONS = (
+    """Do not send back the whole file. Send back only a unified diff of your changes against the numbered original code above:\n"""
+    """- Start each hunk with a header such as "@@ -12,4 +12,5 @@", using the line numbers shown in the original code.\n"""
+    """- Prefix unchanged context lines with a space, removed lines with "-" and added lines with "+", and include 2 unchanged lines of context around each change.\n"""
+    """- Do not include the line numbers in the diff lines, and do not add any other text.\n"""
+)
+
+class PatchError(Exception):
+    pass
+
+# Function to number the lines of a file like `read_file_contents`
+def number_lines(text):
+    return ''.join(f"{i + 1}: {line}" for i, line in enumerate(text.splitlines(keepends=True)))
+
+# Function to read the hunks of a unified diff as (old start line, [(operation, text), ...]) pairs
+def parse_unified_diff(patch_text):
+    hunks = []
+    for line in patch_text.splitlines():
+        match = HUNK_HEADER.match(line)
+        if match:
+            hunks.append((int(match.group(1)), []))
+            continue
+        if not hunks or CODE_FENCE.match(line) or line.startswith(('--- ', '+++ ', '\\')):
+            continue  # File headers, code fences and "\ No newline at end of file" markers
+        if line == '':
+            hunks[-1][1].append((' ', ''))  # Models often drop the space of blank context lines
+        elif line[0] in ' -+':
+            hunks[-1][1].append((line[0], line[1:]))
+
+    # Remove line-number prefixes if the model echoed them back on every context and removed line
+    for _, hunk_lines in hunks:
+        numbered = [text for operation, text in hunk_lines if operation != '+' and text.strip()]
+        if numbered and all(LINE_NUMBER_PREFIX.match(text) for text in numbered):
+            hunk_lines[:] = [(operation, LINE_NUMBER_PREFIX.sub('', text, count=1)) for operation, text in hunk_lines]
+    return [(start, hunk_lines) for start, hunk_lines in hunks if hunk_lines]
+
+# Function to find where the old lines of a hunk are in the file, searching outwards from the expected position
+def find_hunk(lines, old_lines, expected, lowest):
+    # Exact matches win over matches that ignore trailing whitespace, which win over matches that ignore all indentation
+    for normalize in (lambda text: text, str.rstrip, str.strip):
+        wanted = [normalize(text) for text in old_lines]
+        highest = len(lines) - len(old_lines)
+        # Search every position, also when the stated line number is past the end of the file
+        for distance in range(0, max(expected, len(lines)) + 1):
+            for position in (expected - distance, expected + distance) if distance else (expected,):
+                if lowest <= position <= highest and [normalize(text) for text in lines[position:position + len(old_lines)]] == wanted:
+                    return position
+    return None
+
+# Function to apply a unified diff to the original text and return the revised text
+def apply_patch(original_text, patch_text, max_fuzz=MAX_FUZZ):
+    hunks = parse_unified_diff(patch_text)
+    if not hunks:
+        if patch_text.strip():
+            raise PatchError("The response does not contain any diff hunks")
+        return original_text  # An empty answer means nothing had to change
+
+    newline = '\r\n' if '\r\n' in original_text else '\n'
+    lines = original_text.splitlines()
+    final_newline = original_text.endswith(('\n', '\r'))
+
+    # Apply the hunks in order; `offset` tracks how far earlier hunks moved the lines below them
+    offset = 0
+    lowest = 0  # Hunks may not overlap the ones already applied
+    for number, (old_start, hunk_lines) in enumerate(hunks, start=1):
+        # Step 1: Look the hunk up, dropping up to `max_fuzz` context lines from its ends if it does not match as sent
+        position = None
+        for fuzz in range(max_fuzz + 1):
+            head = 0
+            while head < fuzz and head < len(hunk_lines) and hunk_lines[head][0] == ' ':
+                head += 1
+            tail = 0
+            while tail < fuzz and tail < len(hunk_lines) - head and hunk_lines[-1 - tail][0] == ' ':
+                tail += 1
+            trimmed = hunk_lines[head:len(hunk_lines) - tail]
+            old_lines = [text for operation, text in trimmed if operation != '+']
+            expected = max(0, old_start - 1 + offset + head)
+            if not old_lines:
+                if fuzz:
+                    break  # Fuzz removed all of the context, so the lines could be inserted anywhere: no match
+                # A pure insertion: "@@ -12,0 ..." inserts after line 12
+                position = min(max(lowest, old_start + offset), len(lines))
+                break
+            position = find_hunk(lines, old_lines, expected, lowest)
+            if position is not None:
+                break
+        if position is None:
+            raise PatchError(f"Hunk {number} (near line {old_start}) does not match the original code")
+
+        # Step 2: Replace the old lines, keeping the file's own text for context lines
+        replacement = []
+        cursor = position
+        for operation, text in trimmed:
+            if operation == ' ':
+                replacement.append(lines[cursor])
+                cursor += 1
+            elif operation == '-':
+                cursor += 1
+            else:
+                replacement.append(text)
+        lines[position:cursor] = replacement
+        offset += len(replacement) - (cursor - position)
+        lowest = position + len(replacement)
+
+    revised_text = newline.join(lines)
+    return revised_text + newline if final_newline and lines else revised_text
@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+from revision_engine import revise_all, DEFAULT_MAX_IN_FLIGHT
+from token_budget import plan_revision, reassemble_chunks, count_message_tokens
+from patch_edits import PATCH_INSTRUCTIONS, PatchError, apply_patch, number_lines
+from batch_submission import revise_in_batches, BATCH_STATE_FILE_NAME, DEFAULT_POLL_INTERVAL
+
+# Whole-project revision pipeline shared by the batch script and the background jobs of the web app.
+# The issues of each file are gathered into one prompt (or several, for files too large for any model),
+# every prompt is sent through the revision engine, and each revised file is saved as soon as it is complete.
+
+SYSTEM_MESSAGE = "You are a code developer and code assistant. Ensure that in output you should just generate the revised code without additional texts. DO NOT ADD ``` that shows the type of file language at the beginning of the file."
+
+# Function to build the prompt for one file and its bug details
+def build_prompt(original_code, bug_details):
+    # Prepare the bug details for the prompt
+    all_bugs = "\n".join([f"\nCode issue {i+1} detected by SonarQube is on line {bug[0]}, Description of how to solve the code issue is:{bug[1]}" for i, bug in enumerate(bug_details)])
+
+    # Formulate the AI prompt with the original code and bug details
+    return (
+        f"""Please fix the issues and send back the corrected code without any additional details or descriptions.
+        Ensure that the edited parts are included in the complete code, and all the original lines of code are preserved.
+        The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.
+        Here is the original code:
+
+        {original_code}
+
+        The code issues detected by SonarQube are:
+        {all_bugs}
+
+        If the same code issue is present on other lines, please fix those as well.
+        Resolve this bug based on the SonarQube database, and send the corrected code back to me as specified.
+        Ensure the code format matches the original code file.
+        Please only send the code file itself, without any additional details or descriptions (such as the file type or other information).
+        """
+    )
+
+# Function to build the chat messages for a file (or a chunk of a file)
+def build_messages(code, bug_details):
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": build_prompt(code, bug_details)}
+    ]
+
+# Function to build the chat messages that ask only for a unified diff of the changes ("patch" output format)
+def build_patch_messages(code, bug_details):
+    all_bugs = "\n".join([f"\nCode issue {i+1} detected by SonarQube is on line {bug[0]}, Description of how to solve the code issue is:{bug[1]}" for i, bug in enumerate(bug_details)])
+    prompt = (
+        f"""Please fix the issues and send back your changes as a unified diff without any additional details or descriptions.
+        The programming language used in the provided code is important for fixing the issues. It may include JavaScript (JSX), YAML, or JavaScript for testing purposes.
+        Here is the original code, with line numbers:
+
+        {number_lines(code)}
+
+        The code issues detected by SonarQube are:
+        {all_bugs}
+
+        If the same code issue is present on other lines, please fix those as well.
+        {PATCH_INSTRUCTIONS}"""
+    )
+    return [
+        {"role": "system", "content": "You are a code developer and code assistant. Ensure that in output you should just generate a unified diff of the revised code without additional texts."},
+        {"role": "user", "content": prompt}
+    ]
+
+OUTPUT_FORMATS = {'file': build_messages, 'patch': build_patch_messages}
+
+# Function to group the CSV lines into (file location, file name, bug details) per run of lines of the same file
+def group_issues_by_file(lines):
+    last_file_location = None
+    last_file_name = None
+    bug_details = []
+    for line in lines:
+        current_file_location = line.get('file_Location')
+
+        # Hand over the previous file once the file location changes
+        if current_file_location != last_file_location and last_file_location is not None:
+            yield last_file_location, last_file_name, bug_details
+            bug_details = []  # Reset the bug details for the new file
+
+        bug_details.append((line.get('line'), line.get('message')))
+        last_file_location = current_file_location
+        last_file_name = line.get('file_name')
+
+    # Hand over the remaining bugs of the last file
+    if last_file_location is not None:
+        yield last_file_location, last_file_name, bug_details
+
+# Function to hash everything sent for one file (models, prompts and unchanged chunks), for the run manifest
+def prompt_hash(requests):
+    payload = json.dumps([(model, code if messages is None else messages) for model, _, code, _, messages in requests])
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+# Function to build the revision jobs of every file listed in the CSV lines
+def plan_project_jobs(lines, models, output_format='file'):
+    # Returns the jobs and, for files split into chunks, the list of chunks (unchanged chunks already filled in).
+    # With the "patch" output format each job also keeps the code it was built from, to apply the returned diff to.
+    jobs = []
+    revised_chunks = {}
+    for location, name, details in group_issues_by_file(lines):
+        if not location or not os.path.exists(location):
+            continue
+        with open(location, 'r') as file:
+            original_code = file.read()
+
+        # Measure the prompt and pick a model whose context fits it, or split the file into chunks that fit
+        requests = plan_revision(original_code, details, OUTPUT_FORMATS[output_format], models)
+        file_prompt_hash = prompt_hash(requests)
+        if len(requests) > 1:
+            print(f"{location} is too large for one request, sending it in {len(requests)} chunks")
+            revised_chunks[location] = [None if messages else code for _, _, code, _, messages in requests]
+
+        for chunk_index, (model, _, code, _, messages) in enumerate(requests):
+            if messages is None:
+                continue  # Chunks without issues are kept as they are
+            job = {
+                'file_location': location,
+                'file_name': name,
+                'chunk_index': chunk_index,
+                'chunk_count': len(requests),
+                'model': model,
+                'messages': messages,
+                'estimated_tokens': 2 * count_message_tokens(messages, model),
+                'prompt_hash': file_prompt_hash
+            }
+            if output_format == 'patch':
+                job['original_code'] = code
+            jobs.append(job)
+    return jobs, revised_chunks
+
+# Function to build the path of the revised copy of a file
+def revised_file_path(file_location, file_name, to_remove, to_add):
+    # The directory of the original file is moved from `to_remove` to `to_add`, and "Revised." is prepended to the name
+    directory = os.path.dirname(file_location)
+    revised_location = to_add + directory[len(to_remove):]
+    return os.path.join(revised_location, f"Revised.{file_name}")
+
+# Function to save the AI response to a file
+def save_revised_file(content, output_file_path):
+    # Create directories as necessary and save the content to the output file
+    os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+    with open(output_file_path, 'w') as output_file:
+        output_file.write(content)
+
+# Function to revise every file listed in the CSV lines and save the revised copies
+def revise_project(lines, to_remove, to_add, model, candidate_models=None, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                   requests_per_minute=None, tokens_per_minute=None, cache=None, on_saved=None, manifest=None,
+                   backend=None, limiter=None, retry_policy=None, dead_letters=None, output_format='file',
+                   batch_client=None, poll_interval=DEFAULT_POLL_INTERVAL):
+    # `on_saved(file_location, output_file_path, error)` is called once per file, as soon as it is saved or has failed.
+    # `manifest` is an optional `run_manifest.RunManifest`; files it lists as completed with the same prompt are skipped.
+    # `limiter`, `retry_policy` and `dead_letters` are optional `rate_limiter` objects (see `revision_engine.py`).
+    # `output_format` is "file" (the model sends back the whole revised file) or "patch" (only a diff, applied here).
+    # With a `batch_client` (see `batch_submission.py`) the prompts are submitted as batches instead of one call each.
+    jobs, revised_chunks = plan_project_jobs(lines, candidate_models or [model], output_format)
+
+    # Step 1: Skip the files completed by an earlier, interrupted attempt at this run and mark the others as pending
+    skipped_files = set()
+    if manifest is not None:
+        skipped_files = {job['file_location'] for job in jobs if manifest.is_completed(job['file_location'], job['prompt_hash'])}
+        jobs = [job for job in jobs if job['file_location'] not in skipped_files]
+        for location in skipped_files:
+            revised_chunks.pop(location, None)
+        pending_files = {job['file_location']: job for job in jobs}
+        for location, job in pending_files.items():
+            manifest.record(location, 'pending', job['prompt_hash'],
+                            revised_file_path(location, job['file_name'], to_remove, to_add))
+
+    # Answers the engine counted as completed but that could not be applied or saved; they are counted as failures
+    save_failures = []
+
+    def report(job, output_file_path, error):
+        if manifest is not None:
+            manifest.record(job['file_location'], 'failed' if error is not None else 'completed', job['prompt_hash'],
+                            output_file_path, str(error) if error is not None else None)
+        if on_saved is not None:
+            on_saved(job['file_location'], output_file_path, error)
+
+    # Function to save one completed revision as soon as it arrives
+    def on_revision_completed(job, content, error):
+        # Apply a returned diff to the code it was made for; a diff that does not match fails the file like an API error
+        if error is None and 'original_code' in job:
+            try:
+                content = apply_patch(job['original_code'], content.strip())
+            except PatchError as e:
+                error = e
+                save_failures.append(job)
+
+        if error is not None:
+            # A file with a failed chunk cannot be reassembled, so it is only reported once
+            if job['chunk_count'] == 1 or revised_chunks.pop(job['file_location'], None) is not None:
+                report(job, None, error)
+            return
+
+        # Reassemble chunked files once every chunk has been revised
+        if job['chunk_count'] > 1:
+            chunks = revised_chunks.get(job['file_location'])
+            if chunks is None:
+                return  # Another chunk of this file already failed
+            chunks[job['chunk_index']] = content
+            if any(chunk is None for chunk in chunks):
+                return
+            content = reassemble_chunks(revised_chunks.pop(job['file_location']))
+
+        # Save the generated content to the appropriate file location
+        output_file_path = revised_file_path(job['file_location'], job['file_name'], to_remove, to_add)
+        try:
+            save_revised_file(content, output_file_path)
+        except Exception as e:
+            save_failures.append(job)
+            report(job, output_file_path, e)
+            return
+        report(job, output_file_path, None)
+
+    # Step 2: In batch mode, submit every prompt at once and wait for the batches; answers that came back cut off
+    # (or not at all) are sent through the revision engine below, which continues truncated answers
+    batch_summary = None
+    if batch_client is not None:
+        batch_summary = revise_in_batches(jobs, on_revision_completed, model, batch_client,
+                                          os.path.join(to_add, BATCH_STATE_FILE_NAME), poll_interval, temperature=0.0,
+                                          cache=cache, backend=backend)
+        jobs_to_send = batch_summary.pop('incomplete')
+        if jobs_to_send:
+            print(f"Sending {len(jobs_to_send)} requests without a complete batch result one by one")
+    else:
+        jobs_to_send = jobs
+
+    # Step 3: Send every remaining prompt with a bounded number of requests in flight
+    summary = revise_all(
+        jobs_to_send,
+        on_revision_completed,
+        model=model,
+        max_in_flight=max_in_flight,
+        requests_per_minute=requests_per_minute,
+        tokens_per_minute=tokens_per_minute,
+        temperature=0.0,
+        cache=cache,
+        backend=backend,
+        limiter=limiter,
+        retry_policy=retry_policy,
+        dead_letters=dead_letters
+    )
+    if batch_summary is not None:
+        for key, value in batch_summary.items():
+            summary[key] = summary.get(key, 0) + value
+    summary['completed'] -= len(save_failures)
+    summary['failed'] += len(save_failures)
+    summary['files'] = len({job['file_location'] for job in jobs})
+    summary['skipped'] = len(skipped_files)
+    return summary
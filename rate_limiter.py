@@ -0,0 +1,206 @@
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+import openai
+import requests
+
+# Shared rate limiting and retries for completion calls.
+# Requests and tokens per minute are each metered by a token bucket that adapts to the rate-limit headers the provider
+# sends back (x-ratelimit-*, retry-after). Transient failures (429, 5xx, timeouts, dropped connections) are retried with
+# jittered exponential backoff, and calls that still fail are recorded in a dead-letter list instead of stopping a run.
+
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 1.0  # Seconds before the first retry (before jitter)
+DEFAULT_MAX_DELAY = 60.0  # Longest wait between two attempts
+DEAD_LETTER_FILE_NAME = '.wall_dead_letters.jsonl'  # Kept next to the run manifest by the batch script
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+
+class TokenBucket:
+    # Refills `per_minute` units evenly over a minute; `None` or 0 disables the bucket.
+    # Callers reserve units up front and wait off any debt, so waiters are served in order and can use threads or asyncio.
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.available = per_minute or 0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def refill(self):
+        now = time.monotonic()
+        self.available = min(self.per_minute, self.available + (now - self.updated) * self.per_minute / 60)
+        self.updated = now
+
+    def reserve(self, amount=1):
+        # Take `amount` units and return how many seconds to wait before using them
+        if not self.per_minute:
+            return 0
+        with self.lock:
+            self.refill()
+            # A single request larger than the whole budget is let through once the bucket is full
+            self.available -= min(amount, self.per_minute)
+            return max(0.0, -self.available * 60 / self.per_minute)
+
+    async def acquire(self, amount=1):
+        await asyncio.sleep(self.reserve(amount))
+
+    def acquire_blocking(self, amount=1):
+        time.sleep(self.reserve(amount))
+
+    def adapt(self, limit=None, remaining=None):
+        # Follow the provider: its limit becomes the refill rate (enabling a disabled bucket), and its remaining count
+        # caps what is left
+        with self.lock:
+            if limit:
+                if self.per_minute:
+                    self.refill()
+                else:
+                    self.available = limit
+                    self.updated = time.monotonic()
+                self.per_minute = limit
+                self.available = min(self.available, limit)
+            if remaining is not None and self.per_minute:
+                self.refill()
+                self.available = min(self.available, remaining)
+
+    def pause(self, seconds):
+        # Hold back every caller for `seconds`, e.g. after a 429 with a retry-after header
+        if not self.per_minute:
+            return
+        with self.lock:
+            self.refill()
+            self.available = min(self.available, -seconds * self.per_minute / 60)
+
+def parse_duration(value):
+    # Parse reset durations such as "1s", "6m0s", "20ms" or plain seconds; None when absent or malformed
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+def parse_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+class RateLimiter:
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+    async def acquire(self, tokens):
+        await self.requests.acquire(1)
+        await self.tokens.acquire(tokens)
+
+    def acquire_blocking(self, tokens):
+        self.requests.acquire_blocking(1)
+        self.tokens.acquire_blocking(tokens)
+
+    def observe(self, headers):
+        # Adapt both buckets to the rate-limit headers of a response (any mapping; names are case-insensitive)
+        if not headers:
+            return
+        headers = {str(name).lower(): value for name, value in dict(headers).items()}
+        self.requests.adapt(parse_int(headers.get('x-ratelimit-limit-requests')),
+                            parse_int(headers.get('x-ratelimit-remaining-requests')))
+        self.tokens.adapt(parse_int(headers.get('x-ratelimit-limit-tokens')),
+                          parse_int(headers.get('x-ratelimit-remaining-tokens')))
+
+    def back_off(self, seconds):
+        self.requests.pause(seconds)
+
+class RetryPolicy:
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def delay(self, attempt, retry_after=None):
+        # "Full jitter" exponential backoff, never shorter than what the provider asked for
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        return max(backoff, retry_after or 0)
+
+class DeadLetterList:
+    # Calls that failed for good, kept in memory and optionally appended to a JSON Lines file
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = []
+        self.lock = threading.Lock()
+
+    def add(self, key, error, attempts, details=None):
+        entry = {'key': key, 'error': f"{type(error).__name__}: {error}", 'attempts': attempts,
+                 'details': details or {}, 'failed_at': time.time()}
+        with self.lock:
+            self.entries.append(entry)
+            if self.path:
+                with open(self.path, 'a', encoding='utf-8') as file:
+                    file.write(json.dumps(entry) + '\n')
+
+    def __len__(self):
+        return len(self.entries)
+
+def classify_error(error):
+    # Return (retryable, retry-after seconds, response headers) for an exception raised by a completion backend
+    headers = {}
+    status = None
+    if isinstance(error, openai.error.OpenAIError):
+        headers = dict(error.headers or {})
+        status = error.http_status
+        if isinstance(error, (openai.error.RateLimitError, openai.error.Timeout, openai.error.APIConnectionError,
+                              openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+            status = status or 429
+    elif isinstance(error, requests.HTTPError) and error.response is not None:
+        headers = dict(error.response.headers)
+        status = error.response.status_code
+    elif isinstance(error, (requests.Timeout, requests.ConnectionError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True, None, headers
+
+    lowered = {str(name).lower(): value for name, value in headers.items()}
+    retry_after = parse_duration(lowered.get('retry-after'))
+    if lowered.get('retry-after-ms') is not None:
+        retry_after = (parse_duration(lowered['retry-after-ms']) or 0) / 1000
+    return status in RETRYABLE_STATUS_CODES, retry_after, headers
+
+def handle_failure(error, attempt, limiter, policy, dead_letters=None, key=None):
+    # Feed a failed call back into the limiter and return how many seconds to wait before attempt `attempt + 1`,
+    # or None when the error is terminal or the attempts are used up (the call is then added to `dead_letters`)
+    retryable, retry_after, headers = classify_error(error)
+    limiter.observe(headers)
+    if retry_after:
+        limiter.back_off(retry_after)
+    if not retryable or attempt >= policy.max_attempts - 1:
+        if dead_letters is not None:
+            dead_letters.add(key, error, attempt + 1)
+        return None
+    return policy.delay(attempt, retry_after)
+
+def call_with_retries(call, limiter, policy, tokens, dead_letters=None, key=None, on_retry=None):
+    # Blocking variant for single calls: wait for the limiter, call, and retry transient failures; re-raises the last error
+    # `on_retry(attempt, delay, error)` is called before each retry, e.g. to report progress
+    attempt = 0
+    while True:
+        limiter.acquire_blocking(tokens)
+        try:
+            result = call()
+        except Exception as e:
+            delay = handle_failure(e, attempt, limiter, policy, dead_letters, key)
+            if delay is None:
+                raise
+            if on_retry is not None:
+                on_retry(attempt, delay, e)
+            time.sleep(delay)
+            attempt += 1
+            continue
+        limiter.observe(getattr(result, 'headers', None))
+        return result
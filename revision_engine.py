@@ -0,0 +1,114 @@
+import asyncio
+from llm_cache import completion_cache_key
+from llm_backends import OpenAIBackend, cache_scope
+from rate_limiter import RateLimiter, RetryPolicy, handle_failure
+from continuation import acomplete_with_continuation
+
+# Asyncio-based revision engine for whole-project runs.
+# Per-file prompts are fanned out with a bounded number of requests in flight, while staying under the
+# requests-per-minute and tokens-per-minute budgets of the API, and every result is handed back as soon as it completes.
+# Transient failures are retried with backoff; calls that still fail are reported (and dead-lettered) without stopping the run.
+# Answers cut off by `max_tokens` are continued and stitched together before they are handed back.
+
+DEFAULT_MAX_IN_FLIGHT = 8  # Maximum number of API requests running at the same time
+
+def estimate_tokens(messages, max_tokens=None):
+    # Rough offline estimate (about 4 characters per token) of what a request counts against the tokens-per-minute budget
+    prompt_tokens = sum(len(message['content']) for message in messages) // 4 + 4 * len(messages)
+    # Revisions echo the whole file back, so without `max_tokens` expect about as many output tokens as input tokens
+    return prompt_tokens + (max_tokens if max_tokens is not None else prompt_tokens)
+
+async def chat_completion(backend, messages, model, temperature=0.0, max_tokens=None):
+    # Send one prompt to the completion backend without blocking the event loop
+    return await backend.acomplete(messages, model, temperature, max_tokens)
+
+async def run_revision_jobs(jobs, on_result, model, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                            requests_per_minute=None, tokens_per_minute=None, temperature=0.0, max_tokens=None,
+                            cache=None, backend=None, limiter=None, retry_policy=None, dead_letters=None):
+    # `jobs` is a list of dicts with a 'messages' entry (and optionally their own 'model' and 'max_tokens');
+    # `on_result(job, content, error)` is called as each one completes
+    # `cache` is an optional `llm_cache.ResponseCache`; cached prompts are answered without calling the API
+    # `backend` is an `llm_backends` backend (the OpenAI API by default)
+    # `limiter` is a `rate_limiter.RateLimiter` that may be shared with other runs (one is built from the budgets otherwise),
+    # and calls that fail for good are added to `dead_letters`, an optional `rate_limiter.DeadLetterList`
+    backend = backend or OpenAIBackend()
+    semaphore = asyncio.Semaphore(max_in_flight)
+    limiter = limiter or RateLimiter(requests_per_minute, tokens_per_minute)
+    retry_policy = retry_policy or RetryPolicy()
+    summary = {'completed': 0, 'failed': 0, 'cached': 0, 'retries': 0, 'continuations': 0}
+
+    async def run(job):
+        job_model = job.get('model', model)
+        job_max_tokens = job.get('max_tokens', max_tokens)
+
+        # Step 0: Answer unchanged prompts from the cache, without waiting for a slot or a budget
+        cache_key = completion_cache_key(job_model, job['messages'], job_max_tokens, temperature, **cache_scope(backend))
+        content = cache.get(cache_key) if cache is not None else None
+        if content is not None:
+            summary['completed'] += 1
+            summary['cached'] += 1
+            on_result(job, content, None)
+            return
+
+        request_count = 0
+
+        async def call(messages):
+            # One request, retried on transient failures; continuation requests of a truncated answer also come here
+            nonlocal request_count
+            tokens = (job.get('estimated_tokens') if messages is job['messages'] else None) or estimate_tokens(messages, job_max_tokens)
+            for attempt in range(retry_policy.max_attempts):
+                async with semaphore:
+                    # Step 1: Wait until both the request and the token budgets allow another call
+                    await limiter.acquire(tokens)
+
+                    # Step 2: Call the API and let the limiter follow the rate-limit headers of the answer
+                    request_count += 1
+                    try:
+                        completion = await chat_completion(backend, messages, job_model, temperature, job_max_tokens)
+                        error = None
+                    except Exception as e:
+                        error = e
+
+                if error is None:
+                    limiter.observe(completion.headers)
+                    return completion
+
+                # Step 3: Retry transient failures after a jittered backoff (outside the slot, so other files keep going)
+                delay = handle_failure(error, attempt, limiter, retry_policy)
+                if delay is None:
+                    raise error
+                summary['retries'] += 1
+                await asyncio.sleep(delay)
+
+        # Step 4: Ask for the rest of answers cut off by `max_tokens`; a file that fails for good (or stays truncated)
+        # is reported without stopping the rest of the run
+        try:
+            completion, continuations = await acomplete_with_continuation(call, job['messages'])
+        except Exception as e:
+            summary['failed'] += 1
+            if dead_letters is not None:
+                dead_letters.add(job.get('file_location'), e, request_count, {'model': job_model})
+            on_result(job, None, e)
+            return
+        summary['continuations'] += continuations
+
+        # Step 5: Hand the result back straight away so it can be written to disk
+        content = completion.content
+        if cache is not None:
+            cache.put(cache_key, content)
+        summary['completed'] += 1
+        on_result(job, content, None)
+
+    try:
+        await asyncio.gather(*(run(job) for job in jobs))
+    finally:
+        await backend.aclose()  # Its asyncio connections cannot outlive this event loop
+    return summary
+
+def revise_all(jobs, on_result, model, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+               requests_per_minute=None, tokens_per_minute=None, temperature=0.0, max_tokens=None, cache=None, backend=None,
+               limiter=None, retry_policy=None, dead_letters=None):
+    # Synchronous entry point for scripts
+    return asyncio.run(run_revision_jobs(jobs, on_result, model, max_in_flight, requests_per_minute,
+                                         tokens_per_minute, temperature, max_tokens, cache, backend,
+                                         limiter, retry_policy, dead_letters))
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import time
+
+# Checkpoint manifest of a whole-project revision run.
+# Every status change of a file (pending, completed or failed, with its prompt hash and output path) is appended to a
+# JSON Lines file as it happens, so an interrupted run can be resumed: files completed with the same prompt are
+# skipped, and failed or unfinished files are sent again.
+
+MANIFEST_FILE_NAME = '.wall_revision_manifest.jsonl'  # Kept in the root of the revised files
+
+class RunManifest:
+    def __init__(self, path, run_info=None, resume=False):
+        self.path = path
+        self.run_info = run_info or {}
+        self.records = {}  # File location -> latest record
+        stored_run = {}  # Settings of the run that wrote the manifest
+
+        # Step 1: On resume, load the run settings and the latest record of every file
+        if resume and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A line cut off by a crash
+                    if 'run' in entry:
+                        self.run_info = {**entry['run'], **(run_info or {})}
+                        stored_run = entry['run']
+                    else:
+                        self.records[entry['file_location']] = entry
+
+            # A manifest left by a run with other settings (e.g. another CSV or model) is started again from scratch
+            if any(stored_run.get(key) != value for key, value in (run_info or {}).items()):
+                self.run_info = run_info
+                self.records = {}
+
+        # Step 2: Rewrite the manifest compactly (one line per file), then keep appending to it
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file_descriptor, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({'run': {**self.run_info, 'started_at': time.time()}}) + '\n')
+            for entry in self.records.values():
+                file.write(json.dumps(entry) + '\n')
+        os.replace(temp_path, path)
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def is_completed(self, file_location, prompt_hash):
+        # A file is done if it was completed with the same prompt and its revised copy is still there
+        entry = self.records.get(file_location)
+        return (entry is not None and entry['status'] == 'completed' and entry['prompt_hash'] == prompt_hash
+                and entry.get('output_path') is not None and os.path.exists(entry['output_path']))
+
+    def record(self, file_location, status, prompt_hash=None, output_path=None, error=None):
+        entry = {'file_location': file_location, 'status': status, 'prompt_hash': prompt_hash,
+                 'output_path': output_path, 'error': error, 'updated_at': time.time()}
+        self.records[file_location] = entry
+        # Flush every record, so a crash loses at most the line being written; finished files are also synced to disk
+        self.file.write(json.dumps(entry) + '\n')
+        self.file.flush()
+        if status != 'pending':
+            os.fsync(self.file.fileno())
+
+    def counts(self):
+        counts = {}
+        for entry in self.records.values():
+            counts[entry['status']] = counts.get(entry['status'], 0) + 1
+        return counts
+
+    def close(self):
+        self.file.close()
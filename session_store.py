@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import secrets
+import sqlite3
+import time
+from contextlib import closing
+
+# Shared, per-session state for the web app.
+# Every reviewer's uploaded issue set, cursor and preferences live in one SQLite database instead of module
+# globals, so the app can run under several worker processes (e.g. `gunicorn -w 4 app:app`) without one
+# reviewer's cursor overwriting another's.
+
+SESSION_MAX_AGE = 7 * 24 * 3600  # Sessions (and issue sets nobody uses any more) are purged after a week
+
+def load_or_create_secret_key(key_path):
+    # Every worker must sign session cookies with the same key, so it is created once and shared through a file
+    try:
+        file_descriptor = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        with open(key_path, 'r') as file:
+            return file.read().strip()
+    key = secrets.token_hex(32)
+    with os.fdopen(file_descriptor, 'w') as file:
+        file.write(key)
+    return key
+
+class SessionStore:
+    def __init__(self, db_path, defaults):
+        self.db_path = db_path
+        self.defaults = defaults
+
+        # Create the tables once; WAL mode lets readers in other workers proceed while one worker writes
+        with closing(self.connect()) as connection, connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                state TEXT NOT NULL,
+                updated_at REAL NOT NULL)""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS issue_rows (
+                issue_set_id TEXT NOT NULL,
+                row_index INTEGER NOT NULL,
+                group_end INTEGER NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (issue_set_id, row_index))""")
+            connection.execute("""CREATE TABLE IF NOT EXISTS issue_files (
+                issue_set_id TEXT NOT NULL,
+                file_name TEXT NOT NULL,
+                first_row INTEGER NOT NULL,
+                PRIMARY KEY (issue_set_id, file_name))""")
+
+    def connect(self):
+        # One short-lived connection per operation keeps the store safe across threads and processes
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    ### Per-session state ###
+
+    def get_state(self, session_id):
+        with closing(self.connect()) as connection:
+            row = connection.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return {**self.defaults, **(json.loads(row[0]) if row else {})}
+
+    def save_state(self, session_id, state):
+        with closing(self.connect()) as connection, connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), time.time()))
+
+    def purge_expired(self, keep=(), max_age=SESSION_MAX_AGE):
+        # Drop old sessions, then every issue set that no remaining session points to and that is not in `keep`
+        # (the issue sets still needed by unfinished jobs, see `JobQueue.unfinished_params`).
+        # The DELETE takes the write lock first, so no upload can store a new reference while the references are read
+        with closing(self.connect()) as connection, connection:
+            connection.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - max_age,))
+            used = {json.loads(state).get('issue_set_id') for (state,) in connection.execute("SELECT state FROM sessions")}
+            stored = {issue_set_id for (issue_set_id,) in connection.execute("SELECT DISTINCT issue_set_id FROM issue_files")}
+            for issue_set_id in stored - used - set(keep):
+                connection.execute("DELETE FROM issue_rows WHERE issue_set_id = ?", (issue_set_id,))
+                connection.execute("DELETE FROM issue_files WHERE issue_set_id = ?", (issue_set_id,))
+
+    ### Uploaded issue sets ###
+
+    def save_issue_set(self, session_id, state, csv_lines, issue_index):
+        # Store a parsed CSV and its index under a hash of its content (identical uploads share one copy) and point the
+        # session's state to it in the same transaction, so `purge_expired` never sees the issue set without its reference
+        issue_set_id = hashlib.sha256(json.dumps(csv_lines, sort_keys=True).encode('utf-8')).hexdigest()
+        state['issue_set_id'] = issue_set_id
+        with closing(self.connect()) as connection, connection:
+            # Writing the session first takes the write lock, so a purge cannot delete the copy found below
+            connection.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, state, updated_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(state), time.time()))
+            exists = connection.execute(
+                "SELECT 1 FROM issue_files WHERE issue_set_id = ? LIMIT 1", (issue_set_id,)).fetchone()
+            if not exists:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO issue_rows (issue_set_id, row_index, group_end, data) VALUES (?, ?, ?, ?)",
+                    ((issue_set_id, index, issue_index['group_end'][index], json.dumps(line))
+                     for index, line in enumerate(csv_lines)))
+                connection.executemany(
+                    "INSERT OR REPLACE INTO issue_files (issue_set_id, file_name, first_row) VALUES (?, ?, ?)",
+                    ((issue_set_id, file_name or '', first_row) for file_name, first_row in issue_index['first_row'].items()))
+        return issue_set_id
+
+    def get_issue_row(self, issue_set_id, row_index):
+        # Return one CSV line, or None past the end of the issue set
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT data FROM issue_rows WHERE issue_set_id = ? AND row_index = ?",
+                (issue_set_id, row_index)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_issue_rows(self, issue_set_id):
+        # Return every CSV line of the issue set, in order
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT data FROM issue_rows WHERE issue_set_id = ? ORDER BY row_index", (issue_set_id,)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get_issue_group(self, issue_set_id, row_index):
+        # Return the CSV line at `row_index` followed by the adjacent lines of the same file
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT data FROM issue_rows WHERE issue_set_id = ? AND row_index >= ? AND row_index < "
+                "(SELECT group_end FROM issue_rows WHERE issue_set_id = ? AND row_index = ?) ORDER BY row_index",
+                (issue_set_id, row_index, issue_set_id, row_index)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def get_first_row(self, issue_set_id, file_name):
+        with closing(self.connect()) as connection:
+            row = connection.execute(
+                "SELECT first_row FROM issue_files WHERE issue_set_id = ? AND file_name = ?",
+                (issue_set_id, file_name)).fetchone()
+        return row[0] if row else None
+
+    def get_files(self, issue_set_id):
+        # Sorted list of the files in the issue set, for the file selection dropdowns
+        with closing(self.connect()) as connection:
+            rows = connection.execute(
+                "SELECT file_name FROM issue_files WHERE issue_set_id = ? ORDER BY file_name", (issue_set_id,))
+            return [file_name for (file_name,) in rows]
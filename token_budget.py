@@ -0,0 +1,122 @@
+try:
+    import tiktoken  # Optional: exact token counts; a character-based estimate is used without it
+except ImportError:
+    tiktoken = None
+
+# Token budgeting for revision prompts.
+# Prompts are measured offline, the first model whose context window fits the prompt (and the revised file it
+# will echo back) is picked, and files that fit no model are split into chunks that do.
+
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-3.5-turbo': 16385,
+    'gpt-3.5-turbo-1106': 16385,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 128000,
+    'gpt-4o': 128000,
+    'gpt-4o-mini': 128000,
+}
+MODEL_OUTPUT_LIMITS = {
+    'gpt-3.5-turbo': 4096,
+    'gpt-3.5-turbo-1106': 4096,
+    'gpt-4': 8192,
+    'gpt-4-turbo': 4096,
+    'gpt-4o': 16384,
+    'gpt-4o-mini': 16384,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+SAFETY_MARGIN = 0.9  # Keep 10% headroom for tokenizer differences and formatting changes in the output
+
+_encodings = {}
+
+def get_encoding(model):
+    # Return (and remember) the tiktoken encoding of a model, or None when tiktoken is not installed
+    if tiktoken is None:
+        return None
+    if model not in _encodings:
+        try:
+            _encodings[model] = tiktoken.encoding_for_model(model)
+        except KeyError:
+            _encodings[model] = tiktoken.get_encoding('cl100k_base')
+    return _encodings[model]
+
+def count_tokens(text, model):
+    encoding = get_encoding(model)
+    if encoding is None:
+        return len(text) // 4 + 1  # About 4 characters per token for English text and code
+    return len(encoding.encode(text, disallowed_special=()))
+
+def count_message_tokens(messages, model):
+    # Every chat message costs a few tokens of framing on top of its content
+    return sum(count_tokens(message['content'], model) + 4 for message in messages) + 3
+
+def code_token_budget(model, overhead_tokens):
+    # The largest file (in tokens) that can be sent to `model`, given the tokens used by everything else in the prompt.
+    # The revised file comes back in full, so it has to fit both the output limit and the rest of the context window.
+    context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    output_limit = MODEL_OUTPUT_LIMITS.get(model, context_window)
+    return max(0, int(min(output_limit, (context_window - overhead_tokens) / 2) * SAFETY_MARGIN))
+
+def pick_model(messages, code, models):
+    # Return the first model (in order of preference) whose budget fits the prompt, or None
+    code_tokens = count_tokens(code, models[0])
+    overhead_tokens = count_message_tokens(messages, models[0]) - code_tokens
+    for model in models:
+        if code_tokens <= code_token_budget(model, overhead_tokens):
+            return model
+    return None
+
+def parse_line_number(bug_line):
+    try:
+        return int(bug_line)
+    except (TypeError, ValueError):
+        return None
+
+def plan_revision(code, bug_details, build_messages, models):
+    # Return a list of (model, first line, code, bug details, messages) requests that together revise the whole file.
+    # `bug_details` is a list of (line, message) pairs and `build_messages(code, bug_details)` builds the chat messages.
+    # Chunks without any issue get `None` messages: they do not need to be sent and are kept as they are.
+
+    # Step 1: Send the whole file to the first model that fits
+    messages = build_messages(code, bug_details)
+    model = pick_model(messages, code, models)
+    if model is not None:
+        return [(model, 1, code, bug_details, messages)]
+
+    # Step 2: Otherwise split the file into chunks that fit the model with the largest budget
+    overhead_tokens = count_message_tokens(messages, models[0]) - count_tokens(code, models[0])
+    model = max(models, key=lambda candidate: code_token_budget(candidate, overhead_tokens))
+    budget = code_token_budget(model, overhead_tokens)
+
+    chunks = []
+    chunk_start, chunk_lines, chunk_tokens = 1, [], 0
+    for line_number, line in enumerate(code.splitlines(keepends=True), start=1):
+        line_tokens = count_tokens(line, model)
+        if chunk_lines and chunk_tokens + line_tokens > budget:
+            chunks.append((chunk_start, chunk_lines))
+            chunk_start, chunk_lines, chunk_tokens = line_number, [], 0
+        chunk_lines.append(line)
+        chunk_tokens += line_tokens
+    if chunk_lines:
+        chunks.append((chunk_start, chunk_lines))
+
+    # Step 3: Give each chunk the issues on its lines (renumbered from the start of the chunk);
+    # issues without a line number go with the first chunk
+    requests = []
+    for index, (chunk_start, chunk_lines) in enumerate(chunks):
+        chunk_end = chunk_start + len(chunk_lines) - 1
+        chunk_bugs = []
+        for bug_line, bug_message in bug_details:
+            line_number = parse_line_number(bug_line)
+            if line_number is None:
+                if index == 0:
+                    chunk_bugs.append((bug_line, bug_message))
+            elif chunk_start <= line_number <= chunk_end:
+                chunk_bugs.append((line_number - chunk_start + 1, bug_message))
+        chunk_code = ''.join(chunk_lines)
+        chunk_messages = build_messages(chunk_code, chunk_bugs) if chunk_bugs else None
+        requests.append((model, chunk_start, chunk_code, chunk_bugs, chunk_messages))
+    return requests
+
+def reassemble_chunks(outputs):
+    # Join the revised chunks back into one file, in order
+    return ''.join(output if output.endswith('\n') else output + '\n' for output in outputs[:-1]) + outputs[-1]